@@ -0,0 +1,50 @@
+from django.utils.translation import gettext_lazy as _
+from dj_rest_auth.jwt_auth import JWTCookieAuthentication
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import get_local_user, load_user
+
+
+class CachedUserMixin:
+    """
+    Resolve the token's user from accounts.cache instead of a query per
+    request; otherwise the same checks as JWTAuthentication.get_user.
+    Unsafe methods load the row from the database, so views that save
+    request.user never write back a stale copy.
+    """
+    load_fresh_user = False
+
+    def authenticate(self, request):
+        self.load_fresh_user = request.method not in SAFE_METHODS
+        return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        user = load_user(user_id) if self.load_fresh_user else get_local_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
+
+
+class CachedJWTAuthentication(CachedUserMixin, JWTAuthentication):
+    pass
+
+
+class CachedJWTCookieAuthentication(CachedUserMixin, JWTCookieAuthentication):
+    pass
@@ -0,0 +1,99 @@
+"""
+Cached User rows for hot authentication paths: every JWT-authenticated API
+request and the WebSocket reconnect storm after a deploy.
+
+Two layers:
+  - a bounded per-process LRU (USER_LOCAL_CACHE_SIZE entries, at most
+    USER_LOCAL_CACHE_TTL seconds old), which needs no round trip at all;
+  - the shared Django cache (USER_CACHE_TTL), then the database.
+
+Saving or deleting a user (see accounts.signals) drops both layers and bumps
+that user's shared version. Other processes compare an entry against its
+user's version at most every USER_VERSION_CHECK_INTERVAL seconds, so role,
+permission and active-flag changes reach every worker within about a second,
+and one user's change (or login) leaves everyone else's entries alone. That only
+holds when every process shares the Django cache, so both layers are skipped
+unless USER_CACHE is on (see the accounts.E001 check).
+
+Cached users are for reading. Requests that write start from load_user()
+instead (see accounts.authentication), because saving a cached copy could
+undo a concurrent change to the row.
+"""
+import copy
+import threading
+import time
+
+from cachetools import TTLCache
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+
+USER_KEY = "accounts:user:{user_id}"
+VERSION_KEY = "accounts:user:{user_id}:version"
+
+_local = TTLCache(maxsize=settings.USER_LOCAL_CACHE_SIZE, ttl=settings.USER_LOCAL_CACHE_TTL)
+_lock = threading.Lock()
+
+
+def load_user(user_id):
+    """The User with `user_id` straight from the database, or None."""
+    return get_user_model().objects.filter(id=user_id).first()
+
+
+def get_user(user_id):
+    """The User with `user_id`, or None if there is none."""
+    if not settings.USER_CACHE:
+        return load_user(user_id)
+    key = USER_KEY.format(user_id=user_id)
+    user = cache.get(key)
+    if user is None:
+        user = load_user(user_id)
+        if user is None:
+            return None
+        cache.set(key, user, settings.USER_CACHE_TTL)
+    return user
+
+
+def _current_version(user_id):
+    key = VERSION_KEY.format(user_id=user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, None)
+        version = cache.get(key, 1)
+    return version
+
+
+def get_local_user(user_id):
+    """get_user() behind the per-process LRU; returns a copy the caller may modify."""
+    if not settings.USER_CACHE:
+        return load_user(user_id)
+    now = time.monotonic()
+    with _lock:
+        # token claims carry the id as a string, signals as an int
+        entry = _local.get(str(user_id))
+    if entry is not None and now - entry[1] < settings.USER_VERSION_CHECK_INTERVAL:
+        return copy.copy(entry[2])
+
+    version = _current_version(user_id)
+    if entry is not None and entry[0] == version:
+        user = entry[2]
+    else:
+        user = get_user(user_id)
+        if user is None:
+            return None
+    with _lock:
+        _local[str(user_id)] = (version, now, user)
+    return copy.copy(user)
+
+
+def invalidate(user_id):
+    cache.delete(USER_KEY.format(user_id=user_id))
+    # this process sees its own change right away
+    with _lock:
+        _local.pop(str(user_id), None)
+    key = VERSION_KEY.format(user_id=user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, None)
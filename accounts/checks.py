@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """The user cache relies on a version every process can see."""
+    if settings.USER_CACHE and not settings.CACHE_IS_SHARED:
+        return [
+            Error(
+                "USER_CACHE needs a cache shared by every process.",
+                hint="Set CACHE_BACKEND to Redis or Memcached, or turn USER_CACHE off.",
+                obj="USER_CACHE",
+                id="accounts.E001",
+            )
+        ]
+    return []
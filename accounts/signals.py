@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import cache
+
+
+@receiver([post_save, post_delete], sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user(sender, instance, update_fields=None, **kwargs):
+    # logins (SIMPLE_JWT UPDATE_LAST_LOGIN) change nothing the cached copy is used for
+    if update_fields == frozenset({"last_login"}):
+        return
+    cache.invalidate(instance.pk)
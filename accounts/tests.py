@@ -1,7 +1,16 @@
-from django.test import TestCase
-from rest_framework.test import APIClient
+from unittest import mock
+
+from django.contrib.auth.models import update_last_login
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.tokens import AccessToken
 from django.urls import reverse
 
+from . import cache as user_cache
+from .checks import check_shared_cache
+from .authentication import CachedJWTAuthentication
 from .models import User
 from .serializers import AdminUserSerializer
 
@@ -123,3 +132,82 @@ class AdminUserAPITest(TestCase):
 		self.assertIn(resp.status_code, (401, 403))
 		self.assertFalse(User.objects.filter(email__iexact=payload['email']).exists())
 
+
+@override_settings(USER_CACHE=True)
+class CachedJWTAuthenticationTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.user = User.objects.create_user(email='agent@test.com', name='Agent', role='agent')
+		self.request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+	def _authenticate(self):
+		user, _ = CachedJWTAuthentication().authenticate(self.request)
+		return user
+
+	def test_repeat_requests_skip_the_database(self):
+		self.assertEqual(self._authenticate(), self.user)
+		with self.assertNumQueries(0):
+			user = self._authenticate()
+		self.assertEqual(user.role, 'agent')
+		# callers get their own copy
+		user.role = 'admin'
+		self.assertEqual(self._authenticate().role, 'agent')
+
+	def test_saving_the_user_takes_effect_immediately(self):
+		self._authenticate()
+		self.user.role = 'manager'
+		self.user.save()
+		self.assertEqual(self._authenticate().role, 'manager')
+
+		self.user.is_active = False
+		self.user.save()
+		with self.assertRaises(AuthenticationFailed):
+			self._authenticate()
+
+	def test_changes_from_other_processes_apply_after_the_version_check(self):
+		self._authenticate()
+		# another worker saves the user: shared cache entry dropped, version bumped
+		User.objects.filter(id=self.user.id).update(permission='full_access')
+		cache.delete(user_cache.USER_KEY.format(user_id=self.user.id))
+		cache.incr(user_cache.VERSION_KEY.format(user_id=self.user.id))
+		self.assertEqual(self._authenticate().permission, 'only_view')
+
+		now = user_cache.time.monotonic()
+		with mock.patch.object(user_cache.time, 'monotonic', return_value=now + 2):
+			self.assertEqual(self._authenticate().permission, 'full_access')
+
+	def test_logins_and_other_users_keep_cached_entries(self):
+		other = User.objects.create_user(email='other@test.com', name='Other')
+		self._authenticate()
+		version = cache.get(user_cache.VERSION_KEY.format(user_id=self.user.id))
+		update_last_login(None, self.user)
+		other.name = 'Renamed'
+		other.save()
+		self.assertEqual(cache.get(user_cache.VERSION_KEY.format(user_id=self.user.id)), version)
+		now = user_cache.time.monotonic()
+		with mock.patch.object(user_cache.time, 'monotonic', return_value=now + 2), self.assertNumQueries(0):
+			self._authenticate()
+
+	def test_writes_start_from_the_database_row(self):
+		self._authenticate()
+		# an admin demotes the user in another process; this one still has the cached copy
+		User.objects.filter(id=self.user.id).update(role='customer')
+		self.assertEqual(self._authenticate().role, 'agent')
+
+		client = APIClient()
+		client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+		resp = client.patch('/api/auth/user/update/', {'name': 'Renamed'}, format='json')
+		self.assertEqual(resp.status_code, 200, resp.content)
+		self.user.refresh_from_db()
+		self.assertEqual((self.user.name, self.user.role), ('Renamed', 'customer'))
+
+	@override_settings(USER_CACHE=False)
+	def test_without_a_shared_cache_users_are_read_from_the_database(self):
+		self._authenticate()
+		User.objects.filter(id=self.user.id).update(is_active=False)
+		with self.assertRaises(AuthenticationFailed):
+			self._authenticate()
+
+	@override_settings(USER_CACHE=True, CACHE_IS_SHARED=False)
+	def test_user_cache_requires_a_shared_cache(self):
+		self.assertEqual([e.id for e in check_shared_cache(None)], ['accounts.E001'])
@@ -82,4 +82,5 @@ class UserUpdateView(generics.UpdateAPIView):
     permission_classes = [IsAuthenticated]
 
     def get_object(self):
+        # loaded from the database for PUT/PATCH, not the cached copy (accounts.authentication)
         return self.request.user
\ No newline at end of file
@@ -0,0 +1,20 @@
+from django.contrib.auth import get_user_model
+
+from jobs.registry import job
+from mailer.outbox import queue_many
+from .models import Announcement
+
+User = get_user_model()
+
+
+@job(concurrency=1)
+def email_announcement(announcement_id, exclude_id=None):
+    """Queue the announcement email for every active customer (ANNOUNCEMENT_EMAILS)."""
+    announcement = Announcement.objects.get(id=announcement_id)
+    customers = User.objects.filter(role="customer", is_active=True).exclude(email="")
+    if exclude_id is not None:
+        customers = customers.exclude(id=exclude_id)
+    queue_many(
+        ((email, announcement.title, announcement.description) for email in customers.values_list("email", flat=True).iterator()),
+        kind="announcement",
+    )
@@ -4,6 +4,9 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser
 
+from django.conf import settings
+
+from .jobs import email_announcement
 from .models import Announcement, FileUpload
 from .serializers import AnnouncementSerializer
 from accounts.permissions import IsAdminOrManager
@@ -37,4 +40,6 @@ class AnnouncementListCreateAPIView(APIView):
 
         out_serializer = AnnouncementSerializer(announcement)
         create_notification_for_customers(request.user,title="New Announcement", data=out_serializer.data)
+        if settings.ANNOUNCEMENT_EMAILS:
+            email_announcement.enqueue(announcement.id, exclude_id=request.user.id)
         return Response(out_serializer.data, status=status.HTTP_201_CREATED)
@@ -27,6 +27,9 @@ DEBUG = config('DEBUG', default=False, cast=bool)
 
 ALLOWED_HOSTS = config('ALLOWED_HOSTS', cast=Csv())
 
+# e.g. "jobs.W001" once run_jobs workers are deployed
+SILENCED_SYSTEM_CHECKS = config('SILENCED_SYSTEM_CHECKS', default='', cast=Csv())
+
 SITE_URL = config("SITE_URL", default="http://localhost:8000")
 SITE_ID = 1
 # Application definition
@@ -72,6 +75,8 @@ INSTALLED_APPS = [
     'announcements',
     'resources',
     'activityLog',
+    'jobs',
+    'mailer',
 ]
 
 AUTH_USER_MODEL = 'accounts.User'
@@ -126,6 +131,49 @@ DATABASES = {
     }
 }
 
+# =====================
+# Cache
+# =====================
+# Point CACHE_BACKEND at django.core.cache.backends.redis.RedisCache (with
+# CACHE_LOCATION=redis://127.0.0.1:6379/1) so every worker shares one cache.
+CACHES = {
+    "default": {
+        "BACKEND": config("CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": config("CACHE_LOCATION", default=""),
+    }
+}
+# State that other processes must see (e.g. notification counters updated by
+# the job workers) is only kept in the cache when every process shares it.
+CACHE_IS_SHARED = CACHES["default"]["BACKEND"] not in (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+# Cache analytics summaries. Flushes in any process invalidate them, so this
+# needs a shared CACHE_BACKEND; otherwise every summary is computed per request.
+ANALYTICS_CACHE = config("ANALYTICS_CACHE", default=CACHE_IS_SHARED, cast=bool)
+# Analytics summaries for ranges that include today are cached this many seconds;
+# closed historical ranges are cached until their counters change (at most a day).
+ANALYTICS_CACHE_TTL = config("ANALYTICS_CACHE_TTL", default=60, cast=int)
+
+# Append-only analytics event log (villas.eventlog): one memory-mapped
+# segment file per process, replayed with `manage.py replay_analytics_events`.
+ANALYTICS_EVENTLOG_ENABLED = config("ANALYTICS_EVENTLOG_ENABLED", default=True, cast=bool)
+ANALYTICS_EVENTLOG_DIR = config("ANALYTICS_EVENTLOG_DIR", default=str(BASE_DIR / "var" / "eventlog"))
+ANALYTICS_EVENTLOG_SEGMENT_SIZE = config("ANALYTICS_EVENTLOG_SEGMENT_SIZE", default=16 * 1024 * 1024, cast=int)
+# `manage.py prune_analytics_events` (run it from cron) deletes segments whose
+# newest event is older than this. Replays can only rebuild the retained days.
+ANALYTICS_EVENTLOG_RETENTION_DAYS = config("ANALYTICS_EVENTLOG_RETENTION_DAYS", default=30, cast=int)
+
+# Trending properties: popularity halves every POPULARITY_HALF_LIFE_DAYS
+POPULARITY_HALF_LIFE_DAYS = config("POPULARITY_HALF_LIFE_DAYS", default=7, cast=float)
+
+# Beacon events are buffered in memory and flushed every ANALYTICS_BUFFER_INTERVAL
+# seconds or once ANALYTICS_BUFFER_MAX_EVENTS are pending
+ANALYTICS_BUFFER_INTERVAL = config("ANALYTICS_BUFFER_INTERVAL", default=5.0, cast=float)
+ANALYTICS_BUFFER_MAX_EVENTS = config("ANALYTICS_BUFFER_MAX_EVENTS", default=10000, cast=int)
+ANALYTICS_BEACON_MAX_EVENTS = config("ANALYTICS_BEACON_MAX_EVENTS", default=500, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -178,8 +226,9 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-        'dj_rest_auth.jwt_auth.JWTCookieAuthentication',
+        # JWTAuthentication / JWTCookieAuthentication with users from accounts.cache
+        'accounts.authentication.CachedJWTAuthentication',
+        'accounts.authentication.CachedJWTCookieAuthentication',
     ],
     # 'DEFAULT_PERMISSION_CLASSES': [
     #     'rest_framework.permissions.IsAuthenticated',
@@ -194,6 +243,9 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend', 'rest_framework.filters.SearchFilter', 'rest_framework.filters.OrderingFilter'],
+    'DEFAULT_THROTTLE_RATES': {
+        'beacon': config('ANALYTICS_BEACON_RATE', default='120/min'),
+    },
 }
 
 # Simple JWT Configuration
@@ -215,6 +267,17 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 }
 
+# Users looked up for JWT and WebSocket authentication are cached this long (seconds)
+# in the shared cache, and in a per-process LRU of USER_LOCAL_CACHE_SIZE entries.
+# Saving a user bumps that user's version, which every process re-reads each USER_VERSION_CHECK_INTERVAL.
+# That version has to be shared, so USER_CACHE (the whole cache) needs a shared
+# CACHE_BACKEND; without one every request reads the user from the database.
+USER_CACHE = config('USER_CACHE', default=CACHE_IS_SHARED, cast=bool)
+USER_CACHE_TTL = config('USER_CACHE_TTL', default=60, cast=int)
+USER_LOCAL_CACHE_SIZE = config('USER_LOCAL_CACHE_SIZE', default=10000, cast=int)
+USER_LOCAL_CACHE_TTL = config('USER_LOCAL_CACHE_TTL', default=30, cast=int)
+USER_VERSION_CHECK_INTERVAL = config('USER_VERSION_CHECK_INTERVAL', default=1.0, cast=float)
+
 
 
 REST_USE_JWT = True
@@ -295,10 +358,24 @@ EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='noreply@campaignai.com')
 
+# Email outbox (mailer app): queued mail is sent in batches over one connection,
+# at most EMAIL_RATE_LIMIT messages per second, with retries doubling from EMAIL_RETRY_BACKOFF
+EMAIL_OUTBOX_DELAY = config('EMAIL_OUTBOX_DELAY', default=5, cast=int)
+EMAIL_BATCH_SIZE = config('EMAIL_BATCH_SIZE', default=100, cast=int)
+EMAIL_RATE_LIMIT = config('EMAIL_RATE_LIMIT', default=10, cast=float)
+EMAIL_MAX_ATTEMPTS = config('EMAIL_MAX_ATTEMPTS', default=5, cast=int)
+EMAIL_RETRY_BACKOFF = config('EMAIL_RETRY_BACKOFF', default=60, cast=int)
+# Also email new announcements to every customer
+ANNOUNCEMENT_EMAILS = config('ANNOUNCEMENT_EMAILS', default=False, cast=bool)
+
 
 
 
 # Channels Configuration
+# Test runs keep the event log out of ANALYTICS_EVENTLOG_DIR and use an
+# in-memory channel layer (see eastmondvilla.test_runner)
+TEST_RUNNER = "eastmondvilla.test_runner.TestRunner"
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels_redis.core.RedisChannelLayer",
@@ -308,6 +385,43 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Live dashboard deltas are broadcast at most once per interval (seconds)
+DASHBOARD_PUSH_INTERVAL = config('DASHBOARD_PUSH_INTERVAL', default=1.0, cast=float)
+
+# Background jobs (see jobs.registry): "database" needs `manage.py run_jobs`
+# workers, "thread" runs them in-process, "immediate" right after commit.
+# Deploy at least one worker next to the web processes with the database
+# backend, or notifications, emails and announcements are never sent; the
+# jobs.W001 check warns until it is silenced (SILENCED_SYSTEM_CHECKS=jobs.W001)
+JOBS_BACKEND = config('JOBS_BACKEND', default='database')
+JOBS_THREAD_WORKERS = config('JOBS_THREAD_WORKERS', default=4, cast=int)
+JOBS_LOCK_TIMEOUT = config('JOBS_LOCK_TIMEOUT', default=600, cast=int)
+JOBS_KEEP_FINISHED_DAYS = config('JOBS_KEEP_FINISHED_DAYS', default=7, cast=int)
+
+# Keep unseen-notification counters in the cache. Workers update them, so this
+# needs a shared CACHE_BACKEND; otherwise every count is read from the database.
+NOTIFICATION_COUNTER_CACHE = config('NOTIFICATION_COUNTER_CACHE', default=CACHE_IS_SHARED, cast=bool)
+# Cached unseen-notification counters are recounted at least this often (seconds)
+NOTIFICATION_COUNTER_TTL = config('NOTIFICATION_COUNTER_TTL', default=86400, cast=int)
+
+# Track open notification sockets and push only to online users. Needs a cache
+# shared by daphne and the job workers (CACHE_BACKEND Redis/Memcached).
+NOTIFICATION_PRESENCE = config('NOTIFICATION_PRESENCE', default=False, cast=bool)
+PRESENCE_TTL = config('PRESENCE_TTL', default=90, cast=int)
+PRESENCE_HEARTBEAT = config('PRESENCE_HEARTBEAT', default=30, cast=int)
+
+# Seconds between keepalive comments on /api/notifications/stream/ (SSE)
+NOTIFICATION_STREAM_KEEPALIVE = config('NOTIFICATION_STREAM_KEEPALIVE', default=25, cast=int)
+
+# Bursts of the same notification within this many seconds are sent as one
+# (notifications.coalescing.COALESCE_RULES); 0 sends every event right away
+NOTIFICATION_COALESCE_WINDOW = config('NOTIFICATION_COALESCE_WINDOW', default=60, cast=int)
+
+# Read notifications and all broadcasts are purged after NOTIFICATION_RETENTION_DAYS (manage.py purge_notifications);
+# set NOTIFICATION_ARCHIVE_DIR to keep purged rows as gzip NDJSON
+NOTIFICATION_RETENTION_DAYS = config('NOTIFICATION_RETENTION_DAYS', default=90, cast=int)
+NOTIFICATION_ARCHIVE_DIR = config('NOTIFICATION_ARCHIVE_DIR', default=None)
+
 
 
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
\ No newline at end of file
@@ -0,0 +1,37 @@
+import tempfile
+
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """
+    DiscoverRunner that isolates the whole run from local services:
+
+    - the analytics event log is off and points at a throwaway directory, so
+      tests never leave segment files in the real ANALYTICS_EVENTLOG_DIR;
+    - the channel layer is in-memory, so pushes scheduled by signals (e.g.
+      villas.live timers that fire after a test has finished) never try to
+      reach Redis;
+    - jobs run immediately on commit, so tests see their effects without a
+      worker.
+
+    Tests that exercise the event log or another jobs backend override those
+    settings themselves.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._eventlog_dir = tempfile.TemporaryDirectory()
+        self._test_settings = override_settings(
+            ANALYTICS_EVENTLOG_ENABLED=False,
+            ANALYTICS_EVENTLOG_DIR=self._eventlog_dir.name,
+            CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+            JOBS_BACKEND="immediate",
+        )
+        self._test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._test_settings.disable()
+        self._eventlog_dir.cleanup()
+        super().teardown_test_environment(**kwargs)
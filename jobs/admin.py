@@ -0,0 +1,21 @@
+from django.contrib import admin
+from django.utils import timezone
+from unfold.admin import ModelAdmin
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'max_attempts', 'run_at', 'created_at', 'finished_at', 'locked_by')
+    list_filter = ('status', 'name')
+    search_fields = ('name', 'last_error')
+    readonly_fields = ('created_at', 'finished_at', 'locked_at', 'locked_by', 'last_error')
+    actions = ['retry_jobs']
+
+    @admin.action(description='Retry selected jobs now')
+    def retry_jobs(self, request, queryset):
+        updated = queryset.exclude(status=Job.Status.RUNNING).update(
+            status=Job.Status.QUEUED, run_at=timezone.now(), attempts=0, locked_by='', locked_at=None,
+        )
+        self.message_user(request, f'{updated} jobs queued again.')
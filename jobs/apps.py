@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class JobsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'jobs'
+    verbose_name = 'Background jobs'
+
+    def ready(self):
+        from . import checks  # noqa: F401
+
+        # job types are declared in <app>/jobs.py modules
+        autodiscover_modules('jobs')
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+@register()
+def check_worker_backend(app_configs, **kwargs):
+    """With the database backend nothing runs unless a worker process is deployed."""
+    if settings.JOBS_BACKEND != "database":
+        return []
+    return [
+        Warning(
+            "JOBS_BACKEND is 'database': queued jobs only run while `manage.py run_jobs` workers are up.",
+            hint=(
+                "Run at least one `manage.py run_jobs` process next to the web processes, or set "
+                "JOBS_BACKEND=thread for a single process. Silence jobs.W001 once workers are deployed."
+            ),
+            id="jobs.W001",
+        )
+    ]
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Min
+
+from jobs.models import Job
+from jobs.registry import REGISTRY
+
+
+class Command(BaseCommand):
+    help = 'Show registered job types and queued/running/failed job counts'
+
+    def handle(self, *args, **options):
+        counts = {}
+        for row in Job.objects.order_by().values('name', 'status').annotate(n=Count('id'), oldest=Min('created_at')):
+            counts.setdefault(row['name'], {})[row['status']] = (row['n'], row['oldest'])
+
+        for name in sorted(set(REGISTRY) | set(counts)):
+            job_type = REGISTRY.get(name)
+            limits = (
+                f"concurrency={job_type.concurrency or '-'} attempts={job_type.max_attempts} backoff={job_type.backoff}s"
+                if job_type else 'not registered'
+            )
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name}  ({limits})'))
+            for status in Job.Status.values:
+                n, oldest = counts.get(name, {}).get(status, (0, None))
+                if n:
+                    self.stdout.write(f'  {status:<8} {n:>6}  oldest {oldest:%Y-%m-%d %H:%M:%S}')
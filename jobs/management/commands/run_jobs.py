@@ -0,0 +1,34 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from jobs import runner
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (JOBS_BACKEND = "database"). Stops cleanly on SIGINT/SIGTERM.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once no job is due instead of polling'
+        )
+        parser.add_argument(
+            '--poll',
+            type=float,
+            default=1.0,
+            help='Seconds to wait between polls of an empty queue (default: 1)'
+        )
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *_: stop.set())
+
+        worker = runner.worker_name()
+        self.stdout.write(self.style.WARNING(f'Worker {worker} waiting for jobs...'))
+        processed = runner.work(worker, once=options['once'], poll=options['poll'], stop=stop)
+        self.stdout.write(self.style.SUCCESS(f'✓ Ran {processed} jobs'))
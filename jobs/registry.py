@@ -0,0 +1,107 @@
+"""
+Background jobs without an external broker.
+
+Declare job types in an app's `jobs.py`:
+
+    @job(concurrency=2, max_attempts=5)
+    def push_broadcast(broadcast_id):
+        ...
+
+and queue calls with `push_broadcast.enqueue(broadcast.id)`, or
+`push_broadcast.enqueue_in(60, broadcast.id)` to run no earlier than a minute
+from now. Arguments must be JSON-serializable. Nothing runs before the surrounding transaction
+commits, and nothing runs at all if it rolls back.
+
+JOBS_BACKEND picks where jobs run:
+  database   rows in jobs.Job, executed by `manage.py run_jobs` workers
+  thread     an in-process thread pool (development)
+  immediate  inline right after commit, ignoring delays (tests)
+"""
+import threading
+from dataclasses import dataclass
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+
+
+@dataclass(frozen=True)
+class JobType:
+    name: str
+    func: object
+    max_attempts: int = 3
+    concurrency: int = None
+    backoff: int = 30
+
+    def retry_delay(self, attempts):
+        """Seconds to wait before attempt `attempts + 1`: backoff, doubling each time."""
+        return self.backoff * 2 ** (attempts - 1)
+
+
+REGISTRY = {}
+
+
+def job(func=None, *, name=None, max_attempts=3, concurrency=None, backoff=30):
+    """
+    Register `func` as a job type. `concurrency` caps how many run at once,
+    `backoff` is the first retry delay in seconds (doubled per attempt).
+    """
+    def register(func):
+        job_type = JobType(
+            name=name or f"{func.__module__}.{func.__name__}",
+            func=func,
+            max_attempts=max_attempts,
+            concurrency=concurrency,
+            backoff=backoff,
+        )
+        REGISTRY[job_type.name] = job_type
+        func.job_type = job_type
+        func.enqueue = partial(enqueue, job_type.name)
+        func.enqueue_in = partial(enqueue_in, job_type.name)
+        return func
+
+    return register(func) if func is not None else register
+
+
+def get_job_type(name):
+    try:
+        return REGISTRY[name]
+    except KeyError:
+        raise LookupError(f"Unknown job type {name!r}")
+
+
+def enqueue(name, *args, **kwargs):
+    """Queue a call of job type `name`; see the module docstring."""
+    return enqueue_in(name, 0, *args, **kwargs)
+
+
+def enqueue_in(name, delay, *args, **kwargs):
+    """Queue a call of job type `name` to run `delay` seconds from now."""
+    from . import runner
+    from .models import Job
+
+    job_type = get_job_type(name)
+    backend = settings.JOBS_BACKEND
+    if backend == "database":
+        # written in the caller's transaction: workers only see it once it commits
+        return Job.objects.create(
+            name=name, args=list(args), kwargs=kwargs, max_attempts=job_type.max_attempts,
+            run_at=timezone.now() + timedelta(seconds=delay),
+        )
+    if backend == "thread":
+        if delay:
+            def submit_later():
+                timer = threading.Timer(delay, runner.submit, (job_type, args, kwargs))
+                timer.daemon = True
+                timer.start()
+            transaction.on_commit(submit_later)
+        else:
+            transaction.on_commit(lambda: runner.submit(job_type, args, kwargs))
+    elif backend == "immediate":
+        transaction.on_commit(lambda: runner.run_inline(job_type, args, kwargs))
+    else:
+        raise ImproperlyConfigured(f"Unknown JOBS_BACKEND {backend!r}")
+    return None
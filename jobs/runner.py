@@ -0,0 +1,180 @@
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import Job
+from .registry import REGISTRY, get_job_type
+
+
+logger = logging.getLogger(__name__)
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# --- database backend ---
+
+def claim(worker):
+    """
+    Lock the next due job for `worker` and return it, or None. Job types at
+    their concurrency limit are skipped. Claiming is a conditional UPDATE, so
+    two workers never run the same job; the concurrency limit is checked
+    just before claiming and is therefore approximate across workers.
+    """
+    running = dict(
+        Job.objects.filter(status=Job.Status.RUNNING)
+        .order_by().values_list("name").annotate(n=Count("id"))
+    )
+    full = [
+        name for name, n in running.items()
+        if name in REGISTRY and REGISTRY[name].concurrency and n >= REGISTRY[name].concurrency
+    ]
+    now = timezone.now()
+    due = (
+        Job.objects.filter(status=Job.Status.QUEUED, run_at__lte=now)
+        .exclude(name__in=full)
+        .order_by("run_at", "id")
+        .values_list("id", flat=True)[:20]
+    )
+    for job_id in due:
+        claimed = Job.objects.filter(id=job_id, status=Job.Status.QUEUED).update(
+            status=Job.Status.RUNNING, locked_by=worker, locked_at=now, attempts=F("attempts") + 1,
+        )
+        if claimed:
+            return Job.objects.get(id=job_id)
+    return None
+
+
+def execute(job):
+    """Run a claimed job and record the outcome; returns True on success."""
+    try:
+        job_type = get_job_type(job.name)
+        job_type.func(*job.args, **job.kwargs)
+    except Exception:
+        logger.exception("Job %s failed (attempt %s of %s)", job, job.attempts, job.max_attempts)
+        error = traceback.format_exc()
+        now = timezone.now()
+        if job.attempts < job.max_attempts and job.name in REGISTRY:
+            delay = REGISTRY[job.name].retry_delay(job.attempts)
+            Job.objects.filter(id=job.id).update(
+                status=Job.Status.QUEUED, run_at=now + timedelta(seconds=delay),
+                locked_by="", locked_at=None, last_error=error,
+            )
+        else:
+            Job.objects.filter(id=job.id).update(status=Job.Status.FAILED, finished_at=now, last_error=error)
+        return False
+
+    Job.objects.filter(id=job.id).update(status=Job.Status.DONE, finished_at=timezone.now())
+    return True
+
+
+def requeue_stale():
+    """
+    Put back jobs whose worker died mid-run (locked longer than
+    JOBS_LOCK_TIMEOUT). Jobs that have used all their attempts are failed
+    instead, so a job that kills its worker is not retried forever.
+    Returns the number of jobs requeued.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(status=Job.Status.RUNNING, locked_at__lt=now - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT))
+    stale.filter(attempts__gte=F("max_attempts")).update(
+        status=Job.Status.FAILED, finished_at=now, locked_by="", locked_at=None,
+        last_error="Worker stopped responding during the last attempt",
+    )
+    return stale.filter(attempts__lt=F("max_attempts")).update(
+        status=Job.Status.QUEUED, locked_by="", locked_at=None,
+    )
+
+
+def purge_finished():
+    """Delete finished jobs older than JOBS_KEEP_FINISHED_DAYS; failed ones are kept."""
+    cutoff = timezone.now() - timedelta(days=settings.JOBS_KEEP_FINISHED_DAYS)
+    deleted, _ = Job.objects.filter(status=Job.Status.DONE, finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def work(worker=None, once=False, poll=1.0, stop=None):
+    """
+    Run jobs until `stop` (a threading.Event) is set, or until the queue is
+    empty when `once` is set. Returns the number of jobs run.
+    """
+    worker = worker or worker_name()
+    stop = stop or threading.Event()
+    processed = 0
+    housekeeping = 0.0
+    while not stop.is_set():
+        if time.monotonic() - housekeeping > 60:
+            requeue_stale()
+            purge_finished()
+            housekeeping = time.monotonic()
+
+        job = claim(worker)
+        if job is None:
+            if once:
+                break
+            stop.wait(poll)
+            continue
+        execute(job)
+        processed += 1
+    return processed
+
+
+# --- thread and immediate backends ---
+
+_executor = None
+_executor_lock = threading.Lock()
+_limits = {}
+
+
+def _limit(job_type):
+    with _executor_lock:
+        if job_type.name not in _limits:
+            _limits[job_type.name] = threading.BoundedSemaphore(job_type.concurrency) if job_type.concurrency else None
+        return _limits[job_type.name]
+
+
+def submit(job_type, args, kwargs, attempt=1):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.JOBS_THREAD_WORKERS, thread_name_prefix="jobs")
+    _executor.submit(_run_attempt, job_type, args, kwargs, attempt)
+
+
+def _run_attempt(job_type, args, kwargs, attempt):
+    limit = _limit(job_type)
+    if limit:
+        limit.acquire()
+    try:
+        job_type.func(*args, **kwargs)
+        return
+    except Exception:
+        logger.exception("Job %s failed (attempt %s of %s)", job_type.name, attempt, job_type.max_attempts)
+    finally:
+        if limit:
+            limit.release()
+        # pool threads get their own database connection; don't leak it
+        connection.close()
+    if attempt < job_type.max_attempts:
+        # back off on a timer rather than holding a pool thread while waiting
+        timer = threading.Timer(job_type.retry_delay(attempt), submit, (job_type, args, kwargs, attempt + 1))
+        timer.daemon = True
+        timer.start()
+
+
+def run_inline(job_type, args, kwargs):
+    try:
+        job_type.func(*args, **kwargs)
+    except Exception:
+        logger.exception("Job %s failed", job_type.name)
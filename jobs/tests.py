@@ -0,0 +1,122 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from . import runner
+from .checks import check_worker_backend
+from .models import Job
+from .registry import get_job_type, job
+
+calls = []
+
+
+@job(name='tests.record', concurrency=1)
+def record(value):
+    calls.append(value)
+
+
+@job(name='tests.flaky', max_attempts=2, backoff=60)
+def flaky():
+    raise RuntimeError('boom')
+
+
+@override_settings(JOBS_BACKEND='database')
+class DatabaseJobTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_jobs_are_queued_with_the_transaction_and_run_by_workers(self):
+        with self.assertRaises(ValueError), transaction.atomic():
+            record.enqueue('rolled back')
+            raise ValueError
+        self.assertFalse(Job.objects.exists())
+
+        record.enqueue('a')
+        self.assertEqual(calls, [])
+        self.assertEqual(runner.work(once=True), 1)
+        self.assertEqual(calls, ['a'])
+        self.assertEqual(Job.objects.get().status, Job.Status.DONE)
+
+    def test_failures_are_retried_with_backoff(self):
+        flaky.enqueue()
+        runner.work(once=True)
+        failed = Job.objects.get()
+        self.assertEqual((failed.status, failed.attempts), (Job.Status.QUEUED, 1))
+        self.assertGreater(failed.run_at, timezone.now() + timedelta(seconds=50))
+        self.assertIn('RuntimeError: boom', failed.last_error)
+
+        # not due yet
+        self.assertEqual(runner.work(once=True), 0)
+        Job.objects.update(run_at=timezone.now())
+        runner.work(once=True)
+        self.assertEqual(Job.objects.get().status, Job.Status.FAILED)
+
+    def test_delayed_jobs_wait_for_their_time(self):
+        record.enqueue_in(60, 'later')
+        self.assertGreater(Job.objects.get().run_at, timezone.now() + timedelta(seconds=50))
+        self.assertEqual(runner.work(once=True), 0)
+        Job.objects.update(run_at=timezone.now())
+        self.assertEqual(runner.work(once=True), 1)
+        self.assertEqual(calls, ['later'])
+
+    def test_concurrency_limits_are_respected(self):
+        Job.objects.create(name='tests.record', args=['busy'], status=Job.Status.RUNNING, locked_at=timezone.now())
+        record.enqueue('waiting')
+        flaky.enqueue()
+        self.assertEqual(runner.claim('test').name, 'tests.flaky')
+        self.assertIsNone(runner.claim('test'))
+
+        # a worker that died mid-run releases its job after JOBS_LOCK_TIMEOUT
+        Job.objects.filter(args=['busy']).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(runner.requeue_stale(), 1)
+
+    def test_stale_jobs_out_of_attempts_are_failed(self):
+        locked_at = timezone.now() - timedelta(hours=1)
+        retry = Job.objects.create(name='tests.record', status=Job.Status.RUNNING, locked_at=locked_at, attempts=1)
+        lost = Job.objects.create(name='tests.record', status=Job.Status.RUNNING, locked_at=locked_at, attempts=3)
+
+        self.assertEqual(runner.requeue_stale(), 1)
+        retry.refresh_from_db()
+        lost.refresh_from_db()
+        self.assertEqual(retry.status, Job.Status.QUEUED)
+        self.assertEqual(lost.status, Job.Status.FAILED)
+        self.assertTrue(lost.last_error)
+
+
+@override_settings(JOBS_BACKEND='immediate')
+class ImmediateJobTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_jobs_run_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            record.enqueue('b')
+            self.assertEqual(calls, [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(calls, ['b'])
+        self.assertFalse(Job.objects.exists())
+
+
+class ThreadJobTests(TestCase):
+    def test_retries_wait_on_a_timer_not_in_the_pool(self):
+        flaky_type = get_job_type('tests.flaky')
+        with mock.patch.object(runner, 'connection'), mock.patch.object(runner.threading, 'Timer') as timer:
+            runner._run_attempt(flaky_type, [], {}, 1)
+            timer.assert_called_once_with(flaky_type.retry_delay(1), runner.submit, (flaky_type, [], {}, 2))
+            timer.return_value.start.assert_called_once()
+
+            timer.reset_mock()
+            runner._run_attempt(flaky_type, [], {}, 2)
+            timer.assert_not_called()
+
+
+class WorkerCheckTests(TestCase):
+    def test_database_backend_warns_about_workers(self):
+        with self.settings(JOBS_BACKEND='database'):
+            self.assertEqual([w.id for w in check_worker_backend(None)], ['jobs.W001'])
+        with self.settings(JOBS_BACKEND='thread'):
+            self.assertEqual(check_worker_backend(None), [])
@@ -0,0 +1,21 @@
+from django.contrib import admin
+from django.utils import timezone
+from unfold.admin import ModelAdmin
+
+from .models import OutgoingEmail
+
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(ModelAdmin):
+    list_display = ('id', 'subject', 'kind', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('subject', 'to', 'last_error')
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+    actions = ['retry_emails']
+
+    @admin.action(description='Retry selected emails now')
+    def retry_emails(self, request, queryset):
+        updated = queryset.exclude(status=OutgoingEmail.Status.SENT).update(
+            status=OutgoingEmail.Status.QUEUED, next_attempt_at=timezone.now(), attempts=0,
+        )
+        self.message_user(request, f'{updated} emails queued again.')
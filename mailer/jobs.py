@@ -0,0 +1,13 @@
+from django.utils import timezone
+
+from jobs.registry import job
+from .outbox import next_retry, send_due
+
+
+@job(concurrency=1)
+def send_outbox():
+    """Deliver due email; after failures, come back for the earliest retry."""
+    _, failed = send_due()
+    retry_at = next_retry() if failed else None
+    if retry_at is not None:
+        send_outbox.enqueue_in(max(0, (retry_at - timezone.now()).total_seconds()))
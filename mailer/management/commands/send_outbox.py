@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from mailer.models import OutgoingEmail
+from mailer.outbox import send_due
+
+
+class Command(BaseCommand):
+    help = 'Send queued emails that are due (one SMTP connection per batch)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Emails per SMTP connection (default: EMAIL_BATCH_SIZE)'
+        )
+
+    def handle(self, *args, **options):
+        sent, failed = send_due(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Sent {sent} emails ({failed} failed and will be retried or given up)'))
+        given_up = OutgoingEmail.objects.filter(status=OutgoingEmail.Status.FAILED).count()
+        if given_up:
+            self.stdout.write(self.style.WARNING(f'{given_up} emails have failed permanently'))
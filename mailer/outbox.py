@@ -0,0 +1,156 @@
+"""
+Email outbox: request handlers call queue_email(), which only writes a row in
+the current transaction; send_due() delivers queued mail in batches over one
+SMTP connection per batch, paced to EMAIL_RATE_LIMIT messages per second, and
+retries failures with backoff up to EMAIL_MAX_ATTEMPTS.
+
+Delivery runs in the mailer.jobs.send_outbox job, scheduled once per
+EMAIL_OUTBOX_DELAY after new mail is queued, and in `manage.py send_outbox`.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import OutgoingEmail
+
+
+logger = logging.getLogger(__name__)
+
+SCHEDULED_KEY = "mailer:send_scheduled"
+# a batch that takes longer than this is assumed dead and its mail is retried
+LEASE = timedelta(minutes=10)
+
+
+def queue_email(to, subject, body, html_body="", from_email="", kind=""):
+    """Queue one email (`to` is an address or a list); it is sent after the transaction commits."""
+    email = OutgoingEmail.objects.create(
+        to=[to] if isinstance(to, str) else list(to),
+        subject=subject, body=body, html_body=html_body, from_email=from_email, kind=kind,
+    )
+    transaction.on_commit(schedule_send)
+    return email
+
+
+def queue_many(emails, kind=""):
+    """Queue many emails at once: `emails` are (to, subject, body) tuples."""
+    rows = OutgoingEmail.objects.bulk_create([
+        OutgoingEmail(to=[to] if isinstance(to, str) else list(to), subject=subject, body=body, kind=kind)
+        for to, subject, body in emails
+    ], batch_size=1000)
+    if rows:
+        transaction.on_commit(schedule_send)
+    return len(rows)
+
+
+def schedule_send():
+    """Enqueue one send_outbox job for everything queued in the next EMAIL_OUTBOX_DELAY seconds."""
+    from .jobs import send_outbox
+
+    if cache.add(SCHEDULED_KEY, 1, settings.EMAIL_OUTBOX_DELAY + 60):
+        send_outbox.enqueue_in(settings.EMAIL_OUTBOX_DELAY)
+
+
+def claim(limit):
+    """Lease up to `limit` due emails to this sender; returns them."""
+    now = timezone.now()
+    due = list(
+        OutgoingEmail.objects.filter(
+            Q(status=OutgoingEmail.Status.QUEUED) | Q(status=OutgoingEmail.Status.SENDING),
+            next_attempt_at__lte=now,
+        ).order_by("next_attempt_at", "id").values_list("id", "status", "next_attempt_at")[:limit]
+    )
+    claimed = []
+    for email_id, status, next_attempt_at in due:
+        # conditional on the values just read, so two senders never take the same row
+        if OutgoingEmail.objects.filter(id=email_id, status=status, next_attempt_at=next_attempt_at).update(
+            status=OutgoingEmail.Status.SENDING, next_attempt_at=now + LEASE, attempts=F("attempts") + 1,
+        ):
+            claimed.append(email_id)
+    return list(OutgoingEmail.objects.filter(id__in=claimed).order_by("id"))
+
+
+def _message(email, connection):
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email or settings.DEFAULT_FROM_EMAIL,
+        to=email.to,
+        connection=connection,
+    )
+    if email.html_body:
+        message.attach_alternative(email.html_body, "text/html")
+    return message
+
+
+def _failed(email, error):
+    now = timezone.now()
+    if email.attempts >= settings.EMAIL_MAX_ATTEMPTS:
+        OutgoingEmail.objects.filter(id=email.id).update(status=OutgoingEmail.Status.FAILED, last_error=error)
+        return
+    delay = settings.EMAIL_RETRY_BACKOFF * 2 ** (email.attempts - 1)
+    OutgoingEmail.objects.filter(id=email.id).update(
+        status=OutgoingEmail.Status.QUEUED, next_attempt_at=now + timedelta(seconds=delay), last_error=error,
+    )
+
+
+def send_batch(emails):
+    """Send `emails` over one connection at no more than EMAIL_RATE_LIMIT per second; returns how many went out."""
+    interval = 1 / settings.EMAIL_RATE_LIMIT if settings.EMAIL_RATE_LIMIT else 0
+    sent = 0
+    try:
+        connection = get_connection(fail_silently=False)
+        connection.open()
+    except Exception as exc:
+        logger.exception("Could not connect to the mail server")
+        for email in emails:
+            _failed(email, repr(exc))
+        return 0
+
+    try:
+        last = 0.0
+        for email in emails:
+            wait = last + interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            last = time.monotonic()
+            try:
+                _message(email, connection).send()
+            except Exception as exc:
+                logger.warning("Sending email %s failed (attempt %s): %r", email.id, email.attempts, exc)
+                _failed(email, repr(exc))
+                continue
+            OutgoingEmail.objects.filter(id=email.id).update(status=OutgoingEmail.Status.SENT, sent_at=timezone.now())
+            sent += 1
+    finally:
+        connection.close()
+    return sent
+
+
+def send_due(batch_size=None):
+    """Deliver every due email, batch by batch; returns (sent, failed) counts."""
+    batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+    # mail queued from now on schedules its own run
+    cache.delete(SCHEDULED_KEY)
+    sent = failed = 0
+    while True:
+        emails = claim(batch_size)
+        if not emails:
+            return sent, failed
+        delivered = send_batch(emails)
+        sent += delivered
+        failed += len(emails) - delivered
+
+
+def next_retry():
+    """When the earliest queued retry is due, or None."""
+    return (
+        OutgoingEmail.objects.filter(status=OutgoingEmail.Status.QUEUED)
+        .order_by("next_attempt_at").values_list("next_attempt_at", flat=True).first()
+    )
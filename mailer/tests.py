@@ -0,0 +1,85 @@
+from datetime import date, timedelta
+from unittest import mock
+
+from django.core import mail
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from jobs.models import Job
+from villas.models import Booking, Property
+from villas.utils import queue_booking_confirmation
+from . import outbox
+from .models import OutgoingEmail
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    JOBS_BACKEND='database',
+    EMAIL_RATE_LIMIT=0,
+    EMAIL_MAX_ATTEMPTS=2,
+    EMAIL_RETRY_BACKOFF=60,
+)
+class OutboxTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _queue(self, count):
+        with self.captureOnCommitCallbacks(execute=True):
+            return [outbox.queue_email(f'guest{i}@test.com', f'Subject {i}', 'Body') for i in range(count)]
+
+    def test_request_side_only_queues(self):
+        self._queue(3)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutgoingEmail.objects.filter(status=OutgoingEmail.Status.QUEUED).count(), 3)
+        # one delayed send job for the whole burst
+        self.assertEqual(Job.objects.get().name, 'mailer.jobs.send_outbox')
+
+    def test_batches_share_one_connection(self):
+        self._queue(5)
+        with mock.patch('mailer.outbox.get_connection', wraps=outbox.get_connection) as connect:
+            self.assertEqual(outbox.send_due(batch_size=2), (5, 0))
+        self.assertEqual(connect.call_count, 3)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [f'guest{i}@test.com' for i in range(5)])
+        self.assertEqual(OutgoingEmail.objects.filter(status=OutgoingEmail.Status.SENT).count(), 5)
+
+    def test_failures_are_retried_then_given_up(self):
+        email, = self._queue(1)
+        with mock.patch('mailer.outbox.EmailMultiAlternatives.send', side_effect=OSError('refused')):
+            self.assertEqual(outbox.send_due(), (0, 1))
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), (OutgoingEmail.Status.QUEUED, 1))
+            self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(seconds=50))
+            self.assertIn('refused', email.last_error)
+
+            # not due yet
+            self.assertEqual(outbox.send_due(), (0, 0))
+            OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+            outbox.send_due()
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutgoingEmail.Status.FAILED)
+
+    @override_settings(EMAIL_RATE_LIMIT=20)
+    def test_sends_are_paced_to_the_rate_limit(self):
+        self._queue(4)
+        with mock.patch('mailer.outbox.time.sleep') as sleep:
+            outbox.send_due()
+        self.assertEqual(sleep.call_count, 3)
+        for call in sleep.call_args_list:
+            self.assertLessEqual(call.args[0], 0.05)
+
+    def test_abandoned_sends_are_picked_up_again(self):
+        self._queue(1)
+        OutgoingEmail.objects.update(status=OutgoingEmail.Status.SENDING, next_attempt_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(outbox.send_due(), (1, 0))
+
+    def test_booking_confirmation(self):
+        villa = Property.objects.create(title='Sea Breeze', city='Bridgetown')
+        booking = Booking.objects.create(
+            property=villa, full_name='Ann Guest', email='ann@test.com',
+            check_in=date(2026, 12, 1), check_out=date(2026, 12, 8),
+        )
+        queue_booking_confirmation(booking)
+        outbox.send_due()
+        self.assertEqual(mail.outbox[0].subject, 'Your booking at Sea Breeze is confirmed')
+        self.assertIn('01 December 2026', mail.outbox[0].body)
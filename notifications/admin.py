@@ -1,7 +1,9 @@
 from django.contrib import admin
-from .models import Notification    
+from .models import BroadcastNotification, Notification, NotificationPreference, PendingNotification
 
 # Register your models here.
 
 admin.site.register(Notification)
-    
\ No newline at end of file
+admin.site.register(BroadcastNotification)
+admin.site.register(NotificationPreference)
+admin.site.register(PendingNotification)
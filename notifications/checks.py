@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Cache-backed notification features must not run on a per-process cache."""
+    if settings.CACHE_IS_SHARED:
+        return []
+    return [
+        Error(
+            f"{name} needs a cache shared by every process.",
+            hint="Set CACHE_BACKEND to Redis or Memcached, or turn the setting off.",
+            obj=name,
+            id="notifications.E001",
+        )
+        for name in ("NOTIFICATION_COUNTER_CACHE", "NOTIFICATION_PRESENCE")
+        if getattr(settings, name)
+    ]
@@ -0,0 +1,89 @@
+"""
+Coalescing bursts of notifications.
+
+Events whose title has a rule in COALESCE_RULES are held as
+PendingNotification rows (one per event, not per recipient) for
+NOTIFICATION_COALESCE_WINDOW seconds after the first one. The burst then
+goes out as a single notification per recipient ("5 new resources") instead
+of one row and one socket frame per event. A lone event is sent unchanged.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .models import PendingNotification
+
+
+COALESCE_RULES = {
+    "New Resource Added": "{count} new resources",
+    "New Vila Listing": "{count} new villa listings",
+    "New Contact Us": "{count} new contact messages",
+}
+SAMPLE_SIZE = 10
+LOCK_KEY = "notifications:coalesce:{slug}"
+
+
+def _lock_key(title):
+    return LOCK_KEY.format(slug=slugify(title))
+
+
+def notify(title, data=None, roles=None, exclude_id=None):
+    """Notify every user with one of `roles` (everyone if None), coalescing per COALESCE_RULES."""
+    from .jobs import flush_pending
+    from .utils import notify_roles
+
+    window = settings.NOTIFICATION_COALESCE_WINDOW
+    if title not in COALESCE_RULES or window <= 0:
+        notify_roles(title, data, roles=roles, exclude_id=exclude_id)
+        return
+
+    PendingNotification.objects.create(title=title, data=data, roles=roles, exclude_user_id=exclude_id)
+    # the first event of a burst schedules the flush for when the window closes
+    if cache.add(_lock_key(title), 1, window):
+        flush_pending.enqueue_in(window, title)
+
+
+def summarize(title, items):
+    """(title, data) of the one notification standing for `items` (the events' data)."""
+    if len(items) == 1:
+        return title, items[0]
+    return COALESCE_RULES[title].format(count=len(items)), {"count": len(items), "items": items[:SAMPLE_SIZE]}
+
+
+def flush(title):
+    """
+    Send the pending events for `title` as one notification per audience;
+    returns how many were merged. The events are deleted in the same
+    transaction as the sends are recorded, so a failed send leaves them
+    pending for the job's retry (or flush_stale).
+    """
+    from .utils import notify_roles
+
+    # Clear the lock before claiming the burst: an event that lands after the
+    # claim below then schedules a flush of its own instead of waiting for
+    # this one, which has already read the rows it will send. An event that
+    # lands in between only costs that second flush an empty run.
+    cache.delete(_lock_key(title))
+    with transaction.atomic():
+        pending = list(PendingNotification.objects.select_for_update().filter(title=title).order_by("id"))
+        groups = defaultdict(list)
+        for event in pending:
+            roles = tuple(event.roles) if event.roles is not None else None
+            groups[(roles, event.exclude_user_id)].append(event.data)
+        for (roles, exclude_id), items in groups.items():
+            summary_title, data = summarize(title, items)
+            notify_roles(summary_title, data, roles=list(roles) if roles is not None else None, exclude_id=exclude_id)
+        PendingNotification.objects.filter(id__in=[event.id for event in pending]).delete()
+    return len(pending)
+
+
+def flush_stale():
+    """Flush bursts whose scheduled flush never ran (e.g. a lost worker); returns events sent."""
+    cutoff = timezone.now() - timedelta(seconds=2 * settings.NOTIFICATION_COALESCE_WINDOW)
+    titles = set(PendingNotification.objects.filter(created_at__lt=cutoff).values_list("title", flat=True))
+    return sum(flush(title) for title in titles)
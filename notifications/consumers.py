@@ -104,9 +104,56 @@
 
 
 # notifications/consumers.py
+import asyncio
+from datetime import datetime
 from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.cache import get_local_user
+from . import presence
+
+
+def user_from_token(token):
+    """
+    Verify the access token (signature, expiry, type) in one decode and
+    return the active User, from the short-lived user cache, or None.
+    """
+    if not token:
+        return None
+
+    if token.startswith("Bearer "):
+        token = token.split(" ", 1)[1]
+
+    try:
+        user_id = AccessToken(token)[api_settings.USER_ID_CLAIM]
+    except (TokenError, KeyError):
+        return None
+
+    user = get_local_user(user_id)
+    if user is None or not user.is_active:
+        return None
+    return user
+
+
+def broadcast_is_for(user, event):
+    """
+    Whether a role-group "broadcast" message should reach `user`: not their
+    own, not from before they joined (as BroadcastNotification.visible_to),
+    and not pushed at all to digest users.
+    """
+    from .digests import digest_user_ids
+
+    if event.get("exclude_user") == user.id:
+        return False
+    if datetime.fromisoformat(event["payload"]["created_at"]) < user.date_joined:
+        return False
+    return user.id not in digest_user_ids()
 
 
 class NotificationsConsumer(AsyncJsonWebsocketConsumer):
@@ -119,14 +166,21 @@ class NotificationsConsumer(AsyncJsonWebsocketConsumer):
             self.user = user
             self.group_name = f"user_{user.id}"
 
-            # join group
+            # join group, and the role group broadcasts are sent to
             await self.channel_layer.group_add(self.group_name, self.channel_name)
+            self.role_group = f"role_{user.role}"
+            await self.channel_layer.group_add(self.role_group, self.channel_name)
 
             # accept connection
             await self.accept()
 
+            # mark the user online for fan-out, refreshed until disconnect
+            if settings.NOTIFICATION_PRESENCE:
+                await sync_to_async(presence.connected)(user.id)
+                self.heartbeat = asyncio.create_task(self.keep_present())
+
             # send unseen notifications count immediately after connect
-            unseen_count = await self.get_unseen_count(self.user.id)
+            unseen_count = await self.get_unseen_count()
             await self.send_json(
                 {
                     "type": "unseen_notifications",
@@ -139,16 +193,25 @@ class NotificationsConsumer(AsyncJsonWebsocketConsumer):
     async def disconnect(self, close_code):
         if hasattr(self, "group_name"):
             await self.channel_layer.group_discard(self.group_name, self.channel_name)
+            await self.channel_layer.group_discard(self.role_group, self.channel_name)
+        if hasattr(self, "heartbeat"):
+            self.heartbeat.cancel()
+            await sync_to_async(presence.disconnected)(self.user.id)
+
+    async def keep_present(self):
+        while True:
+            await asyncio.sleep(settings.PRESENCE_HEARTBEAT)
+            await sync_to_async(presence.heartbeat)(self.user.id)
 
     async def receive_json(self, content):
         action = content.get("action")
         if action == "mark_read":
             nid = content.get("notification_id")
             if nid:
-                await self.mark_read(nid, self.user.id)
+                await self.mark_read(nid, content.get("kind"))
 
                 # Optionally send updated unseen count after marking read
-                unseen_count = await self.get_unseen_count(self.user.id)
+                unseen_count = await self.get_unseen_count()
                 await self.send_json(
                     {
                         "type": "unseen_notifications",
@@ -156,6 +219,18 @@ class NotificationsConsumer(AsyncJsonWebsocketConsumer):
                     }
                 )
 
+        elif action == "mark_read_many":
+            # same selectors as POST /api/notifications/mark-read/
+            marked = await self.mark_many_read(content)
+            unseen_count = await self.get_unseen_count()
+            await self.send_json(
+                {
+                    "type": "unseen_notifications",
+                    "count": unseen_count,
+                    "marked": marked,
+                }
+            )
+
     # async def notify(self, event):
     #     """
     #     Called by:
@@ -173,73 +248,81 @@ class NotificationsConsumer(AsyncJsonWebsocketConsumer):
                 {"type": "notify", "payload": {...}}
             )
         """
-        unseen_count = await self.get_unseen_count(self.user.id)
+        unseen_count = await self.get_unseen_count()
 
         payload = event.get("payload", {}) or {}
         # add unseen_count to the payload
         payload["unseen_notifications"] = unseen_count
 
         await self.send_json(payload)
-    
+
+    async def broadcast(self, event):
+        """
+        Called once per role group by notifications.jobs.push_broadcast with
+        {"type": "broadcast", "payload": {...}, "exclude_user": id}.
+        """
+        if await sync_to_async(broadcast_is_for)(self.user, event):
+            await self.notify({"payload": dict(event["payload"])})
+
     @database_sync_to_async
     def get_user_from_jwt(self, token):
+        return user_from_token(token)
+
+    @database_sync_to_async
+    def get_unseen_count(self):
         """
-        Validate JWT and return User instance or None.
+        Return count of unseen notifications (personal and broadcast) for the user.
         """
-        if not token:
-            return None
+        from .utils import unseen_count
+        return unseen_count(self.user)
 
-        if token.startswith("Bearer "):
-            token = token.split(" ", 1)[1]
+    @database_sync_to_async
+    def mark_many_read(self, content):
+        from .serializers import MarkReadSerializer
+        from .utils import mark_many_read
+        serializer = MarkReadSerializer(data=content)
+        if not serializer.is_valid():
+            return 0
+        return mark_many_read(self.user, **serializer.validated_data)
 
+    @database_sync_to_async
+    def mark_read(self, nid, kind=None):
         try:
-            from rest_framework_simplejwt.tokens import UntypedToken
-            from django.contrib.auth import get_user_model
-            from django.conf import settings
-            import jwt
+            from .utils import mark_read
+            mark_read(self.user, nid, kind)
         except Exception:
-            return None
+            pass
 
-        User = get_user_model()
 
-        try:
-            # validate token (signature, expiry, etc.)
-            UntypedToken(token)
-
-            decoded = jwt.decode(
-                token,
-                settings.SECRET_KEY,
-                algorithms=["HS256"],
-                options={"verify_signature": False},
-            )
+class DashboardConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Live counter deltas for the admin dashboard. Clients load the REST
+    dashboard once, then add the pushed deltas (views, downloads, bookings,
+    new_bookings, inquiries) instead of polling. See villas.live.
+    """
+    group_name = "dashboard"
 
-            user_id = decoded.get("user_id") or decoded.get("user") or decoded.get("sub")
-            if not user_id:
-                return None
+    get_user_from_jwt = NotificationsConsumer.get_user_from_jwt
 
-            return User.objects.filter(id=user_id).first()
-        except Exception:
-            try:
-                decoded = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-                user_id = decoded.get("user_id") or decoded.get("user") or decoded.get("sub")
-                if not user_id:
-                    return None
-                return User.objects.filter(id=user_id).first()
-            except Exception:
-                return None
+    async def connect(self):
+        qs = parse_qs(self.scope["query_string"].decode())
+        token = qs.get("token", [None])[0]
 
-    @database_sync_to_async
-    def get_unseen_count(self, user_id):
+        user = await self.get_user_from_jwt(token)
+        if user and (user.is_staff or user.role in ["admin", "manager"]):
+            self.user = user
+            await self.channel_layer.group_add(self.group_name, self.channel_name)
+            await self.accept()
+        else:
+            await self.close()
+
+    async def disconnect(self, close_code):
+        if hasattr(self, "user"):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def dashboard_delta(self, event):
         """
-        Return count of unseen notifications for a user.
+        Called by villas.live.flush():
+            channel_layer.group_send("dashboard", {"type": "dashboard.delta", "counts": {...}})
         """
-        from .models import Notification  # <- this is the correct import
-        return Notification.objects.filter(user_id=user_id, is_read=False).count()
-
-    @database_sync_to_async
-    def mark_read(self, nid, user_id):
-        try:
-            from .models import Notification
-            Notification.objects.filter(id=nid, user_id=user_id).update(is_read=True)
-        except Exception:
-            pass
+        await self.send_json({"type": "dashboard_delta", **event["counts"]})
@@ -0,0 +1,167 @@
+"""
+Cached unseen-notification counters.
+
+Personal notifications: one counter per user, incremented when notifications
+are created and decremented when they are read.
+
+Broadcasts: one running total per audience plus a per-user offset, so
+unread = sum(totals of the user's audiences) - offset. A new broadcast bumps
+a single total instead of one counter per recipient; reading one bumps the
+reader's offset. Offsets are keyed by role so a role change starts afresh.
+
+Latest-id markers (the newest personal notification per user, the newest
+broadcast per audience) let delta polls answer "nothing new" from the cache.
+They are dropped whenever something is created, often by a job worker.
+
+Every key is rebuilt from the database when missing, and deleting broadcasts
+bumps a version that retires all broadcast keys at once.
+
+Counters and markers are changed by whichever process creates or reads
+notifications, job workers included, so they are only cached with
+NOTIFICATION_COUNTER_CACHE on, which needs a CACHE_BACKEND shared by every
+process. Otherwise counts and latest ids are read straight from the database.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max
+
+
+PERSONAL_KEY = "notifications:unseen:{user_id}"
+VERSION_KEY = "notifications:broadcast_version"
+TOTAL_KEY = "notifications:broadcast_total:{version}:{audience}"
+OFFSET_KEY = "notifications:broadcast_offset:{version}:{user_id}:{role}"
+LATEST_KEY = "notifications:latest:{user_id}"
+LATEST_BROADCAST_KEY = "notifications:latest_broadcast:{version}:{audience}"
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def _incr(key, delta=1):
+    """Adjust a cached counter; missing keys are left to be rebuilt lazily."""
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        pass
+
+
+def unseen_count(user):
+    """Unread personal notifications plus unread broadcasts, usually without a query."""
+    from .models import BroadcastNotification, Notification
+
+    if not settings.NOTIFICATION_COUNTER_CACHE:
+        return Notification.objects.filter(user=user, is_read=False).count() + BroadcastNotification.unread_by(user).count()
+
+    version = _version()
+    audiences = BroadcastNotification.audiences_for(user)
+    personal_key = PERSONAL_KEY.format(user_id=user.id)
+    offset_key = OFFSET_KEY.format(version=version, user_id=user.id, role=user.role)
+    total_keys = {audience: TOTAL_KEY.format(version=version, audience=audience) for audience in audiences}
+    cached = cache.get_many([personal_key, offset_key, *total_keys.values()])
+    timeout = settings.NOTIFICATION_COUNTER_TTL
+
+    personal = cached.get(personal_key)
+    if personal is None or personal < 0:
+        personal = Notification.objects.filter(user=user, is_read=False).count()
+        cache.set(personal_key, personal, timeout)
+
+    totals = 0
+    for audience, key in total_keys.items():
+        total = cached.get(key)
+        if total is None:
+            total = BroadcastNotification.objects.filter(audience=audience).count()
+            # add, not set: a concurrent creation may already have counted itself
+            if not cache.add(key, total, None):
+                total = cache.get(key, total)
+        totals += total
+
+    offset = cached.get(offset_key)
+    if offset is None or offset > totals:
+        offset = totals - BroadcastNotification.unread_by(user).count()
+        cache.set(offset_key, offset, timeout)
+
+    return personal + totals - offset
+
+
+def latest_ids(user):
+    """(newest personal notification id, newest broadcast id) for `user`, 0 when there are none."""
+    from .models import BroadcastNotification, Notification
+
+    if not settings.NOTIFICATION_COUNTER_CACHE:
+        latest = Notification.objects.filter(user=user).aggregate(latest=Max("id"))["latest"] or 0
+        audiences = BroadcastNotification.audiences_for(user)
+        latest_broadcast = BroadcastNotification.objects.filter(audience__in=audiences).aggregate(latest=Max("id"))["latest"] or 0
+        return latest, latest_broadcast
+
+    version = _version()
+    latest_key = LATEST_KEY.format(user_id=user.id)
+    broadcast_keys = {
+        audience: LATEST_BROADCAST_KEY.format(version=version, audience=audience)
+        for audience in BroadcastNotification.audiences_for(user)
+    }
+    cached = cache.get_many([latest_key, *broadcast_keys.values()])
+    timeout = settings.NOTIFICATION_COUNTER_TTL
+
+    latest = cached.get(latest_key)
+    if latest is None:
+        latest = Notification.objects.filter(user=user).aggregate(latest=Max("id"))["latest"] or 0
+        cache.set(latest_key, latest, timeout)
+
+    latest_broadcast = 0
+    for audience, key in broadcast_keys.items():
+        value = cached.get(key)
+        if value is None:
+            value = BroadcastNotification.objects.filter(audience=audience).aggregate(latest=Max("id"))["latest"] or 0
+            cache.set(key, value, timeout)
+        latest_broadcast = max(latest_broadcast, value)
+
+    return latest, latest_broadcast
+
+
+def personal_created(user_ids):
+    if not settings.NOTIFICATION_COUNTER_CACHE:
+        return
+    for user_id in user_ids:
+        _incr(PERSONAL_KEY.format(user_id=user_id))
+    cache.delete_many([LATEST_KEY.format(user_id=user_id) for user_id in user_ids])
+
+
+def personal_read(user_id, count=1):
+    if count and settings.NOTIFICATION_COUNTER_CACHE:
+        _incr(PERSONAL_KEY.format(user_id=user_id), -count)
+
+
+def personal_changed(user_id):
+    """Forget a user's personal counter (it is recounted on the next read)."""
+    if settings.NOTIFICATION_COUNTER_CACHE:
+        cache.delete(PERSONAL_KEY.format(user_id=user_id))
+
+
+def broadcast_created(broadcast):
+    if not settings.NOTIFICATION_COUNTER_CACHE:
+        return
+    version = _version()
+    _incr(TOTAL_KEY.format(version=version, audience=broadcast.audience))
+    cache.delete(LATEST_BROADCAST_KEY.format(version=version, audience=broadcast.audience))
+    sender = broadcast.exclude_user
+    if sender is not None and broadcast.audience in type(broadcast).audiences_for(sender):
+        # the sender is not a recipient: move their offset along with the total
+        _incr(OFFSET_KEY.format(version=version, user_id=sender.id, role=sender.role))
+
+
+def broadcast_read(user, count=1):
+    if count and settings.NOTIFICATION_COUNTER_CACHE:
+        _incr(OFFSET_KEY.format(version=_version(), user_id=user.id, role=user.role), count)
+
+
+def broadcasts_changed():
+    """Retire every cached broadcast total and offset."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
@@ -0,0 +1,87 @@
+"""
+Digest delivery: users whose NotificationPreference asks for digests still
+get every notification in their inbox, but no socket push per notification.
+send_digests() pushes one summary per user every `digest_hours` instead.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from mailer.outbox import queue_many
+from .models import BroadcastNotification, Notification, NotificationPreference
+from .utils import push_all
+
+
+DIGEST_USERS_KEY = "notifications:digest_users"
+DIGEST_TITLES = 5
+
+
+def digest_user_ids():
+    """Ids of users in digest mode (cached; reset when a preference changes)."""
+    user_ids = cache.get(DIGEST_USERS_KEY)
+    if user_ids is None:
+        user_ids = set(
+            NotificationPreference.objects.filter(delivery=NotificationPreference.Delivery.DIGEST)
+            .values_list("user_id", flat=True)
+        )
+        cache.set(DIGEST_USERS_KEY, user_ids, settings.NOTIFICATION_COUNTER_TTL)
+    return user_ids
+
+
+def preferences_changed():
+    cache.delete(DIGEST_USERS_KEY)
+
+
+def digest_payload(count, titles, since):
+    return {
+        "kind": "digest",
+        "count": count,
+        "titles": titles,
+        "since": since.isoformat() if since else None,
+    }
+
+
+def send_digests(now=None):
+    """
+    Push a summary of unread notifications to every digest user who is due,
+    and queue it as an email; returns how many were sent.
+    """
+    now = now or timezone.now()
+    messages = []
+    emails = []
+    due = NotificationPreference.objects.filter(delivery=NotificationPreference.Delivery.DIGEST).select_related("user")
+    for preference in due:
+        since = preference.last_digest_at
+        if since and since > now - timedelta(hours=preference.digest_hours):
+            continue
+
+        unread = Notification.objects.filter(user_id=preference.user_id, is_read=False, created_at__lte=now)
+        broadcasts = BroadcastNotification.unread_by(preference.user).filter(created_at__lte=now)
+        if since:
+            unread = unread.filter(created_at__gt=since)
+            broadcasts = broadcasts.filter(created_at__gt=since)
+        count = unread.count() + broadcasts.count()
+        if count:
+            titles = sorted(
+                [*unread.values_list("created_at", "title")[:DIGEST_TITLES],
+                 *broadcasts.values_list("created_at", "title")[:DIGEST_TITLES]],
+                reverse=True,
+            )
+            titles = [title for _, title in titles[:DIGEST_TITLES]]
+            messages.append((
+                f"user_{preference.user_id}",
+                {"type": "notify", "payload": digest_payload(count, titles, since)},
+            ))
+            emails.append((
+                preference.user.email,
+                f"You have {count} new notifications",
+                "\n".join(f"- {title}" for title in titles),
+            ))
+        preference.last_digest_at = now
+        preference.save(update_fields=["last_digest_at"])
+
+    push_all(messages)
+    queue_many(emails, kind="digest")
+    return len(messages)
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from jobs.registry import job
+from . import coalescing, digests
+from .models import BroadcastNotification
+from .retention import purge
+from .utils import broadcast_payload, fan_out, push_all
+
+User = get_user_model()
+
+
+@job(concurrency=2)
+def notify_users(title, data=None, roles=None, exclude_id=None):
+    """Personal notification for every user with one of `roles` (all users if None)."""
+    users = User.objects.all()
+    if roles is not None:
+        users = users.filter(role__in=roles)
+    if exclude_id is not None:
+        users = users.exclude(id=exclude_id)
+    fan_out(users.values_list("id", flat=True), title, data)
+
+
+@job(concurrency=2)
+def push_broadcast(broadcast_id):
+    """One message per role group; each socket filters it and adds its own unseen count."""
+    notif = BroadcastNotification.objects.get(id=broadcast_id)
+    message = {"type": "broadcast", "payload": broadcast_payload(notif), "exclude_user": notif.exclude_user_id}
+    push_all([(f"role_{role}", message) for role in BroadcastNotification.roles_for(notif.audience)])
+
+
+@job(concurrency=1)
+def flush_pending(title):
+    """Send a coalesced burst once its window has closed."""
+    coalescing.flush(title)
+
+
+@job(concurrency=1, max_attempts=1)
+def send_digests():
+    """Digest pushes and stale coalesced bursts; schedule periodically like purge_notifications."""
+    digests.send_digests()
+    coalescing.flush_stale()
+
+
+@job(concurrency=1, max_attempts=1)
+def purge_notifications():
+    """Apply the retention policy; schedule with `notifications.jobs.purge_notifications.enqueue()`."""
+    report = purge(archive_dir=settings.NOTIFICATION_ARCHIVE_DIR)
+    return {"deleted": report.deleted, "broadcasts": report.broadcasts, "seconds": round(report.seconds, 2), "archive": report.archive}
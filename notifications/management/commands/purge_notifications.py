@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from notifications.retention import purge
+
+
+class Command(BaseCommand):
+    help = 'Delete read notifications and broadcasts past the retention period in small chunks, optionally archiving them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.NOTIFICATION_RETENTION_DAYS,
+            help=f'Purge read notifications and all broadcasts older than this many days (default: {settings.NOTIFICATION_RETENTION_DAYS})'
+        )
+        parser.add_argument(
+            '--unread-days',
+            type=int,
+            help='Also purge unread notifications older than this many days'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Rows deleted per statement (default: 1000)'
+        )
+        parser.add_argument(
+            '--archive-dir',
+            default=settings.NOTIFICATION_ARCHIVE_DIR,
+            help='Write purged rows to a gzip NDJSON file in this directory'
+        )
+        parser.add_argument(
+            '--no-archive',
+            action='store_true',
+            help='Do not archive, even if NOTIFICATION_ARCHIVE_DIR is set'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count what would be purged'
+        )
+
+    def handle(self, *args, **options):
+        archive_dir = None if options['no_archive'] else options['archive_dir']
+        report = purge(
+            read_days=options['days'],
+            unread_days=options['unread_days'],
+            chunk_size=max(1, options['chunk_size']),
+            archive_dir=archive_dir,
+            dry_run=options['dry_run'],
+        )
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'{report.deleted} notifications and {report.broadcasts} broadcasts would be purged'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Purged {report.deleted} notifications and {report.broadcasts} broadcasts in {report.chunks} chunks, {report.seconds:.2f}s'
+        ))
+        if report.archive:
+            self.stdout.write(f'Archived to {report.archive}')
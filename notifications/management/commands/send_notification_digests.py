@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from notifications.coalescing import flush_stale
+from notifications.digests import send_digests
+
+
+class Command(BaseCommand):
+    help = 'Push notification digests that are due and flush coalesced bursts left behind (run periodically)'
+
+    def handle(self, *args, **options):
+        sent = send_digests()
+        flushed = flush_stale()
+        self.stdout.write(self.style.SUCCESS(f'✓ Sent {sent} digests, flushed {flushed} pending events'))
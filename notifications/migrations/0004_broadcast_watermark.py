@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_user_image'),
+        ('notifications', '0003_broadcast_notifications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BroadcastWatermark',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='broadcast_watermark', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('read_until', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_user_image'),
+        ('notifications', '0005_notification_user_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationPreference',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_preference', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('delivery', models.CharField(choices=[('instant', 'Instant'), ('digest', 'Periodic digest')], default='instant', max_length=10)),
+                ('digest_hours', models.PositiveSmallIntegerField(default=24, help_text='Hours between digests')),
+                ('last_digest_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PendingNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(db_index=True, max_length=255)),
+                ('data', models.JSONField(blank=True, null=True)),
+                ('roles', models.JSONField(blank=True, help_text='Recipient roles; empty for everyone', null=True)),
+                ('exclude_user_id', models.IntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
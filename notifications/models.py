@@ -13,9 +13,149 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # delta polls: WHERE user_id = ? AND id > ?
+            models.Index(fields=["user", "id"], name="notification_user_id_idx"),
+        ]
 
     def __str__(self):
         return f"Notification to {self.user.email}: {self.title}"
 
 
+class BroadcastNotification(models.Model):
+    """
+    A notification stored once for a whole audience. Users who joined before
+    it was sent see it; reading it adds a BroadcastReceipt, so storage stays
+    one row per broadcast plus one small row per reader.
+    """
+    class Audience(models.TextChoices):
+        ALL = "all", "Everyone"
+        STAFF = "staff", "Admins, managers and agents"
+        CUSTOMERS = "customers", "Customers"
+
+    title = models.CharField(max_length=255)
+    data = models.JSONField(blank=True, null=True)
+    audience = models.CharField(max_length=10, choices=Audience.choices, default=Audience.ALL)
+    exclude_user = models.ForeignKey(User, related_name="+", on_delete=models.SET_NULL, null=True, blank=True, help_text="Usually the sender")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"Broadcast to {self.get_audience_display()}: {self.title}"
+
+    @classmethod
+    def roles_for(cls, audience):
+        """User roles an audience is made of; each has a `role_<role>` socket group."""
+        if audience == cls.Audience.STAFF:
+            return ["admin", "manager", "agent"]
+        if audience == cls.Audience.CUSTOMERS:
+            return ["customer"]
+        return [role for role, _ in User.ROLE_CHOICES]
+
+    @classmethod
+    def audience_of(cls, roles):
+        """The audience made of exactly `roles` (None for everyone), or None if there is none."""
+        if roles is None:
+            return cls.Audience.ALL
+        for audience in cls.Audience:
+            if set(roles) == set(cls.roles_for(audience)):
+                return audience
+        return None
+
+    @classmethod
+    def audiences_for(cls, user):
+        if user.role == "customer":
+            return [cls.Audience.ALL, cls.Audience.CUSTOMERS]
+        return [cls.Audience.ALL, cls.Audience.STAFF]
+
+    def recipients(self):
+        """Users this broadcast was sent to."""
+        users = User.objects.filter(date_joined__lte=self.created_at)
+        if self.audience == self.Audience.STAFF:
+            users = users.exclude(role="customer")
+        elif self.audience == self.Audience.CUSTOMERS:
+            users = users.filter(role="customer")
+        if self.exclude_user_id:
+            users = users.exclude(id=self.exclude_user_id)
+        return users
+
+    @classmethod
+    def visible_to(cls, user):
+        """Broadcasts `user` is a recipient of (the inverse of recipients())."""
+        return cls.objects.filter(
+            audience__in=cls.audiences_for(user),
+            created_at__gte=user.date_joined,
+        ).exclude(exclude_user=user)
+
+    @classmethod
+    def read_by(cls, user):
+        """Expression: has `user` read the broadcast (receipt or watermark)?"""
+        return models.Exists(
+            BroadcastReceipt.objects.filter(broadcast=models.OuterRef("pk"), user=user)
+        ) | models.Exists(
+            BroadcastWatermark.objects.filter(user=user, read_until__gte=models.OuterRef("created_at"))
+        )
+
+    @classmethod
+    def unread_by(cls, user):
+        return cls.visible_to(user).filter(~cls.read_by(user))
+
+
+class BroadcastReceipt(models.Model):
+    """Marks a broadcast as read by one user."""
+    broadcast = models.ForeignKey(BroadcastNotification, related_name="receipts", on_delete=models.CASCADE)
+    user = models.ForeignKey(User, related_name="broadcast_receipts", on_delete=models.CASCADE)
+    read_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "broadcast"], name="unique_broadcast_receipt"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} read broadcast {self.broadcast_id}"
+
+
+class BroadcastWatermark(models.Model):
+    """Every broadcast created up to `read_until` counts as read by `user` ("mark all as read")."""
+    user = models.OneToOneField(User, related_name="broadcast_watermark", on_delete=models.CASCADE, primary_key=True)
+    read_until = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.user_id} read broadcasts up to {self.read_until}"
+
+
+class PendingNotification(models.Model):
+    """
+    An event held back for coalescing (see notifications.coalescing): one row
+    per event, not per recipient, until the window closes and the burst is
+    sent as a single notification.
+    """
+    title = models.CharField(max_length=255, db_index=True)
+    data = models.JSONField(blank=True, null=True)
+    roles = models.JSONField(blank=True, null=True, help_text="Recipient roles; empty for everyone")
+    exclude_user_id = models.IntegerField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Pending: {self.title}"
+
+
+class NotificationPreference(models.Model):
+    """How a user wants notifications delivered; users without a row get them instantly."""
+    class Delivery(models.TextChoices):
+        INSTANT = "instant", "Instant"
+        DIGEST = "digest", "Periodic digest"
+
+    user = models.OneToOneField(User, related_name="notification_preference", on_delete=models.CASCADE, primary_key=True)
+    delivery = models.CharField(max_length=10, choices=Delivery.choices, default=Delivery.INSTANT)
+    digest_hours = models.PositiveSmallIntegerField(default=24, help_text="Hours between digests")
+    last_digest_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.get_delivery_display()}"
+
+
 auditlog.register(Notification)
\ No newline at end of file
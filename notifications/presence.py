@@ -0,0 +1,58 @@
+"""
+Presence registry: which users have a notification socket open.
+
+One cache key per user holds their number of open sockets and expires after
+PRESENCE_TTL seconds unless a connection's heartbeat refreshes it, so
+sockets lost without a disconnect (a crashed server) drop out on their own.
+Fan-out pushes only to online users; everyone else reads the database on
+their next connect.
+
+The registry has to be shared by the socket servers and the job workers, so
+it is only used with NOTIFICATION_PRESENCE on and a shared CACHE_BACKEND
+(Redis or Memcached). When off, everyone counts as online.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+
+KEY = "presence:{user_id}"
+
+
+def _key(user_id):
+    return KEY.format(user_id=user_id)
+
+
+def connected(user_id):
+    key = _key(user_id)
+    if cache.add(key, 1, settings.PRESENCE_TTL):
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        # expired in between
+        cache.add(key, 1, settings.PRESENCE_TTL)
+    cache.touch(key, settings.PRESENCE_TTL)
+
+
+def heartbeat(user_id):
+    key = _key(user_id)
+    if not cache.touch(key, settings.PRESENCE_TTL):
+        cache.add(key, 1, settings.PRESENCE_TTL)
+
+
+def disconnected(user_id):
+    key = _key(user_id)
+    try:
+        if cache.decr(key) <= 0:
+            cache.delete(key)
+    except ValueError:
+        pass
+
+
+def online(user_ids):
+    """The subset of `user_ids` with an open socket, in one cache round trip."""
+    user_ids = list(user_ids)
+    if not settings.NOTIFICATION_PRESENCE:
+        return set(user_ids)
+    found = cache.get_many([_key(user_id) for user_id in user_ids])
+    return {user_id for user_id in user_ids if found.get(_key(user_id), 0) > 0}
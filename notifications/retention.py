@@ -0,0 +1,107 @@
+"""
+Notification retention: delete old notifications and broadcasts in bounded
+chunks, optionally archiving them first to gzip-compressed NDJSON (one JSON
+object per line).
+
+Each chunk is its own short DELETE by primary key, so no statement holds
+locks on a large part of the table. Deleting a broadcast takes its receipts
+with it, and watermarks older than every remaining broadcast are dropped.
+"""
+import gzip
+import json
+import os
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from auditlog.context import disable_auditlog
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import BroadcastNotification, BroadcastWatermark, Notification
+
+
+ARCHIVE_FIELDS = ("id", "user_id", "title", "data", "is_read", "created_at")
+BROADCAST_ARCHIVE_FIELDS = ("id", "title", "data", "audience", "created_at")
+
+
+@dataclass
+class PurgeReport:
+    deleted: int = 0
+    broadcasts: int = 0
+    chunks: int = 0
+    seconds: float = 0.0
+    archive: str = None
+
+
+def expired(read_days=None, unread_days=None, now=None):
+    """Read notifications older than `read_days`, plus unread ones older than `unread_days` if given."""
+    now = now or timezone.now()
+    read_days = settings.NOTIFICATION_RETENTION_DAYS if read_days is None else read_days
+    condition = Q(is_read=True, created_at__lt=now - timedelta(days=read_days))
+    if unread_days is not None:
+        condition |= Q(is_read=False, created_at__lt=now - timedelta(days=unread_days))
+    return Notification.objects.filter(condition)
+
+
+def broadcast_cutoff(read_days=None, now=None):
+    """Broadcasts created before this are past the retention window, read or not."""
+    read_days = settings.NOTIFICATION_RETENTION_DAYS if read_days is None else read_days
+    return (now or timezone.now()) - timedelta(days=read_days)
+
+
+def _purge_chunks(queryset, fields, chunk_size, archive, kind):
+    """Delete `queryset` in chunks of ids, archiving each chunk first; returns (rows, chunks)."""
+    model = queryset.model
+    deleted = chunks = 0
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by("id").values(*fields)[:chunk_size])
+        if not rows:
+            break
+        last_id = rows[-1]["id"]
+        if archive:
+            for row in rows:
+                archive.write(json.dumps({"kind": kind, **row}, default=str) + "\n")
+        # the delete signals keep the unseen counters right; expired rows get no audit entries
+        with disable_auditlog():
+            model.objects.filter(id__in=[row["id"] for row in rows]).delete()
+        deleted += len(rows)
+        chunks += 1
+    return deleted, chunks
+
+
+def purge(read_days=None, unread_days=None, chunk_size=1000, archive_dir=None, dry_run=False):
+    """Delete expired notifications and broadcasts chunk by chunk; returns a PurgeReport."""
+    started = time.monotonic()
+    report = PurgeReport()
+    queryset = expired(read_days, unread_days)
+    cutoff = broadcast_cutoff(read_days)
+    broadcasts = BroadcastNotification.objects.filter(created_at__lt=cutoff)
+    if dry_run:
+        report.deleted = queryset.count()
+        report.broadcasts = broadcasts.count()
+        report.seconds = time.monotonic() - started
+        return report
+
+    archive = None
+    if archive_dir:
+        os.makedirs(archive_dir, exist_ok=True)
+        report.archive = os.path.join(archive_dir, f"notifications-{timezone.now():%Y%m%dT%H%M%S}.ndjson.gz")
+        archive = gzip.open(report.archive, "wt", encoding="utf-8")
+
+    try:
+        report.deleted, chunks = _purge_chunks(queryset, ARCHIVE_FIELDS, chunk_size, archive, "personal")
+        report.chunks += chunks
+        report.broadcasts, chunks = _purge_chunks(broadcasts, BROADCAST_ARCHIVE_FIELDS, chunk_size, archive, "broadcast")
+        report.chunks += chunks
+    finally:
+        if archive:
+            archive.close()
+
+    # every broadcast such a watermark marks read is gone
+    BroadcastWatermark.objects.filter(read_until__lt=cutoff).delete()
+
+    report.seconds = time.monotonic() - started
+    return report
@@ -4,5 +4,6 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r"^(?:api/notifications/)?ws/notifications/$", consumers.NotificationsConsumer.as_asgi()),
+    re_path(r"^(?:api/notifications/)?ws/dashboard/$", consumers.DashboardConsumer.as_asgi()),
 
 ]
\ No newline at end of file
@@ -1,8 +1,52 @@
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Notification
+from .models import Notification, NotificationPreference
+from .utils import client_id
 
 
 class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
         fields = '__all__'
+
+
+class InboxItemSerializer(serializers.Serializer):
+    """A row of notifications.utils.inbox(): a personal notification or a broadcast."""
+    id = serializers.SerializerMethodField()
+    kind = serializers.CharField()
+    user = serializers.IntegerField(source="recipient")
+    title = serializers.CharField()
+    data = serializers.JSONField()
+    is_read = serializers.BooleanField(source="read")
+    created_at = serializers.DateTimeField()
+
+    def get_id(self, obj):
+        return client_id(obj["kind"], obj["id"])
+
+
+class MarkReadSerializer(serializers.Serializer):
+    """Selectors for a bulk mark-read; any combination may be given."""
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=1000)
+    broadcast_ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=1000)
+    up_to_id = serializers.IntegerField(required=False)
+    before = serializers.DateTimeField(required=False)
+    all = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, attrs):
+        if attrs.pop("all"):
+            attrs["before"] = timezone.now()
+        if not attrs:
+            raise serializers.ValidationError("Give ids, broadcast_ids, up_to_id, before or all.")
+        return attrs
+
+
+class NotificationPreferenceSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = NotificationPreference
+        fields = ['delivery', 'digest_hours', 'last_digest_at']
+        read_only_fields = ['last_digest_at']
+
+    def validate_digest_hours(self, value):
+        if value < 1:
+            raise serializers.ValidationError("Must be at least 1 hour.")
+        return value
@@ -0,0 +1,40 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import counters, digests
+from .models import BroadcastNotification, Notification, NotificationPreference
+
+
+# bulk_create and update() bypass these; notifications.utils adjusts the
+# counters itself on those paths
+
+@receiver(post_save, sender=Notification)
+def count_saved_notification(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: counters.personal_created([instance.user_id]))
+    else:
+        counters.personal_changed(instance.user_id)
+
+
+@receiver(post_delete, sender=Notification)
+def count_deleted_notification(sender, instance, **kwargs):
+    counters.personal_changed(instance.user_id)
+
+
+@receiver(post_save, sender=BroadcastNotification)
+def count_changed_broadcast(sender, instance, created, **kwargs):
+    # creations are counted by notifications.utils.broadcast
+    if not created:
+        counters.broadcasts_changed()
+
+
+@receiver(post_delete, sender=BroadcastNotification)
+def count_deleted_broadcast(sender, instance, **kwargs):
+    counters.broadcasts_changed()
+
+
+@receiver(post_save, sender=NotificationPreference)
+@receiver(post_delete, sender=NotificationPreference)
+def reset_digest_users(sender, **kwargs):
+    digests.preferences_changed()
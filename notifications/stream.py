@@ -0,0 +1,81 @@
+"""
+Server-Sent Events feed for clients that cannot keep a WebSocket open.
+
+An async view served by daphne: each client is one coroutine waiting on its
+own channel-layer channel, subscribed to the same user_<id> and role_<role>
+groups as NotificationsConsumer, so idle connections cost no thread.
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+
+from . import presence
+from .consumers import broadcast_is_for, user_from_token
+from .utils import unseen_count
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def request_token(request):
+    """The access token from ?token= (EventSource can't set headers), the Authorization header or the auth cookie."""
+    header = request.headers.get("Authorization", "")
+    return (
+        request.GET.get("token")
+        or (header if header.startswith("Bearer ") else None)
+        or request.COOKIES.get(settings.REST_AUTH["JWT_AUTH_COOKIE"])
+    )
+
+
+async def events(user):
+    layer = get_channel_layer()
+    channel = await layer.new_channel()
+    groups = [f"user_{user.id}", f"role_{user.role}"]
+    for group in groups:
+        await layer.group_add(group, channel)
+    if settings.NOTIFICATION_PRESENCE:
+        await sync_to_async(presence.connected)(user.id)
+
+    try:
+        yield sse_event("unseen_notifications", {"count": await database_sync_to_async(unseen_count)(user)})
+        while True:
+            try:
+                message = await asyncio.wait_for(layer.receive(channel), settings.NOTIFICATION_STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                # keeps proxies from closing an idle connection, and refreshes presence
+                if settings.NOTIFICATION_PRESENCE:
+                    await sync_to_async(presence.heartbeat)(user.id)
+                yield ": keepalive\n\n"
+                continue
+
+            if message["type"] not in ("notify", "broadcast"):
+                continue
+            if message["type"] == "broadcast" and not await sync_to_async(broadcast_is_for)(user, message):
+                continue
+            payload = dict(message.get("payload") or {})
+            payload["unseen_notifications"] = await database_sync_to_async(unseen_count)(user)
+            yield sse_event("notification", payload)
+    finally:
+        for group in groups:
+            await layer.group_discard(group, channel)
+        if settings.NOTIFICATION_PRESENCE:
+            await sync_to_async(presence.disconnected)(user.id)
+
+
+async def notification_stream(request):
+    """GET: text/event-stream of the notifications NotificationsConsumer would push."""
+    user = await database_sync_to_async(user_from_token)(request_token(request))
+    if user is None:
+        return JsonResponse({"error": "Invalid or missing access token"}, status=401)
+
+    response = StreamingHttpResponse(events(user), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # stop nginx from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
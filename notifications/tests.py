@@ -1,3 +1,658 @@
-from django.test import TestCase
+from channels.layers import get_channel_layer
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from asgiref.sync import async_to_sync
+import asyncio
+import gzip
+import json
+import tempfile
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from unittest import mock
+
+from accounts.models import User
+from auditlog.models import LogEntry
+from jobs.models import Job
+from mailer.models import OutgoingEmail
+from eastmondvilla.asgi import application
+from . import coalescing, counters, digests, presence, retention, utils
+from .checks import check_shared_cache
+from .models import BroadcastNotification, BroadcastReceipt, BroadcastWatermark, Notification, NotificationPreference, PendingNotification
+
+
+class NotificationFanOutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # the in-memory channel layer is shared by the whole run
+        async_to_sync(get_channel_layer().flush)()
+        self.admin = User.objects.create_user(email='admin@test.com', name='Admin', password='x', role='admin')
+        self.agent = User.objects.create_user(email='agent@test.com', name='Agent', password='x', role='agent')
+        self.customers = [
+            User.objects.create_user(email=f'c{i}@test.com', name=f'Customer {i}') for i in range(25)
+        ]
+
+    def test_fan_out_inserts_in_chunks(self):
+        layer = get_channel_layer()
+        async_to_sync(layer.group_add)(f'user_{self.customers[-1].id}', 'test.user!1')
+
+        with mock.patch.object(utils, 'FANOUT_CHUNK_SIZE', 10):
+            # one INSERT per chunk of 10, plus looking up who asked for digests
+            with self.assertNumQueries(4):
+                utils.fan_out([user.id for user in self.customers], 'Booking reminder', data={'id': 7})
+
+        self.assertEqual(Notification.objects.count(), 25)
+        message = async_to_sync(layer.receive)('test.user!1')
+        self.assertEqual(message['payload']['title'], 'Booking reminder')
+        self.assertEqual(message['payload']['data'], {'id': 7})
+
+    @override_settings(NOTIFICATION_COALESCE_WINDOW=0)
+    def test_staff_notifications_skip_customers_and_sender(self):
+        with mock.patch('notifications.jobs.push_all') as push, self.captureOnCommitCallbacks(execute=True):
+            utils.create_notification_for_admin_manager_agent(self.admin, 'New Resource Added')
+        notif = BroadcastNotification.objects.get()
+        self.assertEqual((notif.audience, notif.exclude_user), (BroadcastNotification.Audience.STAFF, self.admin))
+        self.assertEqual(list(notif.recipients()), [self.agent])
+        self.assertFalse(Notification.objects.exists())
+        # one message per staff role, whatever the number of recipients
+        self.assertEqual([group for group, _ in push.call_args.args[0]], ['role_admin', 'role_manager', 'role_agent'])
+
+
+class BroadcastNotificationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # the in-memory channel layer is shared by the whole run
+        async_to_sync(get_channel_layer().flush)()
+        past = timezone.now() - timedelta(days=1)
+        self.admin = User.objects.create_user(email='admin@test.com', name='Admin', role='admin', date_joined=past)
+        self.customer = User.objects.create_user(email='c@test.com', name='Customer', date_joined=past)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.customer)
+
+    def test_announcements_are_stored_once(self):
+        layer = get_channel_layer()
+        async_to_sync(layer.group_add)('role_customer', 'test.user!1')
+        with self.captureOnCommitCallbacks(execute=True):
+            utils.create_notification_for_customers(self.admin, 'New Announcement', data={'id': 3})
+
+        self.assertEqual(BroadcastNotification.objects.count(), 1)
+        self.assertFalse(Notification.objects.exists())
+        message = async_to_sync(layer.receive)('test.user!1')
+        self.assertEqual((message['type'], message['payload']['kind']), ('broadcast', 'broadcast'))
+        self.assertEqual(message['exclude_user'], self.admin.id)
+        # the sender does not see their own announcement
+        self.assertEqual(utils.unseen_count(self.admin), 0)
+
+    def test_list_merges_personal_and_broadcast_notifications(self):
+        Notification.objects.create(user=self.customer, title='Booking approved')
+        utils.broadcast('Staff only', audience=BroadcastNotification.Audience.STAFF)
+        announcement = utils.broadcast('New Announcement', data={'id': 3})
+        User.objects.create_user(email='late@test.com', name='Late')
+
+        resp = self.client.get('/api/notifications/list/')
+        self.assertEqual(resp.data['results']['unseen_count'], 2)
+        rows = resp.data['results']['notifications']
+        self.assertEqual([(r['kind'], r['title']) for r in rows], [('broadcast', 'New Announcement'), ('personal', 'Booking approved')])
+        self.assertEqual(rows[0]['data'], {'id': 3})
+
+        resp = self.client.get(f'/api/notifications/list/{announcement.id}/', {'kind': 'broadcast'})
+        self.assertTrue(resp.data['notification']['is_read'])
+        self.assertEqual(BroadcastReceipt.objects.filter(user=self.customer).count(), 1)
+        self.assertEqual(utils.unseen_count(self.customer), 1)
+        # users who joined after the announcement never see it
+        late = User.objects.get(email='late@test.com')
+        self.assertEqual(utils.unseen_count(late), 0)
+
+    def test_clients_mark_broadcasts_read_with_the_id_they_were_given(self):
+        announcement = utils.broadcast('New Announcement')
+        # same numeric id as the broadcast, in the personal sequence
+        personal = Notification.objects.create(id=announcement.id, user=self.customer, title='Booking approved')
+
+        rows = self.client.get('/api/notifications/list/').data['results']['notifications']
+        self.assertEqual([row['id'] for row in rows], [personal.id, f'b{announcement.id}'])
+        resp = self.client.get(f'/api/notifications/list/b{announcement.id}/')
+        self.assertEqual((resp.data['notification']['kind'], resp.data['notification']['id']), ('broadcast', f'b{announcement.id}'))
+        self.assertTrue(BroadcastReceipt.objects.filter(broadcast=announcement, user=self.customer).exists())
+        personal.refresh_from_db()
+        self.assertFalse(personal.is_read)
+        self.assertEqual(self.client.get('/api/notifications/list/bogus/').status_code, 404)
+
+    def test_unprefixed_ids_fall_back_to_broadcasts(self):
+        announcement = utils.broadcast('New Announcement')
+        resp = self.client.get(f'/api/notifications/list/{announcement.id}/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['notification']['kind'], 'broadcast')
+        self.assertEqual(utils.unseen_count(self.customer), 0)
+        # an explicit kind never falls back
+        other = utils.broadcast('Another')
+        self.assertEqual(self.client.get(f'/api/notifications/list/{other.id}/', {'kind': 'personal'}).status_code, 404)
+
+    async def test_socket_clients_echo_the_payload_id(self):
+        layer = get_channel_layer()
+        communicator = WebsocketCommunicator(application, f'/ws/notifications/?token={AccessToken.for_user(self.customer)}')
+        await communicator.connect()
+        self.assertEqual((await communicator.receive_json_from())['count'], 0)
+
+        announcement = await database_sync_to_async(utils.broadcast)('New Announcement')
+        await database_sync_to_async(Notification.objects.create)(id=announcement.id, user=self.customer, title='Booking approved')
+        await layer.group_send('role_customer', {'type': 'broadcast', 'payload': utils.broadcast_payload(announcement), 'exclude_user': None})
+        payload = await communicator.receive_json_from()
+
+        # an old client sends back only the id it received
+        await communicator.send_json_to({'action': 'mark_read', 'notification_id': payload['id']})
+        self.assertEqual(await communicator.receive_json_from(), {'type': 'unseen_notifications', 'count': 1})
+        self.assertTrue(await BroadcastReceipt.objects.filter(broadcast=announcement, user=self.customer).aexists())
+        await communicator.disconnect()
+
+
+@override_settings(NOTIFICATION_COUNTER_CACHE=True)
+class UnseenCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        past = timezone.now() - timedelta(days=1)
+        self.admin = User.objects.create_user(email='admin@test.com', name='Admin', role='admin', date_joined=past)
+        self.customer = User.objects.create_user(email='c@test.com', name='Customer', date_joined=past)
+        Notification.objects.create(user=self.customer, title='Booking approved')
+        self.old = utils.broadcast('Old news')
+
+    def _broadcast(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return utils.broadcast('New Announcement', **kwargs)
+
+    def test_counters_are_rebuilt_once_then_maintained_without_queries(self):
+        self.assertEqual(utils.unseen_count(self.customer), 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(utils.unseen_count(self.customer), 2)
+
+        announcement = self._broadcast(exclude_user=self.admin)
+        self._broadcast(audience=BroadcastNotification.Audience.STAFF)
+        utils.fan_out([self.customer.id], 'Booking reminder')
+        with self.assertNumQueries(0):
+            self.assertEqual(utils.unseen_count(self.customer), 4)
+
+        utils.mark_read(self.customer, announcement.id, 'broadcast')
+        utils.mark_read(self.customer, announcement.id, 'broadcast')
+        utils.mark_read(self.customer, Notification.objects.filter(user=self.customer).first().id)
+        with self.assertNumQueries(0):
+            self.assertEqual(utils.unseen_count(self.customer), 2)
+
+        cache.clear()
+        self.assertEqual(utils.unseen_count(self.customer), 2)
+
+    def test_sender_offsets_follow_their_own_broadcasts(self):
+        self.assertEqual(utils.unseen_count(self.admin), 1)
+        self._broadcast(exclude_user=self.admin)
+        self._broadcast(audience=BroadcastNotification.Audience.CUSTOMERS, exclude_user=self.admin)
+        self.assertEqual(utils.unseen_count(self.admin), 1)
+
+    def test_deleting_broadcasts_resets_the_totals(self):
+        self.assertEqual(utils.unseen_count(self.customer), 2)
+        self.old.delete()
+        self.assertEqual(utils.unseen_count(self.customer), 1)
+
+    @override_settings(NOTIFICATION_COUNTER_CACHE=False)
+    def test_counts_come_from_the_database_without_a_shared_cache(self):
+        self.assertEqual(utils.unseen_count(self.customer), 2)
+        self._broadcast()
+        utils.fan_out([self.customer.id], 'Booking reminder')
+        self.assertEqual(utils.unseen_count(self.customer), 4)
+        self.assertFalse(cache.get(counters.PERSONAL_KEY.format(user_id=self.customer.id)))
+
+    @override_settings(CACHE_IS_SHARED=False, NOTIFICATION_COUNTER_CACHE=True, NOTIFICATION_PRESENCE=False)
+    def test_counter_cache_requires_a_shared_cache(self):
+        errors = check_shared_cache(None)
+        self.assertEqual([(e.id, e.obj) for e in errors], [('notifications.E001', 'NOTIFICATION_COUNTER_CACHE')])
+
+
+@override_settings(
+    NOTIFICATION_COUNTER_CACHE=True,
+    USER_CACHE=True,
+)
+class SocketAuthenticationTests(TestCase):
+    CONNECTIONS = 2000
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='c@test.com', name='Customer')
+        self.token = str(AccessToken.for_user(self.user))
+        self.refresh_token = str(RefreshToken.for_user(self.user))
+
+    def _communicator(self, token):
+        return WebsocketCommunicator(application, f'/ws/notifications/?token={token}')
+
+    async def _storm(self):
+        communicators = [self._communicator(self.token) for _ in range(self.CONNECTIONS)]
+        results = await asyncio.gather(*(c.connect(timeout=30) for c in communicators))
+        await asyncio.gather(*(c.disconnect() for c in communicators))
+        return [connected for connected, _ in results]
+
+    def test_reconnect_storm_hits_the_database_only_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            connected = async_to_sync(self._storm)()
+        self.assertEqual(connected.count(True), self.CONNECTIONS)
+        # the user row and the unseen counters are read once, then cached
+        self.assertLessEqual(len(queries), 6)
+
+    async def test_rejects_bad_refresh_and_deactivated_users(self):
+        for token in ('garbage', self.refresh_token):
+            connected, _ = await self._communicator(token).connect()
+            self.assertFalse(connected)
+
+        communicator = self._communicator(self.token)
+        self.assertTrue((await communicator.connect())[0])
+        await communicator.disconnect()
+
+        self.user.is_active = False
+        await self.user.asave()
+        connected, _ = await self._communicator(self.token).connect()
+        self.assertFalse(connected)
+
+
+class BulkMarkReadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.customer = User.objects.create_user(email='c@test.com', name='Customer', date_joined=timezone.now() - timedelta(days=1))
+        self.personal = [Notification.objects.create(user=self.customer, title=f'Personal {i}') for i in range(5)]
+        self.broadcasts = [utils.broadcast(f'Broadcast {i}') for i in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.customer)
+
+    def test_ids_and_watermarks_in_one_request(self):
+        self.assertEqual(utils.unseen_count(self.customer), 8)
+        resp = self.client.post('/api/notifications/mark-read/', {
+            'ids': [self.personal[4].id],
+            'up_to_id': self.personal[1].id,
+            'broadcast_ids': [self.broadcasts[0].id],
+        }, format='json')
+        self.assertEqual(resp.data, {'marked': 4, 'unseen_count': 4})
+        self.assertEqual(utils.unseen_count(self.customer), 4)
+
+        resp = self.client.post('/api/notifications/mark-read/', {'all': True}, format='json')
+        self.assertEqual(resp.data, {'marked': 4, 'unseen_count': 0})
+        self.assertFalse(Notification.objects.filter(is_read=False).exists())
+        # the watermark covers broadcasts without a receipt per broadcast
+        self.assertEqual(BroadcastReceipt.objects.count(), 1)
+        rows = self.client.get('/api/notifications/list/').data['results']['notifications']
+        self.assertTrue(all(row['is_read'] for row in rows))
+
+        utils.broadcast('Later')
+        cache.clear()
+        self.assertEqual(utils.unseen_count(self.customer), 1)
+
+    def test_requires_a_selector(self):
+        self.assertEqual(self.client.post('/api/notifications/mark-read/', {}, format='json').status_code, 400)
+
+    async def test_socket_action(self):
+        communicator = WebsocketCommunicator(application, f'/ws/notifications/?token={AccessToken.for_user(self.customer)}')
+        await communicator.connect()
+        self.assertEqual((await communicator.receive_json_from())['count'], 8)
+
+        await communicator.send_json_to({'action': 'mark_read_many', 'ids': [n.id for n in self.personal]})
+        self.assertEqual(await communicator.receive_json_from(), {'type': 'unseen_notifications', 'count': 3, 'marked': 5})
+        await communicator.disconnect()
+
+
+class NotificationRetentionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='reader@test.com', name='Reader')
+        old = timezone.now() - timedelta(days=120)
+        self.old_read = [Notification.objects.create(user=self.user, title=f'Old {i}', is_read=True) for i in range(5)]
+        self.old_unread = Notification.objects.create(user=self.user, title='Old unread')
+        self.recent_read = Notification.objects.create(user=self.user, title='Recent', is_read=True)
+        Notification.objects.filter(id__in=[n.id for n in self.old_read] + [self.old_unread.id]).update(created_at=old)
+
+    def test_purges_old_read_notifications_in_chunks(self):
+        report = retention.purge(read_days=90, chunk_size=2)
+        self.assertEqual(report.deleted, 5)
+        self.assertEqual(report.chunks, 3)
+        self.assertCountEqual(
+            Notification.objects.values_list('id', flat=True), [self.old_unread.id, self.recent_read.id]
+        )
+
+    def test_unread_purge_resets_the_unseen_counter(self):
+        self.assertEqual(utils.unseen_count(self.user), 1)
+        retention.purge(read_days=90, unread_days=90)
+        self.assertEqual(utils.unseen_count(self.user), 0)
+
+    def test_archive_and_command(self):
+        with tempfile.TemporaryDirectory() as archive_dir:
+            out = StringIO()
+            call_command('purge_notifications', '--days', '90', '--archive-dir', archive_dir, stdout=out)
+            self.assertIn('Purged 5 notifications', out.getvalue())
+            path = out.getvalue().split('Archived to ')[1].strip()
+            with gzip.open(path, 'rt') as archive:
+                rows = [json.loads(line) for line in archive]
+        self.assertEqual([row['title'] for row in rows], [f'Old {i}' for i in range(5)])
+        self.assertEqual(rows[0]['user_id'], self.user.id)
+
+    def test_purges_old_broadcasts_with_their_receipts_and_watermarks(self):
+        old = timezone.now() - timedelta(days=120)
+        User.objects.filter(id=self.user.id).update(date_joined=old - timedelta(days=1))
+        self.user.refresh_from_db()
+        stale, recent = utils.broadcast('Old news'), utils.broadcast('News')
+        BroadcastNotification.objects.filter(id=stale.id).update(created_at=old)
+        utils.mark_read(self.user, f'b{stale.id}')
+        utils.mark_read(self.user, f'b{recent.id}')
+        BroadcastWatermark.objects.create(user=self.user, read_until=old)
+
+        report = retention.purge(read_days=90)
+        self.assertEqual((report.deleted, report.broadcasts), (5, 1))
+        self.assertEqual(list(BroadcastNotification.objects.values_list('id', flat=True)), [recent.id])
+        self.assertEqual(list(BroadcastReceipt.objects.values_list('broadcast_id', flat=True)), [recent.id])
+        self.assertFalse(BroadcastWatermark.objects.exists())
+        self.assertEqual(utils.unseen_count(self.user), 1)
+
+    def test_purged_rows_leave_no_audit_entries(self):
+        entries = LogEntry.objects.count()
+        retention.purge(read_days=90)
+        self.assertEqual(LogEntry.objects.count(), entries)
+
+    def test_dry_run_deletes_nothing(self):
+        out = StringIO()
+        call_command('purge_notifications', '--dry-run', stdout=out)
+        self.assertIn('5 notifications and 0 broadcasts would be purged', out.getvalue())
+        self.assertEqual(Notification.objects.count(), 7)
+
+
+@override_settings(NOTIFICATION_COUNTER_CACHE=True)
+class DeltaSyncTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        past = timezone.now() - timedelta(days=1)
+        self.user = User.objects.create_user(email='poller@test.com', name='Poller', date_joined=past)
+        self.first = Notification.objects.create(user=self.user, title='Booking approved')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _poll(self, **params):
+        return self.client.get('/api/notifications/list/', params)
+
+    def test_unchanged_feed_is_answered_from_the_cache(self):
+        response = self._poll(since_id=0, since_broadcast_id=0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['id'] for item in response.data['notifications']], [self.first.id])
+        self.assertEqual(response.data['latest_id'], self.first.id)
+
+        cursors = {'since_id': response.data['latest_id'], 'since_broadcast_id': response.data['latest_broadcast_id']}
+        with self.assertNumQueries(0):
+            self.assertIsNone(utils.changes_since(self.user, **cursors))
+        self.assertEqual(self._poll(**cursors).status_code, 304)
+
+    @override_settings(NOTIFICATION_COUNTER_CACHE=False)
+    def test_without_a_shared_cache_markers_come_from_the_database(self):
+        cursors = {'since_id': self.first.id, 'since_broadcast_id': 0}
+        self.assertEqual(self._poll(**cursors).status_code, 304)
+        # created elsewhere (e.g. by a job worker): this process's cache never hears of it
+        later = Notification.objects.create(user=self.user, title='Booking reminder')
+        response = self._poll(**cursors)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['latest_id'], later.id)
+
+    def test_returns_only_new_items_with_the_unseen_count(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            announcement = utils.broadcast('New Announcement')
+        utils.fan_out([self.user.id], 'Booking reminder')
+
+        response = self._poll(since_id=self.first.id, since_broadcast_id=0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(item['kind'], item['title']) for item in response.data['notifications']],
+            [('broadcast', 'New Announcement'), ('personal', 'Booking reminder')],
+        )
+        self.assertEqual(response.data['unseen_count'], 3)
+        self.assertEqual(response.data['latest_broadcast_id'], announcement.id)
+
+        # without since_broadcast_id only personal notifications count
+        self.assertEqual(self._poll(since_id=response.data['latest_id']).status_code, 304)
+
+    def test_truncated_delta_resumes_after_the_last_item(self):
+        utils.fan_out([self.user.id] * 3, 'Reminder')
+        changes = utils.changes_since(self.user, self.first.id, limit=2)
+        self.assertTrue(changes['has_more'])
+        rest = utils.changes_since(self.user, changes['latest_id'], limit=2)
+        self.assertFalse(rest['has_more'])
+        self.assertEqual(len(changes['notifications']) + len(rest['notifications']), 3)
+
+    def test_rejects_bad_cursor(self):
+        self.assertEqual(self._poll(since_id='abc').status_code, 400)
+
+
+@override_settings(
+    JOBS_BACKEND='database',
+    NOTIFICATION_COALESCE_WINDOW=60,
+)
+class CoalescingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(email='admin@test.com', name='Admin', role='admin')
+        self.agents = [User.objects.create_user(email=f'a{i}@test.com', name=f'Agent {i}', role='agent') for i in range(3)]
+        User.objects.create_user(email='c@test.com', name='Customer')
+
+    def test_burst_becomes_one_notification_per_recipient(self):
+        for i in range(5):
+            utils.create_notification_for_admin_manager_agent(self.admin, 'New Resource Added', data={'id': i})
+        self.assertEqual(PendingNotification.objects.count(), 5)
+        self.assertFalse(Notification.objects.exists())
+        # one flush, scheduled for when the window closes
+        flush = Job.objects.get()
+        self.assertGreater(flush.run_at, timezone.now() + timedelta(seconds=50))
+
+        self.assertEqual(coalescing.flush('New Resource Added'), 5)
+        self.assertFalse(PendingNotification.objects.exists())
+        notif = BroadcastNotification.objects.get()
+        self.assertEqual(notif.recipients().count(), 3)
+        self.assertEqual(notif.title, '5 new resources')
+        self.assertEqual(notif.data['count'], 5)
+        self.assertEqual([item['id'] for item in notif.data['items']], list(range(5)))
+
+    def test_lone_events_are_sent_unchanged(self):
+        utils.notify_admins_and_managers('New Contact Us', data={'name': 'Ann'})
+        coalescing.flush('New Contact Us')
+        notif = BroadcastNotification.objects.get()
+        self.assertEqual((notif.title, notif.data), ('New Contact Us', {'name': 'Ann'}))
+        self.assertEqual(notif.recipients().count(), 4)
+
+    @override_settings(NOTIFICATION_COALESCE_WINDOW=0)
+    def test_zero_window_sends_right_away(self):
+        utils.notify_admins_and_managers('New Contact Us')
+        self.assertFalse(PendingNotification.objects.exists())
+        self.assertTrue(BroadcastNotification.objects.exists())
+        self.assertEqual(Job.objects.get().name, 'notifications.jobs.push_broadcast')
+
+    def test_stale_bursts_are_flushed(self):
+        utils.notify_admins_and_managers('New Vila Listing')
+        self.assertEqual(coalescing.flush_stale(), 0)
+        PendingNotification.objects.update(created_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(coalescing.flush_stale(), 1)
+        self.assertEqual(BroadcastNotification.objects.get().title, 'New Vila Listing')
+
+    def test_failed_sends_keep_the_burst_pending(self):
+        for i in range(2):
+            utils.create_notification_for_admin_manager_agent(self.admin, 'New Resource Added', data={'id': i})
+        with mock.patch('notifications.utils.notify_roles', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                coalescing.flush('New Resource Added')
+        self.assertEqual(PendingNotification.objects.count(), 2)
+        self.assertEqual(coalescing.flush('New Resource Added'), 2)
+        self.assertFalse(PendingNotification.objects.exists())
+
+    def test_events_arriving_during_a_flush_schedule_their_own(self):
+        utils.create_notification_for_admin_manager_agent(self.admin, 'New Resource Added', data={'id': 1})
+        send = utils.notify_roles
+
+        def send_and_receive_another(*args, **kwargs):
+            send(*args, **kwargs)
+            utils.create_notification_for_admin_manager_agent(self.admin, 'New Resource Added', data={'id': 2})
+
+        with mock.patch('notifications.utils.notify_roles', side_effect=send_and_receive_another):
+            self.assertEqual(coalescing.flush('New Resource Added'), 1)
+        self.assertEqual(list(PendingNotification.objects.values_list('data', flat=True)), [{'id': 2}])
+        self.assertEqual(Job.objects.filter(name='notifications.jobs.flush_pending').count(), 2)
+
+    def test_role_sets_without_an_audience_get_personal_notifications(self):
+        utils.notify_roles('Agents only', roles=['agent'])
+        self.assertFalse(BroadcastNotification.objects.exists())
+        self.assertEqual(Job.objects.get().name, 'notifications.jobs.notify_users')
+
+
+class DigestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.instant = User.objects.create_user(email='instant@test.com', name='Instant')
+        self.digest = User.objects.create_user(email='digest@test.com', name='Digest')
+        self.client = APIClient()
+        self.client.force_authenticate(self.digest)
+        response = self.client.put('/api/notifications/preferences/', {'delivery': 'digest', 'digest_hours': 6}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_digest_users_get_rows_but_no_pushes(self):
+        with mock.patch.object(utils, 'push_all') as push:
+            utils.fan_out([self.instant.id, self.digest.id], 'Booking reminder')
+        self.assertEqual([group for group, _ in push.call_args.args[0]], [f'user_{self.instant.id}'])
+        self.assertEqual(Notification.objects.filter(user=self.digest).count(), 1)
+
+    def test_summaries_are_pushed_once_per_period(self):
+        utils.fan_out([self.digest.id] * 3, 'Booking reminder')
+        with mock.patch.object(digests, 'push_all') as push:
+            self.assertEqual(digests.send_digests(), 1)
+            self.assertEqual(digests.send_digests(), 0)
+        group, message = push.call_args_list[0].args[0][0]
+        self.assertEqual(group, f'user_{self.digest.id}')
+        self.assertEqual(message['payload']['kind'], 'digest')
+        self.assertEqual(message['payload']['count'], 3)
+
+        email = OutgoingEmail.objects.get()
+        self.assertEqual((email.to, email.kind), ([self.digest.email], 'digest'))
+
+        later = timezone.now() + timedelta(hours=7)
+        utils.fan_out([self.digest.id], 'Booking approved')
+        with mock.patch.object(digests, 'push_all') as push:
+            self.assertEqual(digests.send_digests(now=later), 1)
+        self.assertEqual(push.call_args.args[0][0][1]['payload']['titles'], ['Booking approved'])
+
+    def test_switching_back_to_instant(self):
+        self.assertEqual(digests.digest_user_ids(), {self.digest.id})
+        self.client.put('/api/notifications/preferences/', {'delivery': 'instant'}, format='json')
+        self.assertEqual(digests.digest_user_ids(), set())
+        self.assertEqual(NotificationPreference.objects.get(user=self.digest).digest_hours, 6)
+
+
+@override_settings(NOTIFICATION_PRESENCE=True)
+class PresenceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user(email=f'u{i}@test.com', name=f'User {i}') for i in range(3)]
+        self.token = str(AccessToken.for_user(self.users[0]))
+
+    def test_connection_counting(self):
+        presence.connected(self.users[0].id)
+        presence.connected(self.users[0].id)
+        presence.connected(self.users[1].id)
+        presence.disconnected(self.users[0].id)
+        self.assertEqual(presence.online(user.id for user in self.users), {self.users[0].id, self.users[1].id})
+        presence.disconnected(self.users[0].id)
+        presence.disconnected(self.users[2].id)
+        self.assertEqual(presence.online(user.id for user in self.users), {self.users[1].id})
+
+    def test_fan_out_pushes_only_to_online_users(self):
+        presence.connected(self.users[1].id)
+        with mock.patch.object(utils, 'push_all') as push:
+            utils.fan_out([user.id for user in self.users], 'Booking reminder')
+        self.assertEqual([group for group, _ in push.call_args.args[0]], [f'user_{self.users[1].id}'])
+        # offline users still get the row
+        self.assertEqual(Notification.objects.count(), 3)
+
+    @override_settings(NOTIFICATION_PRESENCE=False)
+    def test_everyone_is_online_when_disabled(self):
+        self.assertEqual(presence.online([self.users[0].id]), {self.users[0].id})
+
+    async def _connect(self):
+        communicator = WebsocketCommunicator(application, f'/ws/notifications/?token={self.token}')
+        connected, _ = await communicator.connect()
+        await communicator.receive_json_from()
+        online = presence.online([self.users[0].id])
+        await communicator.disconnect()
+        return connected, online
+
+    def test_sockets_register_presence(self):
+        connected, online = async_to_sync(self._connect)()
+        self.assertTrue(connected)
+        self.assertEqual(online, {self.users[0].id})
+        self.assertEqual(presence.online([self.users[0].id]), set())
+
+
+class RoleGroupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        past = timezone.now() - timedelta(days=1)
+        self.agent = User.objects.create_user(email='agent@test.com', name='Agent', role='agent', date_joined=past)
+        self.other = User.objects.create_user(email='other@test.com', name='Other', role='agent', date_joined=past)
+        self.token = str(AccessToken.for_user(self.agent))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.for_all = utils.broadcast('From someone else', audience=BroadcastNotification.Audience.STAFF, exclude_user=self.other)
+            self.own = utils.broadcast('Own announcement', audience=BroadcastNotification.Audience.STAFF, exclude_user=self.agent)
+        self.messages = [
+            {'type': 'broadcast', 'payload': utils.broadcast_payload(notif), 'exclude_user': notif.exclude_user_id}
+            for notif in (self.own, self.for_all)
+        ]
+
+    async def _receive_broadcasts(self):
+        communicator = WebsocketCommunicator(application, f'/ws/notifications/?token={self.token}')
+        await communicator.connect()
+        await communicator.receive_json_from()
+        layer = get_channel_layer()
+        for message in self.messages:
+            await layer.group_send('role_agent', message)
+        received = await communicator.receive_json_from()
+        nothing_else = await communicator.receive_nothing()
+        await communicator.disconnect()
+        return received, nothing_else
+
+    def test_consumers_filter_role_messages_and_add_their_unseen_count(self):
+        received, nothing_else = async_to_sync(self._receive_broadcasts)()
+        self.assertEqual(received['title'], 'From someone else')
+        self.assertEqual(received['unseen_notifications'], 1)
+        # the sender's copy was dropped
+        self.assertTrue(nothing_else)
+
+
+@override_settings(NOTIFICATION_STREAM_KEEPALIVE=0.2)
+class NotificationStreamTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='agent@test.com', name='Agent', role='agent', date_joined=timezone.now() - timedelta(days=1))
+        Notification.objects.create(user=self.user, title='Booking approved')
+        self.token = str(AccessToken.for_user(self.user))
+
+    async def _stream(self):
+        response = await self.async_client.get('/api/notifications/stream/', {'token': self.token})
+        chunks = aiter(response.streaming_content)
+        received = [await anext(chunks)]
+        await get_channel_layer().group_send(
+            f'user_{self.user.id}', {'type': 'notify', 'payload': {'id': 1, 'kind': 'personal', 'title': 'Booking reminder'}},
+        )
+        received.append(await anext(chunks))
+        received.append(await anext(chunks))
+        await chunks.aclose()
+        return response, [chunk.decode() for chunk in received]
+
+    def test_streams_counts_notifications_and_keepalives(self):
+        response, chunks = async_to_sync(self._stream)()
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(chunks[0], 'event: unseen_notifications\ndata: {"count": 1}\n\n')
+        self.assertTrue(chunks[1].startswith('event: notification\n'))
+        self.assertEqual(json.loads(chunks[1].split('data: ')[1])['title'], 'Booking reminder')
+        self.assertEqual(chunks[2], ': keepalive\n\n')
+
+    def test_rejects_missing_token(self):
+        response = self.client.get('/api/notifications/stream/')
+        self.assertEqual(response.status_code, 401)
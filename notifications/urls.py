@@ -1,7 +1,11 @@
 from django.urls import path
-from .views import NotificationList
+from .stream import notification_stream
+from .views import MarkReadView, NotificationList, NotificationPreferenceView
 
 urlpatterns = [
     path("list/", NotificationList.as_view(), name="notification-list"),
-    path("list/<int:pk>/", NotificationList.as_view(), name="notification-list"),
+    path("list/<str:pk>/", NotificationList.as_view(), name="notification-list"),
+    path("mark-read/", MarkReadView.as_view(), name="notification-mark-read"),
+    path("preferences/", NotificationPreferenceView.as_view(), name="notification-preferences"),
+    path("stream/", notification_stream, name="notification-stream"),
 ]
\ No newline at end of file
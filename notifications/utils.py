@@ -1,94 +1,276 @@
+import asyncio
+import logging
 
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Q, Value
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 
-from .models import Notification
+from . import counters, presence
+from .models import BroadcastNotification, BroadcastReceipt, BroadcastWatermark, Notification
 
-User = get_user_model()
+logger = logging.getLogger(__name__)
+
+FANOUT_CHUNK_SIZE = 1000
+# broadcasts and personal notifications have separate id sequences, so
+# clients get broadcast ids with this prefix and can echo them back as is
+BROADCAST_ID_PREFIX = "b"
 
-def create_notification_for_customers(user,title: str, data=None):
-    data = data or {}
-    customers = User.objects.exclude(id=user.id)
 
+def notification_payload(notif):
+    return {
+        "id": notif.id,
+        "kind": "personal",
+        "title": notif.title,
+        "data": notif.data,
+        "is_read": notif.is_read,
+        "created_at": notif.created_at.isoformat(),
+    }
+
+
+async def _send_all(messages):
     channel_layer = get_channel_layer()
+    results = await asyncio.gather(
+        *(channel_layer.group_send(group, message) for group, message in messages),
+        return_exceptions=True,
+    )
+    failed = [result for result in results if isinstance(result, Exception)]
+    if failed:
+        logger.warning("%s of %s notification pushes failed: %r", len(failed), len(messages), failed[0])
 
-    for user in customers:
-        notif = Notification.objects.create(
-            user=user,
-            title=title,
-            data=data,
-        )
 
-        async_to_sync(channel_layer.group_send)(
-            f"user_{user.id}",               
-            {
-                "type": "notify",           
-                "payload": {
-                    "id": notif.id,
-                    "title": notif.title,
-                    "data": notif.data,
-                    "is_read": notif.is_read,
-                    "created_at": notif.created_at.isoformat(),
-                },
-            },
-        )
+def push_all(messages):
+    """Send [(group, message)] concurrently from one event loop."""
+    if messages:
+        async_to_sync(_send_all)(messages)
 
 
-def create_notification_for_admin_manager_agent(user,title: str, data=None):
+def fan_out(user_ids, title: str, data=None):
+    """
+    Create one notification per user id with chunked bulk inserts and push
+    each chunk over the socket before writing the next, to users who are
+    online and did not ask for digests. Returns the count.
+    """
+    from .digests import digest_user_ids
+
     data = data or {}
-    customers = User.objects.exclude(id=user.id,role__in=["customer"])
+    user_ids = list(user_ids)
+    digest = digest_user_ids()
+    for offset in range(0, len(user_ids), FANOUT_CHUNK_SIZE):
+        chunk = user_ids[offset:offset + FANOUT_CHUNK_SIZE]
+        notifications = Notification.objects.bulk_create(
+            [Notification(user_id=user_id, title=title, data=data) for user_id in chunk]
+        )
+        counters.personal_created(chunk)
+        recipients = presence.online(chunk) - digest
+        push_all([
+            (f"user_{notif.user_id}", {"type": "notify", "payload": notification_payload(notif)})
+            for notif in notifications
+            if notif.user_id in recipients
+        ])
+    return len(user_ids)
 
-    channel_layer = get_channel_layer()
 
-    for user in customers:
-        notif = Notification.objects.create(
-            user=user,
-            title=title,
-            data=data,
-        )
+def client_id(kind, notification_id):
+    """The id clients see: personal ids as is, broadcast ids prefixed."""
+    return f"{BROADCAST_ID_PREFIX}{notification_id}" if kind == "broadcast" else notification_id
 
-        async_to_sync(channel_layer.group_send)(
-            f"user_{user.id}",               
-            {
-                "type": "notify",           
-                "payload": {
-                    "id": notif.id,
-                    "title": notif.title,
-                    "data": notif.data,
-                    "is_read": notif.is_read,
-                    "created_at": notif.created_at.isoformat(),
-                },
-            },
-        )
 
+def parse_client_id(value, kind=None):
+    """(kind, id) for an id from a client, or None if it is not one. `kind` is
+    only needed for unprefixed broadcast ids; it is None when not given."""
+    value = str(value)
+    if value.startswith(BROADCAST_ID_PREFIX):
+        kind, value = "broadcast", value[len(BROADCAST_ID_PREFIX):]
+    try:
+        return kind, int(value)
+    except ValueError:
+        return None
 
 
-def notify_admins_and_managers(title: str, data=None):
-    
-    data = data or {}
+def broadcast_payload(broadcast):
+    return {
+        "id": client_id("broadcast", broadcast.id),
+        "kind": "broadcast",
+        "title": broadcast.title,
+        "data": broadcast.data,
+        "is_read": False,
+        "created_at": broadcast.created_at.isoformat(),
+    }
 
-    users = User.objects.filter(role__in=["admin", "manager", "agent"])
 
-    channel_layer = get_channel_layer()
+def broadcast(title: str, data=None, audience=BroadcastNotification.Audience.ALL, exclude_user=None):
+    """
+    Store one BroadcastNotification for a whole audience and push it after
+    commit with one message per role group. No per-user rows are written.
+    """
+    notif = BroadcastNotification.objects.create(
+        title=title, data=data or {}, audience=audience, exclude_user=exclude_user,
+    )
+    transaction.on_commit(lambda: counters.broadcast_created(notif))
+    from .jobs import push_broadcast
+    push_broadcast.enqueue(notif.id)
+    return notif
 
-    for user in users:
-        notif = Notification.objects.create(
-            user=user,
-            title=title,
-            data=data,
-        )
 
-        async_to_sync(channel_layer.group_send)(
-            f"user_{user.id}",
-            {
-                "type": "notify",
-                "payload": {
-                    "id": notif.id,
-                    "title": notif.title,
-                    "data": notif.data,
-                    "is_read": notif.is_read,
-                    "created_at": notif.created_at.isoformat(),
-                },
-            },
+def notify_roles(title: str, data=None, roles=None, exclude_id=None):
+    """
+    Notify every user with one of `roles` (everyone if None) except
+    `exclude_id`: a single broadcast when the roles form an audience,
+    otherwise a personal notification per user.
+    """
+    audience = BroadcastNotification.audience_of(roles)
+    if audience is None:
+        from .jobs import notify_users
+        notify_users.enqueue(title, data, roles=roles, exclude_id=exclude_id)
+        return None
+    exclude_user = get_user_model().objects.filter(id=exclude_id).first() if exclude_id else None
+    return broadcast(title, data, audience=audience, exclude_user=exclude_user)
+
+
+def unseen_count(user):
+    """Unread personal notifications plus unread broadcasts for `user` (cached)."""
+    return counters.unseen_count(user)
+
+
+def inbox(user, since_id=None, since_broadcast_id=None):
+    """
+    Personal notifications and broadcasts for `user`, newest first, as one
+    UNION query of dicts (id, kind, title, data, read, created_at, recipient).
+    `since_id` / `since_broadcast_id` keep only personal notifications /
+    broadcasts with a greater id.
+    """
+    fields = ("id", "title", "data", "created_at", "read", "kind", "recipient")
+    personal = Notification.objects.filter(user=user)
+    broadcasts = BroadcastNotification.visible_to(user)
+    if since_id is not None:
+        personal = personal.filter(id__gt=since_id)
+    if since_broadcast_id is not None:
+        broadcasts = broadcasts.filter(id__gt=since_broadcast_id)
+    personal = personal.annotate(
+        read=F("is_read"), kind=Value("personal"), recipient=F("user_id"),
+    ).order_by().values(*fields)
+    broadcasts = broadcasts.annotate(
+        read=BroadcastNotification.read_by(user),
+        kind=Value("broadcast"),
+        recipient=Value(user.id),
+    ).order_by().values(*fields)
+    return personal.union(broadcasts, all=True).order_by("-created_at", "-id")
+
+
+def changes_since(user, since_id, since_broadcast_id=None, limit=100):
+    """
+    Delta feed for pollers: None when nothing newer than the cursors exists
+    (answered from the latest-id markers, cached when NOTIFICATION_COUNTER_CACHE
+    is on), otherwise up to `limit` new items oldest first, the unseen count
+    and the cursors to send next time. Broadcasts are only included when
+    `since_broadcast_id` is given.
+    """
+    latest_id, latest_broadcast_id = counters.latest_ids(user)
+    new_personal = latest_id > since_id
+    new_broadcasts = since_broadcast_id is not None and latest_broadcast_id > since_broadcast_id
+    if not (new_personal or new_broadcasts):
+        return None
+
+    if since_broadcast_id is None:
+        since_broadcast_id = latest_broadcast_id
+    items = list(inbox(user, since_id=since_id, since_broadcast_id=since_broadcast_id).order_by("created_at", "id")[:limit + 1])
+    has_more = len(items) > limit
+    items = items[:limit]
+    if has_more:
+        # oldest first, so the next poll picks up right after the last item returned
+        latest_id = max([since_id] + [item["id"] for item in items if item["kind"] == "personal"])
+        latest_broadcast_id = max([since_broadcast_id] + [item["id"] for item in items if item["kind"] == "broadcast"])
+    return {
+        "notifications": items,
+        "has_more": has_more,
+        "unseen_count": unseen_count(user),
+        "latest_id": latest_id,
+        "latest_broadcast_id": latest_broadcast_id,
+    }
+
+
+def mark_read(user, notification_id, kind=None):
+    """
+    Mark one notification or broadcast read, given the id clients see (see
+    client_id) and optionally its kind. Returns (kind, id) of what was marked,
+    or None if `user` can't see it.
+
+    An unprefixed id without a kind is a personal notification, or else a
+    broadcast: clients from before the prefix only ever sent the id.
+    """
+    parsed = parse_client_id(notification_id, kind)
+    if parsed is None:
+        return None
+    kind, notification_id = parsed
+
+    if kind != "broadcast":
+        notifications = Notification.objects.filter(id=notification_id, user=user)
+        if notifications.exists():
+            counters.personal_read(user.id, notifications.filter(is_read=False).update(is_read=True))
+            return "personal", notification_id
+        if kind == "personal":
+            return None
+
+    if not BroadcastNotification.visible_to(user).filter(id=notification_id).exists():
+        return None
+    _, created = BroadcastReceipt.objects.get_or_create(broadcast_id=notification_id, user=user)
+    if created:
+        counters.broadcast_read(user)
+    return "broadcast", notification_id
+
+
+def mark_many_read(user, ids=(), broadcast_ids=(), up_to_id=None, before=None):
+    """
+    Bulk mark-read for `user`: personal notifications by id (`ids`) or up to
+    an id (`up_to_id`), broadcasts by id (`broadcast_ids`), and everything
+    created up to `before`. Personal selectors are combined into one UPDATE;
+    broadcasts take one INSERT of receipts and one watermark upsert.
+    Returns how many notifications were marked read.
+    """
+    marked = 0
+
+    personal = Q()
+    if ids:
+        personal |= Q(id__in=ids)
+    if up_to_id is not None:
+        personal |= Q(id__lte=up_to_id)
+    if before is not None:
+        personal |= Q(created_at__lte=before)
+    if personal:
+        updated = Notification.objects.filter(personal, user=user, is_read=False).update(is_read=True)
+        counters.personal_read(user.id, updated)
+        marked += updated
+
+    if broadcast_ids:
+        unread = list(BroadcastNotification.unread_by(user).filter(id__in=broadcast_ids).values_list("id", flat=True))
+        BroadcastReceipt.objects.bulk_create(
+            [BroadcastReceipt(broadcast_id=broadcast_id, user=user) for broadcast_id in unread],
+            ignore_conflicts=True,
         )
+        counters.broadcast_read(user, len(unread))
+        marked += len(unread)
+
+    if before is not None:
+        unread = BroadcastNotification.unread_by(user).filter(created_at__lte=before).count()
+        if not BroadcastWatermark.objects.filter(user=user, read_until__lt=before).update(read_until=before):
+            BroadcastWatermark.objects.get_or_create(user=user, defaults={"read_until": before})
+        counters.broadcast_read(user, unread)
+        marked += unread
+
+    return marked
+
+
+def create_notification_for_customers(user,title: str, data=None):
+    broadcast(title, data, exclude_user=user)
+
+
+def create_notification_for_admin_manager_agent(user,title: str, data=None):
+    from .coalescing import notify
+    notify(title, data, roles=["admin", "manager", "agent"], exclude_id=user.id)
+
+
+def notify_admins_and_managers(title: str, data=None):
+    from .coalescing import notify
+    notify(title, data, roles=["admin", "manager", "agent"])
@@ -34,8 +34,9 @@ from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 
-from .models import Notification
-from .serializers import NotificationSerializer
+from .models import BroadcastNotification, Notification, NotificationPreference
+from .serializers import InboxItemSerializer, MarkReadSerializer, NotificationPreferenceSerializer, NotificationSerializer
+from .utils import broadcast_payload, changes_since, inbox, mark_many_read, mark_read, unseen_count
 # from .pagination import NotificationPagination
 from villas.views import StandardResultsSetPagination
 
@@ -46,30 +47,81 @@ class NotificationList(APIView):
     def get(self, request, pk=None):
         user = request.user
 
-        # ===== Single Notification Read =====
+        # ===== Single Notification Read (broadcast ids are prefixed, or ?kind=broadcast) =====
         if pk:
-            try:
-                notification = Notification.objects.get(user=user, id=pk)
-            except Notification.DoesNotExist:
+            marked = mark_read(user, pk, request.GET.get("kind"))
+            if marked is None:
                 return Response({"error": "Notification not found"}, status=404)
 
-            notification.is_read = True
-            notification.save()
+            kind, notification_id = marked
+            if kind == "broadcast":
+                data = {**broadcast_payload(BroadcastNotification.objects.get(id=notification_id)), "user": user.id, "is_read": True}
+            else:
+                data = NotificationSerializer(Notification.objects.get(id=notification_id)).data
 
             return Response({
-                "notification": NotificationSerializer(notification).data,
+                "notification": data,
                 "message": "Notification marked as read"
             }, status=status.HTTP_200_OK)
 
-        # ===== All Notifications with Pagination =====
-        notifications = Notification.objects.filter(user=user).order_by('-id')
-
+        # ===== Delta sync: ?since_id=<id>&since_broadcast_id=<id> =====
+        if "since_id" in request.GET:
+            try:
+                since_id = int(request.GET["since_id"])
+                since_broadcast_id = request.GET.get("since_broadcast_id")
+                since_broadcast_id = int(since_broadcast_id) if since_broadcast_id is not None else None
+            except ValueError:
+                return Response({"error": "since_id and since_broadcast_id must be integers"}, status=400)
+
+            changes = changes_since(user, since_id, since_broadcast_id)
+            if changes is None:
+                return Response(status=status.HTTP_304_NOT_MODIFIED)
+            changes["notifications"] = InboxItemSerializer(changes["notifications"], many=True).data
+            return Response(changes, status=status.HTTP_200_OK)
+
+        # ===== Personal notifications and broadcasts, with Pagination =====
         paginator = StandardResultsSetPagination()
-        paginated_qs = paginator.paginate_queryset(notifications, request)
+        paginated_qs = paginator.paginate_queryset(inbox(user), request)
 
         response_data = {
-            "unseen_count": notifications.filter(is_read=False).count(),
-            "notifications": NotificationSerializer(paginated_qs, many=True).data
+            "unseen_count": unseen_count(user),
+            "notifications": InboxItemSerializer(paginated_qs, many=True).data
         }
 
         return paginator.get_paginated_response(response_data)
+
+
+class MarkReadView(APIView):
+    """
+    POST {"ids": [...], "broadcast_ids": [...], "up_to_id": n, "before": iso, "all": true}
+    (any combination) to mark many notifications read at once.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = MarkReadSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        marked = mark_many_read(request.user, **serializer.validated_data)
+        return Response({
+            "marked": marked,
+            "unseen_count": unseen_count(request.user),
+        }, status=status.HTTP_200_OK)
+
+
+class NotificationPreferenceView(APIView):
+    """GET or PUT {"delivery": "instant" | "digest", "digest_hours": n} for the current user."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        preference = NotificationPreference.objects.filter(user=request.user).first() or NotificationPreference(user=request.user)
+        return Response(NotificationPreferenceSerializer(preference).data, status=status.HTTP_200_OK)
+
+    def put(self, request):
+        preference = NotificationPreference.objects.filter(user=request.user).first() or NotificationPreference(user=request.user)
+        serializer = NotificationPreferenceSerializer(preference, data=request.data, partial=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_200_OK)
@@ -0,0 +1,95 @@
+"""
+Cached analytics summaries, keyed by kind, range label and dates.
+
+Invalidations come from whichever process flushes analytics, so the cache is
+only used with ANALYTICS_CACHE on, which needs a CACHE_BACKEND shared by every
+process (see the villas.E001 check). Otherwise nothing is cached.
+"""
+import time
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+
+GENERATION_KEY = "analytics:summary:generation"
+# closed ranges are dropped through the generation stamps; the timeout only
+# bounds how long a summary computed while an invalidation raced it can live
+CLOSED_RANGE_TTL = 24 * 60 * 60
+
+
+def _key(kind, label, start_date, end_date):
+    return f"analytics:{kind}:{label}:{start_date.isoformat()}:{end_date.isoformat()}"
+
+
+def _month_key(day):
+    return f"{GENERATION_KEY}:{day.year:04d}-{day.month:02d}"
+
+
+def _stamp_keys(first, last):
+    keys = [GENERATION_KEY]
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        keys.append(_month_key(date(year, month, 1)))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return keys
+
+
+def _stamps(keys):
+    current = cache.get_many(keys)
+    return {key: current.get(key, 0) for key in keys}
+
+
+def get_summary(kind, label, start_date, end_date):
+    if not settings.ANALYTICS_CACHE:
+        return None
+    entry = cache.get(_key(kind, label, start_date, end_date))
+    if entry is None:
+        return None
+    stamps, data = entry
+    # a month the summary was computed from has changed since
+    if _stamps(list(stamps)) != stamps:
+        return None
+    return data
+
+
+def set_summary(kind, label, start_date, end_date, data, covers=None):
+    """
+    Cache a computed summary. Ranges that still include today expire after
+    ANALYTICS_CACHE_TTL seconds; closed ranges live until a day they cover is
+    invalidated. `covers` is the (first, last) span of days the data was
+    computed from, when wider than the requested range (e.g. a comparison
+    period).
+    """
+    if not settings.ANALYTICS_CACHE:
+        return
+    first, last = covers or (start_date, end_date)
+    timeout = settings.ANALYTICS_CACHE_TTL if end_date >= timezone.now().date() else CLOSED_RANGE_TTL
+    entry = (_stamps(_stamp_keys(first, last)), data)
+    cache.set(_key(kind, label, start_date, end_date), entry, timeout)
+
+
+def invalidate(dates=None):
+    """
+    Drop cached summaries whose range covers any of `dates`, or all of them
+    when `dates` is None (e.g. after property or agent changes).
+
+    Only days before today count: summaries that include today already expire
+    after ANALYTICS_CACHE_TTL, so the steady stream of flushes for today does
+    not throw them away. Invalidation sets a fresh generation stamp per
+    affected month rather than rewriting a shared index, so concurrent writers
+    cannot lose each other's updates.
+    """
+    if not settings.ANALYTICS_CACHE:
+        return
+    generation = time.time_ns()
+    if dates is None:
+        cache.set(GENERATION_KEY, generation, None)
+        return
+
+    today = timezone.now().date()
+    days = {date.fromisoformat(day) if isinstance(day, str) else day for day in dates}
+    keys = {_month_key(day) for day in days if day < today}
+    if keys:
+        cache.set_many(dict.fromkeys(keys, generation), None)
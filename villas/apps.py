@@ -5,3 +5,6 @@ class VillasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'villas'
     verbose_name = 'Villas'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
@@ -0,0 +1,117 @@
+"""
+In-process accumulation of analytics events.
+
+Beacon events (impressions, gallery opens, brochure clicks) as well as property
+views, brochure downloads and confirmed bookings are counted in memory per
+(property, day) and written through flush_analytics in one batch
+when ANALYTICS_BUFFER_MAX_EVENTS have accumulated or ANALYTICS_BUFFER_INTERVAL
+seconds after the first pending event, whichever comes first. Thousands of
+events per second turn into a handful of counter UPDATEs per interval, and
+the rollup rows (including the portfolio-wide ones every hit would otherwise
+contend on) are written once per interval rather than once per event. Visitor
+hashes are collected per (property, day) as well and merged into the
+unique-visitor sketches once per flush.
+
+Each event is still appended to the event log straight away, so a crash loses
+at most one interval of counters and those can be replayed from the log.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from . import eventlog
+
+
+logger = logging.getLogger(__name__)
+
+# beacon event name -> DailyAnalytics counter
+BEACON_EVENTS = {
+    "impression": "impressions",
+    "gallery_open": "gallery_opens",
+    "brochure_click": "brochure_clicks",
+}
+
+_lock = threading.Lock()
+_pending = defaultdict(Counter)
+_visitors = defaultdict(set)
+_size = 0
+_timer = None
+
+
+def add(events, visitor=None):
+    """
+    Count `events`, an iterable of (property_id, field) pairs, for the next flush.
+    `visitor` is the hash of the visitor behind the events, recorded in the
+    event log and merged into the unique-visitor sketches.
+    """
+    global _size, _timer
+    today = timezone.now().date()
+    added = 0
+    with _lock:
+        for property_id, field in events:
+            eventlog.append_event(field, property_id, visitor or 0)
+            _pending[(property_id, today)][field] += 1
+            if visitor:
+                _visitors[(property_id, today)].add(visitor)
+            added += 1
+        _size += added
+        full = _size >= settings.ANALYTICS_BUFFER_MAX_EVENTS
+        if added and not full and _timer is None:
+            _timer = threading.Timer(settings.ANALYTICS_BUFFER_INTERVAL, _flush_in_background)
+            _timer.daemon = True
+            _timer.start()
+    if full:
+        flush()
+
+
+def _take():
+    global _size, _timer
+    with _lock:
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+        deltas = {key: dict(counts) for key, counts in _pending.items()}
+        visitors = dict(_visitors)
+        _pending.clear()
+        _visitors.clear()
+        _size = 0
+    return deltas, visitors
+
+
+def flush():
+    """Write everything pending; returns the number of events written."""
+    global _size
+    from .utils import flush_analytics
+
+    deltas, visitors = _take()
+    if not deltas:
+        return 0
+    try:
+        flush_analytics(deltas, visitors)
+    except Exception:
+        logger.exception("Could not flush %s buffered analytics rows", len(deltas))
+        # put the counters back so the next flush retries them
+        with _lock:
+            for key, counts in deltas.items():
+                _pending[key].update(counts)
+                _size += sum(counts.values())
+            for key, hashes in visitors.items():
+                _visitors[key].update(hashes)
+        return 0
+    return sum(sum(counts.values()) for counts in deltas.values())
+
+
+def _flush_in_background():
+    try:
+        flush()
+    finally:
+        # timer threads get their own database connection; don't leak it
+        connection.close()
+
+
+atexit.register(flush)
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """Analytics summaries are invalidated across processes through the cache."""
+    if settings.ANALYTICS_CACHE and not settings.CACHE_IS_SHARED:
+        return [
+            Error(
+                "ANALYTICS_CACHE needs a cache shared by every process.",
+                hint="Set CACHE_BACKEND to Redis or Memcached, or turn ANALYTICS_CACHE off.",
+                obj="ANALYTICS_CACHE",
+                id="villas.E001",
+            )
+        ]
+    return []
@@ -0,0 +1,90 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from auditlog.models import LogEntry
+from activityLog.serializers import LogEntrySerializer
+from .models import Booking, DashboardCounter, Property, Review
+
+
+RECENT_ACTIVITY_LIMIT = 10
+
+
+def build_snapshot():
+    """
+    Recompute the dashboard counters from scratch and store them in place.
+    The existing rows are locked before counting: adjustments from saves that
+    have not committed yet wait for the rebuild and then land on top of a
+    count that did not include them, so none are lost.
+    """
+    User = get_user_model()
+
+    with transaction.atomic():
+        rows = {row.name: row for row in DashboardCounter.objects.select_for_update()}
+
+        counts = {
+            "properties": Property.objects.count(),
+            "agents": User.objects.filter(role="agent").count(),
+            "reviews": Review.objects.count(),
+            "pending_bookings": Booking.objects.filter(status=Booking.STATUS.Pending).count(),
+        }
+        # every status and listing type gets a row, so adjust() never has to create one
+        counts.update({f"status:{value}": 0 for value in Property.StatusType.values})
+        counts.update({f"listing_type:{value}": 0 for value in Property.ListingType.values})
+        for field in ("status", "listing_type"):
+            for row in Property.objects.order_by().values(field).annotate(total=Count("id")):
+                counts[f"{field}:{row[field]}"] = row["total"]
+
+        now = timezone.now()
+        for name, row in rows.items():
+            row.value, row.updated_at = counts.get(name, 0), now
+        DashboardCounter.objects.bulk_update(rows.values(), ["value", "updated_at"])
+        DashboardCounter.objects.bulk_create(
+            [DashboardCounter(name=name, value=n) for name, n in counts.items() if name not in rows],
+            ignore_conflicts=True,
+        )
+        DashboardCounter.objects.exclude(name__in=counts).delete()
+    return counts
+
+
+def get_snapshot():
+    """The dashboard counters ({name: n}) plus when they last changed."""
+    rows = list(DashboardCounter.objects.values_list("name", "value", "updated_at"))
+    if not rows:
+        return build_snapshot(), timezone.now()
+    counts = {name: n for name, n, _ in rows}
+    return counts, max(updated_at for _, _, updated_at in rows)
+
+
+def adjust(changes):
+    """
+    Apply counter deltas ({name: +/-n}) with one F() update per counter, so
+    concurrent saves never wait on each other for figures they don't share.
+    Nothing is written while the counters have not been built; the first
+    read builds them from scratch.
+    """
+    for name, n in changes.items():
+        if n:
+            DashboardCounter.objects.filter(name=name).update(value=F("value") + n, updated_at=timezone.now())
+
+
+def recent_activity():
+    """The latest audit log entries, read through the timestamp index."""
+    return LogEntrySerializer(LogEntry.objects.all()[:RECENT_ACTIVITY_LIMIT], many=True).data
+
+
+def as_response(counts, updated_at):
+    by_status = {value: counts.get(f"status:{value}", 0) for value in Property.StatusType.values}
+    by_listing_type = {value: counts.get(f"listing_type:{value}", 0) for value in Property.ListingType.values}
+    return {
+        "properties": counts.get("properties", 0),
+        "properties_active": by_status[Property.StatusType.PUBLISHED],
+        "reviews": counts.get("reviews", 0),
+        "users": counts.get("agents", 0),
+        "properties_by_status": by_status,
+        "properties_by_listing_type": by_listing_type,
+        "pending_bookings": counts.get("pending_bookings", 0),
+        "recent_activity": recent_activity(),
+        "updated_at": updated_at,
+    }
@@ -0,0 +1,286 @@
+"""
+Append-only analytics event log.
+
+Every process appends to its own fixed-size, memory-mapped segment file, so
+writers never contend across workers and an append is a 32-byte copy into
+mapped memory. A sidecar `.idx` file records (timestamp, record number) every
+INDEX_EVERY records so readers can jump close to a start time.
+
+Segment layout: a HEADER followed by RECORDs. Unused space is zero-filled and
+a record with timestamp 0 marks the end of the data.
+
+Each process start (and each full segment) opens a new segment.
+`manage.py prune_analytics_events` deletes segments whose newest record is
+older than ANALYTICS_EVENTLOG_RETENTION_DAYS, so the directory does not grow
+without bound. The newest record it ever deleted is remembered in a PRUNED
+file; replays only rebuild days after that one (see covered_from()).
+"""
+import itertools
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+
+from . import hll
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"EVLOG001"
+HEADER = struct.Struct("<8sIIqq")  # magic, version, record size, created (us), pid
+HEADER_SIZE = 64
+RECORD = struct.Struct("<qqQB7x")  # timestamp (us), property id, visitor hash, kind
+INDEX = struct.Struct("<qQ")  # timestamp (us), record number
+INDEX_EVERY = 1024
+PRUNED_FILE = "PRUNED"
+
+# Kind codes are stored on disk: append new ones, never renumber.
+EVENT_KINDS = {
+    "views": 1,
+    "downloads": 2,
+    "bookings": 3,
+    "gallery_opens": 4,
+    "brochure_clicks": 5,
+    "impressions": 6,
+}
+KIND_NAMES = {code: name for name, code in EVENT_KINDS.items()}
+
+
+def _now_us():
+    return time.time_ns() // 1000
+
+
+class SegmentWriter:
+    def __init__(self, directory, size):
+        self.created = _now_us()
+        self.pid = os.getpid()
+        self.path = os.path.join(directory, f"{self.created:020d}-{self.pid}.seg")
+        self.capacity = (size - HEADER_SIZE) // RECORD.size
+        self.count = 0
+        self.last_ts = 0
+
+        with open(self.path, "wb") as fh:
+            fh.truncate(HEADER_SIZE + self.capacity * RECORD.size)
+        self._file = open(self.path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._map[:HEADER.size] = HEADER.pack(MAGIC, 1, RECORD.size, self.created, self.pid)
+        self._index = open(self.path[:-4] + ".idx", "ab")
+
+    def append(self, timestamp, property_id, visitor, kind):
+        """Write one record; returns False when the segment is full."""
+        if self.count >= self.capacity:
+            return False
+        # keep timestamps monotonic within a segment so the index stays sorted
+        timestamp = max(timestamp, self.last_ts)
+        offset = HEADER_SIZE + self.count * RECORD.size
+        self._map[offset:offset + RECORD.size] = RECORD.pack(timestamp, property_id, visitor, kind)
+        if self.count % INDEX_EVERY == 0:
+            self._index.write(INDEX.pack(timestamp, self.count))
+            self._index.flush()
+        self.count += 1
+        self.last_ts = timestamp
+        return True
+
+    def close(self):
+        self._map.flush()
+        self._map.close()
+        self._file.close()
+        self._index.close()
+
+
+_lock = threading.Lock()
+_writer = None
+
+
+def _current_writer():
+    global _writer
+    if _writer is not None and _writer.pid == os.getpid():
+        return _writer
+    # first use, or we are a forked child that must not share the parent's segment
+    directory = str(settings.ANALYTICS_EVENTLOG_DIR)
+    os.makedirs(directory, exist_ok=True)
+    _writer = SegmentWriter(directory, settings.ANALYTICS_EVENTLOG_SEGMENT_SIZE)
+    return _writer
+
+
+def append_event(kind, property_id, visitor=0, timestamp=None):
+    """
+    Record one event. Never raises: the log must not break the request that
+    produced the event.
+    """
+    if not settings.ANALYTICS_EVENTLOG_ENABLED:
+        return
+    global _writer
+    timestamp = timestamp or _now_us()
+    try:
+        with _lock:
+            writer = _current_writer()
+            if not writer.append(timestamp, property_id, visitor, EVENT_KINDS[kind]):
+                writer.close()
+                _writer = None
+                _current_writer().append(timestamp, property_id, visitor, EVENT_KINDS[kind])
+    except Exception:
+        logger.exception("Could not append %s event for property %s", kind, property_id)
+
+
+def close():
+    global _writer
+    with _lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+
+
+def list_segments(directory=None):
+    directory = str(directory or settings.ANALYTICS_EVENTLOG_DIR)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".seg")
+    )
+
+
+def last_timestamp(path):
+    """Timestamp (us) of the newest record in a segment, or 0 when it is empty."""
+    last = 0
+    for timestamp, _, _, _ in read_segment(path, start_us=_last_indexed(path)):
+        last = timestamp
+    return last
+
+
+def prune(directory, before_us):
+    """
+    Delete segments (and their indexes) whose newest record is older than
+    `before_us`. Empty segments count by their creation time. The newest
+    deleted record is kept in the PRUNED file. Returns the number of segments
+    removed.
+    """
+    removed = 0
+    pruned_through = _pruned_through(directory)
+    for path in list_segments(directory):
+        try:
+            created = int(os.path.basename(path).split("-")[0])
+            last = last_timestamp(path)
+            if (last or created) >= before_us:
+                continue
+            # remember what goes before deleting it, so replays never trust a gap
+            if last > pruned_through:
+                pruned_through = last
+                _write_pruned_through(directory, pruned_through)
+            os.remove(path)
+            if os.path.exists(path[:-4] + ".idx"):
+                os.remove(path[:-4] + ".idx")
+            removed += 1
+        except (OSError, ValueError):
+            logger.exception("Could not prune event log segment %s", path)
+    return removed
+
+
+def _pruned_through(directory):
+    try:
+        with open(os.path.join(directory, PRUNED_FILE)) as fh:
+            return int(fh.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def _write_pruned_through(directory, timestamp):
+    path = os.path.join(directory, PRUNED_FILE)
+    with open(path + ".tmp", "w") as fh:
+        fh.write(str(timestamp))
+    os.replace(path + ".tmp", path)
+
+
+def covered_from(directory=None):
+    """
+    First day (UTC) the log still holds every event for: the day after the
+    newest pruned record, or the day of the oldest retained record when
+    nothing has been pruned. None when the log is empty.
+    """
+    directory = str(directory or settings.ANALYTICS_EVENTLOG_DIR)
+    pruned_through = _pruned_through(directory)
+    if pruned_through:
+        return _day(pruned_through) + timedelta(days=1)
+    oldest = [
+        record[0]
+        for path in list_segments(directory)
+        for record in itertools.islice(read_segment(path), 1)
+    ]
+    return _day(min(oldest)) if oldest else None
+
+
+def _day(timestamp_us):
+    return datetime.fromtimestamp(timestamp_us / 1_000_000, tz=dt_timezone.utc).date()
+
+
+def read_segment(path, start_us=None, end_us=None):
+    """Yield (timestamp_us, property_id, visitor, kind) for records in [start_us, end_us]."""
+    with open(path, "rb") as fh:
+        if os.fstat(fh.fileno()).st_size <= HEADER_SIZE:
+            return
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, _, record_size, _, _ = HEADER.unpack_from(data, 0)
+            if magic != MAGIC or record_size != RECORD.size:
+                raise ValueError(f"{path} is not an analytics event segment")
+
+            first = 0
+            if start_us is not None:
+                first = _seek(path, start_us)
+            capacity = (len(data) - HEADER_SIZE) // RECORD.size
+            for number in range(first, capacity):
+                record = RECORD.unpack_from(data, HEADER_SIZE + number * RECORD.size)
+                timestamp = record[0]
+                if timestamp == 0 or (end_us is not None and timestamp > end_us):
+                    break
+                if start_us is None or timestamp >= start_us:
+                    yield record
+
+
+def _index_entries(path):
+    index_path = path[:-4] + ".idx"
+    if not os.path.exists(index_path):
+        return []
+    with open(index_path, "rb") as fh:
+        raw = fh.read()
+    return [INDEX.unpack_from(raw, offset) for offset in range(0, len(raw) - INDEX.size + 1, INDEX.size)]
+
+
+def _last_indexed(path):
+    """Timestamp of the last indexed record, to start a scan for the newest one."""
+    entries = _index_entries(path)
+    return entries[-1][0] if entries else None
+
+
+def _seek(path, start_us):
+    """Record number to start scanning from, using the sparse time index."""
+    entries = _index_entries(path)
+    # last indexed record strictly before start_us; nothing earlier can match
+    position = bisect_left([timestamp for timestamp, _ in entries], start_us) - 1
+    return entries[position][1] if position >= 0 else 0
+
+
+def count_segment(args):
+    """
+    Worker entry point for replays. Returns per-day counters for one segment
+    as {(property_id, date, kind_name): n} and visitor sketches as
+    {(property_id, date): registers}. Reads files only, no database access.
+    """
+    path, start_us, end_us = args
+    counts = Counter()
+    sketches = defaultdict(hll.empty)
+    for timestamp, property_id, visitor, kind in read_segment(path, start_us, end_us):
+        name = KIND_NAMES.get(kind)
+        if name is None:
+            continue
+        day = _day(timestamp)
+        counts[(property_id, day, name)] += 1
+        if visitor and name == "views":
+            hll.add(sketches[(property_id, day)], visitor)
+    return counts, dict(sketches)
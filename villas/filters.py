@@ -1,4 +1,5 @@
 from django_filters import rest_framework as filters
+from rest_framework.filters import OrderingFilter
 from .models import Property
 from datetime import date
 
@@ -15,4 +16,18 @@ class PropertyFilter(filters.FilterSet):
 
     class Meta:
         model = Property
-        fields = ['title', 'min_price', 'max_price', 'min_beds', 'min_baths', 'guests']
\ No newline at end of file
+        fields = ['title', 'min_price', 'max_price', 'min_beds', 'min_baths', 'guests']
+
+
+class PropertyOrderingFilter(OrderingFilter):
+    """`?ordering=popularity` ranks the most popular first, `-popularity` the least."""
+    descending = {'popularity'}
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        return [self._flip(term) for term in ordering] if ordering else ordering
+
+    def _flip(self, term):
+        if term.lstrip('-') not in self.descending:
+            return term
+        return term[1:] if term.startswith('-') else f'-{term}'
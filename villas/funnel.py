@@ -0,0 +1,118 @@
+"""
+Impression -> view -> download -> booking conversion funnels per property, per agent and
+portfolio-wide, with a comparison against the preceding period of equal length.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+
+from list_vila.models import ContectUs
+from .models import Property
+from .rollups import COUNTER_FIELDS, property_range_totals
+from .visitors import unique_visitors
+
+
+STEPS = ("impressions", "views", "downloads", "bookings")
+
+
+def previous_period(start_date, end_date):
+    length = (end_date - start_date).days + 1
+    return start_date - timedelta(days=length), start_date - timedelta(days=1)
+
+
+def _ratio(numerator, denominator):
+    return round(numerator / denominator, 4) if denominator else None
+
+
+def _change(current, previous):
+    return {
+        "previous": previous,
+        "change": current - previous,
+        "change_pct": round((current - previous) * 100 / previous, 2) if previous else None,
+    }
+
+
+def funnel(current, previous):
+    """Counts, conversion ratios and period-over-period deltas for one scope."""
+    result = dict(current)
+    result["impression_to_view"] = _ratio(current["views"], current["impressions"])
+    result["view_to_download"] = _ratio(current["downloads"], current["views"])
+    result["view_to_booking"] = _ratio(current["bookings"], current["views"])
+    result["download_to_booking"] = _ratio(current["bookings"], current["downloads"])
+    result["previous_view_to_booking"] = _ratio(previous["bookings"], previous["views"])
+    result["deltas"] = {step: _change(current[step], previous.get(step, 0)) for step in current}
+    return result
+
+
+def _add(into, counts):
+    for field in COUNTER_FIELDS:
+        into[field] += counts[field]
+
+
+def build_report(start_date, end_date, properties=None, portfolio=True):
+    """
+    Funnel report for `properties` (a Property queryset, default all).
+    Portfolio-wide figures add contact-form inquiries and unique visitors,
+    which are not tied to a property, only when `portfolio` is set.
+    """
+    previous_start, previous_end = previous_period(start_date, end_date)
+    properties = (properties if properties is not None else Property.objects.all()).order_by("id")
+
+    scope = {row["id"]: row for row in properties.values("id", "title", "assigned_agent_id")}
+    ids = list(scope)
+    current = property_range_totals(start_date, end_date, ids)
+    previous = property_range_totals(previous_start, previous_end, ids)
+    zero = dict.fromkeys(COUNTER_FIELDS, 0)
+
+    property_rows = []
+    agent_current = defaultdict(lambda: dict(zero))
+    agent_previous = defaultdict(lambda: dict(zero))
+    total_current, total_previous = dict(zero), dict(zero)
+    for property_id, row in scope.items():
+        now, before = current.get(property_id, zero), previous.get(property_id, zero)
+        property_rows.append({
+            "id": property_id,
+            "title": row["title"],
+            "agent_id": row["assigned_agent_id"],
+            **funnel({step: now[step] for step in STEPS}, before),
+        })
+        _add(total_current, now)
+        _add(total_previous, before)
+        if row["assigned_agent_id"]:
+            _add(agent_current[row["assigned_agent_id"]], now)
+            _add(agent_previous[row["assigned_agent_id"]], before)
+
+    names = dict(get_user_model().objects.filter(pk__in=list(agent_current)).values_list("id", "name"))
+    agent_rows = [
+        {
+            "id": agent_id,
+            "name": names.get(agent_id),
+            **funnel({step: agent_current[agent_id][step] for step in STEPS}, agent_previous[agent_id]),
+        }
+        for agent_id in sorted(agent_current)
+    ]
+
+    totals_now = {step: total_current[step] for step in STEPS}
+    if portfolio:
+        inquiries = ContectUs.objects.filter(created_at__date__gte=start_date, created_at__date__lte=end_date).count()
+        previous_inquiries = ContectUs.objects.filter(created_at__date__gte=previous_start, created_at__date__lte=previous_end).count()
+        visitors = unique_visitors(start_date, end_date)
+        previous_visitors = unique_visitors(previous_start, previous_end)
+        totals_now = {"unique_visitors": visitors, **totals_now, "inquiries": inquiries}
+        total_previous = {**total_previous, "unique_visitors": previous_visitors, "inquiries": previous_inquiries}
+
+    portfolio_row = funnel(totals_now, total_previous)
+    if portfolio:
+        portfolio_row["visitor_to_booking"] = _ratio(totals_now["bookings"], totals_now["unique_visitors"])
+        portfolio_row["visitor_to_inquiry"] = _ratio(totals_now["inquiries"], totals_now["unique_visitors"])
+
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "previous_start_date": previous_start,
+        "previous_end_date": previous_end,
+        "portfolio": portfolio_row,
+        "agents": agent_rows,
+        "properties": property_rows,
+    }
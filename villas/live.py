@@ -0,0 +1,90 @@
+"""
+Live dashboard counters.
+
+Deltas recorded in this process (analytics flushes, new bookings, new
+inquiries) are coalesced and broadcast to the "dashboard" channel group at
+most once per DASHBOARD_PUSH_INTERVAL seconds, so any number of open
+dashboards cost one group_send per interval instead of one poll each.
+
+Every process coalesces its own deltas, and the send slot for an interval is
+claimed with cache.add, so the limit holds across processes when the
+CACHE_BACKEND is shared. With a per-process cache it is per process.
+"""
+import logging
+import math
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+
+
+logger = logging.getLogger(__name__)
+
+GROUP = "dashboard"
+SLOT_KEY = "villas:dashboard:push"
+
+_lock = threading.Lock()
+_pending = Counter()
+_timer = None
+_last_sent = 0.0
+
+
+def record(counts):
+    """Queue counter deltas ({name: n}) for the next push."""
+    counts = {name: n for name, n in counts.items() if n}
+    if not counts:
+        return
+    with _lock:
+        _pending.update(counts)
+        if _timer is not None:
+            return
+        _schedule(max(0.0, _last_sent + settings.DASHBOARD_PUSH_INTERVAL - time.monotonic()))
+
+
+def _schedule(delay):
+    global _timer
+    _timer = threading.Timer(delay, _tick)
+    _timer.daemon = True
+    _timer.start()
+
+
+def _tick():
+    """Push once this interval's slot is ours; otherwise another process just pushed."""
+    global _timer
+    try:
+        claimed = cache.add(SLOT_KEY, True, math.ceil(settings.DASHBOARD_PUSH_INTERVAL))
+    except Exception:
+        logger.exception("Could not claim the dashboard push slot")
+        claimed = True
+    if claimed:
+        flush()
+        return
+    with _lock:
+        _timer = None
+        if _pending:
+            _schedule(settings.DASHBOARD_PUSH_INTERVAL)
+
+
+def flush():
+    """Send everything pending now. Never raises."""
+    global _timer, _last_sent
+    with _lock:
+        if _timer is not None:
+            _timer.cancel()
+            _timer = None
+        counts = dict(_pending)
+        _pending.clear()
+        if not counts:
+            return
+        _last_sent = time.monotonic()
+
+    try:
+        channel_layer = get_channel_layer()
+        if channel_layer is not None:
+            async_to_sync(channel_layer.group_send)(GROUP, {"type": "dashboard.delta", "counts": counts})
+    except Exception:
+        logger.exception("Could not push dashboard counters %s", counts)
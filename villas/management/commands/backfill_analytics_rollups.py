@@ -0,0 +1,30 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from villas.rollups import backfill_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the weekly/monthly analytics rollups from DailyAnalytics'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start',
+            help='First day to rebuild, YYYY-MM-DD (default: all history)'
+        )
+        parser.add_argument(
+            '--end',
+            help='Last day to rebuild, YYYY-MM-DD (default: all history)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            start_date = date.fromisoformat(options['start']) if options['start'] else None
+            end_date = date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError:
+            raise CommandError('Use YYYY-MM-DD for --start and --end')
+
+        self.stdout.write(self.style.WARNING('Rebuilding analytics rollups...'))
+        written = backfill_rollups(start_date, end_date)
+        self.stdout.write(self.style.SUCCESS(f'✓ Wrote {written} rollup rows'))
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from villas import eventlog
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete analytics event log segments whose newest event is older than the retention window. '
+        'Run it from cron; replays can only rebuild the days that are kept.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.ANALYTICS_EVENTLOG_RETENTION_DAYS,
+            help=f'Keep segments with events from the last this many days (default: {settings.ANALYTICS_EVENTLOG_RETENTION_DAYS})'
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] <= 0:
+            raise CommandError('--days must be positive')
+        cutoff = eventlog._now_us() - options['days'] * 86_400_000_000
+        removed = eventlog.prune(str(settings.ANALYTICS_EVENTLOG_DIR), cutoff)
+        self.stdout.write(self.style.SUCCESS(f'✓ Pruned {removed} segments; replays cover {eventlog.covered_from() or "nothing"} onwards'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from villas.dashboard import build_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Recompute the admin dashboard snapshot (e.g. after bulk queryset updates that bypass signals)'
+
+    def handle(self, *args, **options):
+        counts = build_snapshot()
+        self.stdout.write(self.style.SUCCESS(f'✓ Dashboard snapshot rebuilt: {counts}'))
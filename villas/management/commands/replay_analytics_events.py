@@ -0,0 +1,112 @@
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from villas import eventlog, hll
+from villas.models import DailyAnalytics, Property, VisitorSketch
+from villas.rollups import COUNTER_FIELDS, backfill_rollups
+from villas.visitors import build_sketches
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild DailyAnalytics and the rollups from the analytics event log. '
+        'Daily rows and visitor sketches inside the replayed range are replaced by what the log contains.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--start',
+            help='First day to replay, YYYY-MM-DD (default: first day in the log)'
+        )
+        parser.add_argument(
+            '--end',
+            help='Last day to replay, YYYY-MM-DD (default: last day in the log)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Number of worker processes reading segments (default: 4)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count events without touching the database'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            start_date = date.fromisoformat(options['start']) if options['start'] else None
+            end_date = date.fromisoformat(options['end']) if options['end'] else None
+        except ValueError:
+            raise CommandError('Use YYYY-MM-DD for --start and --end')
+
+        start_us = _to_us(datetime.combine(start_date, time.min)) if start_date else None
+        end_us = _to_us(datetime.combine(end_date, time.max)) if end_date else None
+
+        segments = eventlog.list_segments()
+        if not segments:
+            raise CommandError('No event log segments found')
+        self.stdout.write(self.style.WARNING(f'Reading {len(segments)} segments...'))
+
+        tasks = [(path, start_us, end_us) for path in segments]
+        workers = max(1, options['workers'])
+        if workers == 1:
+            results = map(eventlog.count_segment, tasks)
+        else:
+            with Pool(min(workers, len(tasks))) as pool:
+                results = pool.map(eventlog.count_segment, tasks)
+
+        daily = defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+        sketches = {}
+        for counts, segment_sketches in results:
+            for (property_id, day, field), n in counts.items():
+                daily[(property_id, day)][field] += n
+            for key, registers in segment_sketches.items():
+                sketches[key] = hll.merge(sketches[key], registers) if key in sketches else registers
+
+        if not daily:
+            self.stdout.write(self.style.WARNING('No events in range'))
+            return
+
+        start_date = start_date or min(day for _, day in daily)
+        end_date = end_date or max(day for _, day in daily)
+        # earlier days lost events to pruning: replacing them would wipe history
+        covered = eventlog.covered_from()
+        if covered is not None and start_date < covered:
+            if covered > end_date:
+                raise CommandError(f'The event log only covers {covered} onwards; nothing in range can be replayed')
+            self.stdout.write(self.style.WARNING(
+                f'Skipping {start_date} to {covered - timedelta(days=1)}: events before {covered} were pruned from the log'
+            ))
+            start_date = covered
+            daily = {key: counts for key, counts in daily.items() if key[1] >= covered}
+            sketches = {key: registers for key, registers in sketches.items() if key[1] >= covered}
+        events = sum(sum(counts.values()) for counts in daily.values())
+        self.stdout.write(f'{events} events across {len(daily)} property-days, {start_date} to {end_date}')
+        if options['dry_run']:
+            return
+
+        existing = set(Property.objects.filter(pk__in={pk for pk, _ in daily}).values_list('pk', flat=True))
+        rows = [
+            DailyAnalytics(property_id=property_id, date=day, **counts)
+            for (property_id, day), counts in daily.items()
+            if property_id in existing
+        ]
+        visitor_rows = build_sketches({key: registers for key, registers in sketches.items() if key[0] in existing})
+        with transaction.atomic():
+            DailyAnalytics.objects.filter(date__gte=start_date, date__lte=end_date).delete()
+            DailyAnalytics.objects.bulk_create(rows, batch_size=1000)
+            VisitorSketch.objects.filter(date__gte=start_date, date__lte=end_date).delete()
+            VisitorSketch.objects.bulk_create(visitor_rows, batch_size=500)
+        backfill_rollups(start_date, end_date)
+
+        self.stdout.write(self.style.SUCCESS(f'✓ Replayed {len(rows)} daily rows'))
+
+
+def _to_us(value):
+    return int(value.replace(tzinfo=dt_timezone.utc).timestamp() * 1_000_000)
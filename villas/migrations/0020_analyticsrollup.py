@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('villas', '0019_remove_property_google_calendar_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Week'), ('month', 'Month')], max_length=5)),
+                ('period_start', models.DateField(help_text='Monday of the week or first day of the month')),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('bookings', models.PositiveIntegerField(default=0)),
+                ('downloads', models.PositiveIntegerField(default=0)),
+                ('property', models.ForeignKey(blank=True, help_text='Leave empty for the portfolio-wide rollup', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='analytics_rollups', to='villas.property')),
+            ],
+            options={
+                'ordering': ['-period_start'],
+                'constraints': [models.UniqueConstraint(fields=('property', 'period', 'period_start'), name='unique_property_analytics_rollup'), models.UniqueConstraint(condition=models.Q(('property__isnull', True)), fields=('period', 'period_start'), name='unique_global_analytics_rollup')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('villas', '0021_dashboardcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitorSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('registers', models.BinaryField()),
+                ('property', models.ForeignKey(blank=True, help_text='Leave empty for the portfolio-wide sketch', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='visitor_sketches', to='villas.property')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(fields=('property', 'date'), name='unique_property_visitor_sketch'), models.UniqueConstraint(condition=models.Q(('property__isnull', True)), fields=('date',), name='unique_global_visitor_sketch')],
+            },
+        ),
+    ]
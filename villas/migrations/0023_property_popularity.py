@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('villas', '0022_visitorsketch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='popularity',
+            field=models.FloatField(db_index=True, default=0, editable=False),
+        ),
+    ]
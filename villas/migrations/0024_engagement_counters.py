@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('villas', '0023_property_popularity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analyticsrollup',
+            name='brochure_clicks',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='analyticsrollup',
+            name='gallery_opens',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='analyticsrollup',
+            name='impressions',
+            field=models.PositiveIntegerField(default=0, help_text='Appearances in search results'),
+        ),
+        migrations.AddField(
+            model_name='dailyanalytics',
+            name='brochure_clicks',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dailyanalytics',
+            name='gallery_opens',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dailyanalytics',
+            name='impressions',
+            field=models.PositiveIntegerField(default=0, help_text='Appearances in search results'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-19 02:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('villas', '0024_engagement_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularityScale',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('epoch', models.DateTimeField()),
+                ('half_life_days', models.FloatField()),
+            ],
+        ),
+    ]
@@ -76,6 +76,9 @@ class Property(models.Model):
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # forward-decayed popularity score, see villas.popularity
+    popularity = models.FloatField(default=0, db_index=True, editable=False)
+
     # agent details
     assigned_agent = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='assigned_villas', help_text='Agent assigned to manage this villa', limit_choices_to={'role': 'agent'})
 
@@ -95,6 +98,13 @@ class Property(models.Model):
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = self._generate_unique_slug()
+        # popularity only changes through F() increments (villas.popularity);
+        # writing back the value loaded with the instance would undo them
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'popularity'
+            ]
         super().save(*args, **kwargs)
 
 
@@ -283,6 +293,9 @@ class DailyAnalytics(models.Model):
     views = models.PositiveIntegerField(default=0)
     bookings = models.PositiveIntegerField(default=0)
     downloads = models.PositiveIntegerField(default=0)
+    gallery_opens = models.PositiveIntegerField(default=0)
+    brochure_clicks = models.PositiveIntegerField(default=0)
+    impressions = models.PositiveIntegerField(default=0, help_text="Appearances in search results")
 
     class Meta:
         unique_together = ('property', 'date')
@@ -294,3 +307,80 @@ class DailyAnalytics(models.Model):
 
 
 
+
+
+
+class VisitorSketch(models.Model):
+    """HyperLogLog sketch of the visitors of a property (or all properties) on one day, see villas.hll."""
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, null=True, blank=True, related_name="visitor_sketches", help_text="Leave empty for the portfolio-wide sketch")
+    date = models.DateField()
+    registers = models.BinaryField()
+
+    class Meta:
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['property', 'date'], name='unique_property_visitor_sketch'),
+            models.UniqueConstraint(fields=['date'], condition=models.Q(property__isnull=True), name='unique_global_visitor_sketch'),
+        ]
+
+    def __str__(self):
+        scope = self.property.title if self.property_id else "all properties"
+        return f"Visitors of {scope} on {self.date}"
+
+class AnalyticsRollup(models.Model):
+    """Weekly/monthly sums of DailyAnalytics, per property or portfolio-wide (property is empty)."""
+
+    class Period(models.TextChoices):
+        WEEK = 'week', 'Week'
+        MONTH = 'month', 'Month'
+
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, null=True, blank=True, related_name="analytics_rollups", help_text="Leave empty for the portfolio-wide rollup")
+    period = models.CharField(max_length=5, choices=Period.choices)
+    period_start = models.DateField(help_text="Monday of the week or first day of the month")
+
+    views = models.PositiveIntegerField(default=0)
+    bookings = models.PositiveIntegerField(default=0)
+    downloads = models.PositiveIntegerField(default=0)
+    gallery_opens = models.PositiveIntegerField(default=0)
+    brochure_clicks = models.PositiveIntegerField(default=0)
+    impressions = models.PositiveIntegerField(default=0, help_text="Appearances in search results")
+
+    class Meta:
+        ordering = ['-period_start']
+        constraints = [
+            models.UniqueConstraint(fields=['property', 'period', 'period_start'], name='unique_property_analytics_rollup'),
+            models.UniqueConstraint(fields=['period', 'period_start'], condition=models.Q(property__isnull=True), name='unique_global_analytics_rollup'),
+        ]
+
+    def __str__(self):
+        scope = self.property.title if self.property_id else "all properties"
+        return f"{self.get_period_display()} analytics for {scope} from {self.period_start}"
+
+
+class DashboardCounter(models.Model):
+    """
+    One incrementally maintained admin dashboard figure (see villas.dashboard),
+    such as `properties`, `status:published`, `listing_type:rent`, `agents`,
+    `reviews` or `pending_bookings`. One row per figure, so concurrent saves
+    only ever touch the counters they change.
+    """
+    name = models.CharField(max_length=64, unique=True)
+    value = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class PopularityScale(models.Model):
+    """
+    The single row holding the reference point of the stored popularity
+    scores (see villas.popularity). Renormalizing moves `epoch` forward and
+    divides every stored score, so the column never overflows, and adopts the
+    configured half-life without rescaling current scores.
+    """
+    epoch = models.DateTimeField()
+    half_life_days = models.FloatField()
+
+    def __str__(self):
+        return f"Popularity since {self.epoch:%Y-%m-%d} (half-life {self.half_life_days:g} days)"
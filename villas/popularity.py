@@ -0,0 +1,133 @@
+"""
+Exponentially decayed popularity scores, kept with forward decay.
+
+Each event adds weight * 2 ** (age_of_event_since_epoch / half_life) to
+Property.popularity. The decayed score "now" is the stored value divided by
+2 ** (now_since_epoch / half_life); because every property shares that
+divisor, ordering by the stored column is ordering by current popularity, so
+updates are a single F() increment and reads never recompute anything.
+
+The epoch and half-life live in the PopularityScale row. Stored values grow
+without bound, so once the epoch is RENORMALIZE_AFTER half-lives old, or
+POPULARITY_HALF_LIFE_DAYS no longer matches the row, the next bump
+renormalizes: it divides the column by the current growth and moves the epoch
+to now. Scores are unchanged by that; a new half-life only applies to decay
+from then on.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import PopularityScale, Property
+
+
+# reference point for scores stored before the scale row existed
+INITIAL_EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+SCALE_ID = 1
+# 2 ** 32 keeps plenty of float precision for a year of weights
+RENORMALIZE_AFTER = 32
+# float overflows past 2 ** 1023; a stale scale read for display stays finite
+MAX_EXPONENT = 1000
+SCALE_KEY = "villas:popularity:scale"
+SCALE_TTL = 60
+
+WEIGHTS = {
+    "views": 1,
+    "downloads": 3,
+    "favorites": 5,
+    "bookings": 10,
+}
+
+TRENDING_KEY = "villas:trending"
+TRENDING_SIZE = 50
+TRENDING_TTL = 60
+
+
+def _load_scale(lock=False):
+    scales = PopularityScale.objects.select_for_update() if lock else PopularityScale.objects
+    scale, _ = scales.get_or_create(
+        pk=SCALE_ID,
+        defaults={"epoch": INITIAL_EPOCH, "half_life_days": settings.POPULARITY_HALF_LIFE_DAYS},
+    )
+    return scale
+
+
+def _scale():
+    """The scale for reads, cached for SCALE_TTL seconds; renormalize drops it."""
+    scale = cache.get(SCALE_KEY)
+    if scale is None:
+        scale = _load_scale()
+        cache.set(SCALE_KEY, scale, SCALE_TTL)
+    return scale
+
+
+def _exponent(scale, at=None):
+    elapsed = ((at or timezone.now()) - scale.epoch).total_seconds()
+    return elapsed / (scale.half_life_days * 86400)
+
+
+def _growth(scale, at=None):
+    return 2 ** min(_exponent(scale, at), MAX_EXPONENT)
+
+
+def current_score(stored, at=None):
+    """Decayed popularity as of `at` (default now) for a stored column value."""
+    return stored / _growth(_scale(), at)
+
+
+def renormalize(scale=None, at=None):
+    """
+    Divide every stored score by the growth since the epoch and move the epoch
+    to `at` (default now), adopting POPULARITY_HALF_LIFE_DAYS. Call with the
+    scale row locked, or with none to lock it here.
+    """
+    at = at or timezone.now()
+    with transaction.atomic():
+        scale = scale or _load_scale(lock=True)
+        growth = _growth(scale, at)
+        Property.objects.filter(popularity__gt=0).update(popularity=F("popularity") / growth)
+        scale.epoch = at
+        scale.half_life_days = settings.POPULARITY_HALF_LIFE_DAYS
+        scale.save()
+    transaction.on_commit(lambda: cache.delete(SCALE_KEY))
+    return scale
+
+
+def bump(increments, at=None):
+    """
+    Add events ({property_id: {event: n}}) to the stored popularity scores.
+    The scale row stays locked until the increments commit, so a concurrent
+    renormalize cannot divide the column between reading the epoch and adding.
+    """
+    with transaction.atomic():
+        scale = _load_scale(lock=True)
+        if (
+            scale.half_life_days != settings.POPULARITY_HALF_LIFE_DAYS
+            or _exponent(scale) > RENORMALIZE_AFTER
+        ):
+            scale = renormalize(scale)
+        growth = _growth(scale, at)
+        for property_id, events in increments.items():
+            amount = sum(WEIGHTS.get(event, 0) * n for event, n in events.items())
+            if amount:
+                Property.objects.filter(pk=property_id).update(popularity=F("popularity") + amount * growth)
+
+
+def trending_ids(limit):
+    """
+    Ids of the most popular published properties. The top TRENDING_SIZE list is
+    read with one indexed ORDER BY ... LIMIT and cached for TRENDING_TTL seconds.
+    """
+    ranked = cache.get(TRENDING_KEY)
+    if ranked is None:
+        ranked = list(
+            Property.objects.filter(status=Property.StatusType.PUBLISHED, popularity__gt=0)
+            .order_by("-popularity")
+            .values_list("id", flat=True)[:TRENDING_SIZE]
+        )
+        cache.set(TRENDING_KEY, ranked, TRENDING_TTL)
+    return ranked[:limit]
@@ -0,0 +1,254 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+from . import analytics_cache
+from .models import AnalyticsRollup, DailyAnalytics
+
+
+ANALYTICS_FIELDS = ("views", "bookings", "downloads")
+# client-side engagement reported through the beacon endpoint
+ENGAGEMENT_FIELDS = ("gallery_opens", "brochure_clicks", "impressions")
+COUNTER_FIELDS = ANALYTICS_FIELDS + ENGAGEMENT_FIELDS
+
+
+def week_start(day):
+    """Monday of the ISO week containing `day`."""
+    return day - timedelta(days=day.weekday())
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(day):
+    day = month_start(day)
+    return (day + timedelta(days=32)).replace(day=1)
+
+
+def period_start(period, day):
+    if period == AnalyticsRollup.Period.WEEK:
+        return week_start(day)
+    return month_start(day)
+
+
+def increment_counters(model, lookup, counts):
+    """
+    Add `counts` ({field: n}) to the row matching `lookup`, creating it if needed.
+    Uses an F() update so concurrent writers never lose increments.
+    """
+    counts = {field: n for field, n in counts.items() if n}
+    if not counts:
+        return
+    updates = {field: F(field) + n for field, n in counts.items()}
+    if model.objects.filter(**lookup).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **counts)
+    except IntegrityError:
+        # another writer created the row in the meantime
+        model.objects.filter(**lookup).update(**updates)
+
+
+def apply_rollup_deltas(deltas):
+    """
+    Fold daily counter deltas ({(property_id, date): {field: n}}) into the
+    weekly and monthly rollups, both per property and portfolio-wide.
+    """
+    rollups = defaultdict(lambda: defaultdict(int))
+    for (property_id, day), counts in deltas.items():
+        for period in AnalyticsRollup.Period.values:
+            start = period_start(period, day)
+            for scope in (property_id, None):
+                bucket = rollups[(scope, period, start)]
+                for field, n in counts.items():
+                    bucket[field] += n
+
+    for (property_id, period, start), counts in rollups.items():
+        increment_counters(
+            AnalyticsRollup,
+            {"property_id": property_id, "period": period, "period_start": start},
+            counts,
+        )
+
+
+def split_range(start_date, end_date):
+    """
+    Cover [start_date, end_date] with the coarsest pieces available.
+
+    Returns (months, weeks, days): month starts and week starts that lie
+    completely inside the range, plus (first, last) day spans for the rest.
+    """
+    months, weeks, days = [], [], []
+    if start_date > end_date:
+        return months, weeks, days
+
+    first_month = start_date if start_date.day == 1 else next_month(start_date)
+    cursor = first_month
+    while next_month(cursor) - timedelta(days=1) <= end_date:
+        months.append(cursor)
+        cursor = next_month(cursor)
+
+    if months:
+        edges = [(start_date, first_month - timedelta(days=1)), (cursor, end_date)]
+    else:
+        edges = [(start_date, end_date)]
+
+    for edge_start, edge_end in edges:
+        if edge_start > edge_end:
+            continue
+        monday = edge_start if edge_start.weekday() == 0 else week_start(edge_start) + timedelta(days=7)
+        cursor = monday
+        while cursor + timedelta(days=6) <= edge_end:
+            weeks.append(cursor)
+            cursor += timedelta(days=7)
+        if cursor == monday:
+            days.append((edge_start, edge_end))
+            continue
+        if edge_start < monday:
+            days.append((edge_start, monday - timedelta(days=1)))
+        if cursor <= edge_end:
+            days.append((cursor, edge_end))
+
+    return months, weeks, days
+
+
+def _days_filter(spans):
+    q = Q()
+    for first, last in spans:
+        q |= Q(date__gte=first, date__lte=last)
+    return q
+
+
+def range_totals(start_date, end_date):
+    """Portfolio-wide view/download/booking totals, read from the coarsest rollups."""
+    months, weeks, days = split_range(start_date, end_date)
+    totals = dict.fromkeys(ANALYTICS_FIELDS, 0)
+    sums = {field: Sum(field) for field in ANALYTICS_FIELDS}
+
+    if months or weeks:
+        rolled = AnalyticsRollup.objects.filter(property__isnull=True).filter(
+            Q(period=AnalyticsRollup.Period.MONTH, period_start__in=months)
+            | Q(period=AnalyticsRollup.Period.WEEK, period_start__in=weeks)
+        ).aggregate(**sums)
+        for field in ANALYTICS_FIELDS:
+            totals[field] += rolled[field] or 0
+
+    if days:
+        daily = DailyAnalytics.objects.filter(_days_filter(days)).aggregate(**sums)
+        for field in ANALYTICS_FIELDS:
+            totals[field] += daily[field] or 0
+
+    return totals
+
+
+def property_range_totals(start_date, end_date, property_ids=None):
+    """
+    Per-property totals for [start_date, end_date] as {property_id: {field: n}},
+    from two grouped queries (rollups for whole months/weeks, daily rows for the rest).
+    """
+    months, weeks, days = split_range(start_date, end_date)
+    totals = defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+    sums = {field: Sum(field) for field in COUNTER_FIELDS}
+    querysets = []
+
+    if months or weeks:
+        querysets.append(AnalyticsRollup.objects.filter(property__isnull=False).filter(
+            Q(period=AnalyticsRollup.Period.MONTH, period_start__in=months)
+            | Q(period=AnalyticsRollup.Period.WEEK, period_start__in=weeks)
+        ))
+    if days:
+        querysets.append(DailyAnalytics.objects.filter(_days_filter(days)))
+
+    for queryset in querysets:
+        if property_ids is not None:
+            queryset = queryset.filter(property_id__in=property_ids)
+        for row in queryset.order_by().values("property_id").annotate(**sums):
+            for field in COUNTER_FIELDS:
+                totals[row["property_id"]][field] += row[field] or 0
+
+    return dict(totals)
+
+
+def monthly_series(start_date, end_date):
+    """
+    Portfolio-wide per-month sums for [start_date, end_date] as
+    [(month_start, {field: n})]. Whole months come from the monthly rollup,
+    the partial months at either end from DailyAnalytics.
+    """
+    months, _, _ = split_range(start_date, end_date)
+    series = {}
+
+    for row in AnalyticsRollup.objects.filter(
+        property__isnull=True,
+        period=AnalyticsRollup.Period.MONTH,
+        period_start__in=months,
+    ).values("period_start", *ANALYTICS_FIELDS):
+        series[row["period_start"]] = {field: row[field] for field in ANALYTICS_FIELDS}
+
+    if months:
+        edges = [(start_date, months[0] - timedelta(days=1)), (next_month(months[-1]), end_date)]
+    else:
+        edges = [(start_date, end_date)]
+    edges = [(first, last) for first, last in edges if first <= last]
+
+    if edges:
+        partial = (
+            DailyAnalytics.objects.filter(_days_filter(edges))
+            .annotate(month=TruncMonth("date"))
+            .values("month")
+            .annotate(**{field: Sum(field) for field in ANALYTICS_FIELDS})
+        )
+        for row in partial:
+            series[row["month"]] = {field: row[field] or 0 for field in ANALYTICS_FIELDS}
+
+    return sorted(series.items())
+
+
+def backfill_rollups(start_date=None, end_date=None):
+    """
+    Rebuild rollups from DailyAnalytics. The range is widened to whole weeks
+    and months so partially covered periods are recomputed completely.
+    Returns the number of rollup rows written.
+    """
+    written = 0
+    for period, trunc in (
+        (AnalyticsRollup.Period.WEEK, TruncWeek),
+        (AnalyticsRollup.Period.MONTH, TruncMonth),
+    ):
+        daily = DailyAnalytics.objects.all()
+        rollups = AnalyticsRollup.objects.filter(period=period)
+        if start_date:
+            first = period_start(period, start_date)
+            daily = daily.filter(date__gte=first)
+            rollups = rollups.filter(period_start__gte=first)
+        if end_date:
+            if period == AnalyticsRollup.Period.WEEK:
+                last = week_start(end_date) + timedelta(days=6)
+            else:
+                last = next_month(end_date) - timedelta(days=1)
+            daily = daily.filter(date__lte=last)
+            rollups = rollups.filter(period_start__lte=last)
+
+        sums = {field: Sum(field) for field in COUNTER_FIELDS}
+        bucketed = daily.annotate(bucket=trunc("date"))
+        rows = [
+            AnalyticsRollup(property_id=row["property_id"], period=period, period_start=row["bucket"], **{field: row[field] or 0 for field in COUNTER_FIELDS})
+            for row in bucketed.values("property_id", "bucket").annotate(**sums)
+        ]
+        rows += [
+            AnalyticsRollup(property_id=None, period=period, period_start=row["bucket"], **{field: row[field] or 0 for field in COUNTER_FIELDS})
+            for row in bucketed.values("bucket").annotate(**sums)
+        ]
+
+        with transaction.atomic():
+            rollups.delete()
+            AnalyticsRollup.objects.bulk_create(rows, batch_size=1000)
+        written += len(rows)
+
+    analytics_cache.invalidate()
+    return written
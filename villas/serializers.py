@@ -3,6 +3,7 @@ from .models import Property, Media, Booking, PropertyImage, BedroomImage, Revie
 from accounts.models import User
 from datetime import date, datetime
 from .utils import validate_date_range, is_valid_date
+from .popularity import current_score
 from django.db.models import Avg, Count
 
 
@@ -62,6 +63,16 @@ class FavoriteSerializer(serializers.ModelSerializer):
         return value
 
 
+class TrendingPropertySerializer(PropertyFavoriteSerializer):
+    popularity = serializers.SerializerMethodField()
+
+    class Meta(PropertyFavoriteSerializer.Meta):
+        fields = PropertyFavoriteSerializer.Meta.fields + ['popularity']
+
+    def get_popularity(self, obj):
+        return round(current_score(obj.popularity), 3)
+
+
 class PropertySerializer(serializers.ModelSerializer):
     created_by_name = serializers.SerializerMethodField()
     location_coords = serializers.SerializerMethodField()
@@ -74,6 +85,7 @@ class PropertySerializer(serializers.ModelSerializer):
 
     total_reviews = serializers.SerializerMethodField()
     average_rating = serializers.SerializerMethodField()
+    popularity = serializers.SerializerMethodField()
 
 
     class Meta:
@@ -85,11 +97,11 @@ class PropertySerializer(serializers.ModelSerializer):
             'longitude', 'place_id', 'seo_title', 'seo_description',
             'signature_distinctions', 'staff', 'calendar_link',
             'created_at', 'updated_at', 'assigned_agent', 'created_by', 'created_by_name',
-            'booking_count', 'location_coords', 'property_stats', 'media_images', 'bedrooms_images', 'is_favorited', 'check_in', 'check_out', 'rules_and_etiquette', 'total_reviews', 'average_rating'
+            'booking_count', 'location_coords', 'property_stats', 'media_images', 'bedrooms_images', 'is_favorited', 'check_in', 'check_out', 'rules_and_etiquette', 'total_reviews', 'average_rating', 'popularity'
         ]
         read_only_fields = [
             'slug', 'created_by', 'created_by_name', 'booking_count', 'media_images', 'bedrooms_images',
-            'created_at', 'updated_at', 'location_coords', 'price_display', 'property_stats', 'total_reviews', 'average_rating'
+            'created_at', 'updated_at', 'location_coords', 'price_display', 'property_stats', 'total_reviews', 'average_rating', 'popularity'
         ]
     
     def get_total_reviews(self, obj):
@@ -101,6 +113,9 @@ class PropertySerializer(serializers.ModelSerializer):
     def get_is_favorited(self, obj):
         return getattr(obj, "is_favorited", False)
 
+    def get_popularity(self, obj):
+        return round(current_score(obj.popularity), 3)
+
     def get_created_by_name(self, obj):
         return obj.created_by.name if obj.created_by else None
 
@@ -0,0 +1,130 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_init, post_save
+from django.db import transaction
+from django.dispatch import receiver
+
+from list_vila.models import ContectUs
+from . import analytics_cache, dashboard, live, popularity
+from .models import Booking, Favorite, Property, Review
+
+
+@receiver([post_save, post_delete], sender=ContectUs)
+def invalidate_inquiry_summaries(sender, instance, **kwargs):
+    analytics_cache.invalidate([instance.created_at.date()])
+
+
+@receiver([post_save, post_delete], sender=Property)
+def invalidate_property_summaries(sender, instance, **kwargs):
+    # agent property counts are not tied to a date
+    analytics_cache.invalidate()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_agent_summaries(sender, instance, update_fields=None, **kwargs):
+    if instance.role != "agent" or update_fields == frozenset({"last_login"}):
+        return
+    analytics_cache.invalidate()
+
+
+# --- Dashboard snapshot ---
+# post_init remembers the loaded values so post_save can tell what changed
+# without re-reading the row.
+
+def _moved(changes, prefix, old, new):
+    if old is not None and old != new:
+        changes[f"{prefix}:{old}"] -= 1
+        changes[f"{prefix}:{new}"] += 1
+
+
+@receiver(post_init, sender=Property)
+def remember_property_state(sender, instance, **kwargs):
+    instance._dashboard_state = (instance.__dict__.get("status"), instance.__dict__.get("listing_type"))
+
+
+@receiver(post_save, sender=Property)
+def count_saved_property(sender, instance, created, **kwargs):
+    changes = Counter()
+    if created:
+        changes.update(["properties", f"status:{instance.status}", f"listing_type:{instance.listing_type}"])
+    else:
+        old_status, old_listing_type = instance._dashboard_state
+        _moved(changes, "status", old_status, instance.status)
+        _moved(changes, "listing_type", old_listing_type, instance.listing_type)
+    dashboard.adjust(changes)
+    instance._dashboard_state = (instance.status, instance.listing_type)
+
+
+@receiver(post_delete, sender=Property)
+def count_deleted_property(sender, instance, **kwargs):
+    changes = Counter(["properties", f"status:{instance.status}", f"listing_type:{instance.listing_type}"])
+    dashboard.adjust({name: -n for name, n in changes.items()})
+
+
+@receiver(post_init, sender=Booking)
+def remember_booking_state(sender, instance, **kwargs):
+    instance._dashboard_status = instance.__dict__.get("status")
+
+
+@receiver(post_save, sender=Booking)
+def count_saved_booking(sender, instance, created, **kwargs):
+    was_pending = not created and instance._dashboard_status == Booking.STATUS.Pending
+    is_pending = instance.status == Booking.STATUS.Pending
+    dashboard.adjust({"pending_bookings": int(is_pending) - int(was_pending)})
+    instance._dashboard_status = instance.status
+
+
+@receiver(post_delete, sender=Booking)
+def count_deleted_booking(sender, instance, **kwargs):
+    if instance.status == Booking.STATUS.Pending:
+        dashboard.adjust({"pending_bookings": -1})
+
+
+@receiver(post_save, sender=Review)
+def count_saved_review(sender, instance, created, **kwargs):
+    if created:
+        dashboard.adjust({"reviews": 1})
+
+
+@receiver(post_delete, sender=Review)
+def count_deleted_review(sender, instance, **kwargs):
+    dashboard.adjust({"reviews": -1})
+
+
+@receiver(post_init, sender=settings.AUTH_USER_MODEL)
+def remember_user_role(sender, instance, **kwargs):
+    instance._dashboard_role = instance.__dict__.get("role")
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def count_saved_agent(sender, instance, created, **kwargs):
+    was_agent = not created and instance._dashboard_role == "agent"
+    dashboard.adjust({"agents": int(instance.role == "agent") - int(was_agent)})
+    instance._dashboard_role = instance.role
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def count_deleted_agent(sender, instance, **kwargs):
+    if instance.role == "agent":
+        dashboard.adjust({"agents": -1})
+
+
+@receiver(post_save, sender=Favorite)
+def count_favorite_popularity(sender, instance, created, **kwargs):
+    if created:
+        popularity.bump({instance.property_id: {"favorites": 1}})
+
+
+# --- Live dashboard counters ---
+
+@receiver(post_save, sender=Booking)
+def push_new_booking(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: live.record({"new_bookings": 1}))
+
+
+@receiver(post_save, sender=ContectUs)
+def push_new_inquiry(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: live.record({"inquiries": 1}))
@@ -0,0 +1,640 @@
+import os
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import User
+from eastmondvilla.asgi import application
+from . import analytics_cache, buffer, eventlog, hll, live, popularity
+from .checks import check_shared_cache
+from .dashboard import build_snapshot
+from .throttles import BeaconRateThrottle
+from .models import AnalyticsRollup, Booking, DailyAnalytics, DashboardCounter, Favorite, PopularityScale, Property, Review, VisitorSketch
+from .rollups import backfill_rollups, range_totals, split_range
+from .utils import flush_analytics, get_agent_analytics, update_daily_analytics
+from .visitors import unique_visitors
+
+
+class AnalyticsRollupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.villa = Property.objects.create(title='Sea Breeze', city='Bridgetown')
+        self.other = Property.objects.create(title='Palm Court', city='Holetown')
+
+    def test_split_range_uses_whole_months_then_weeks_then_days(self):
+        # Wed 2025-01-15 .. Mon 2025-04-07
+        months, weeks, days = split_range(date(2025, 1, 15), date(2025, 4, 7))
+        self.assertEqual(months, [date(2025, 2, 1), date(2025, 3, 1)])
+        self.assertEqual(weeks, [date(2025, 1, 20)])
+        self.assertEqual(days, [
+            (date(2025, 1, 15), date(2025, 1, 19)),
+            (date(2025, 1, 27), date(2025, 1, 31)),
+            (date(2025, 4, 1), date(2025, 4, 7)),
+        ])
+
+    def test_flush_updates_daily_rows_and_rollups(self):
+        day = date(2025, 3, 5)
+        flush_analytics({
+            (self.villa.pk, day): {'views': 3, 'downloads': 1},
+            (self.other.pk, day): {'views': 2},
+        })
+        flush_analytics({(self.villa.pk, day): {'views': 1}})
+
+        self.assertEqual(DailyAnalytics.objects.get(property=self.villa, date=day).views, 4)
+        monthly = AnalyticsRollup.objects.get(property__isnull=True, period='month', period_start=date(2025, 3, 1))
+        self.assertEqual((monthly.views, monthly.downloads), (6, 1))
+        weekly = AnalyticsRollup.objects.get(property=self.villa, period='week', period_start=date(2025, 3, 3))
+        self.assertEqual(weekly.views, 4)
+
+    def test_update_daily_analytics_counts_today(self):
+        update_daily_analytics(self.villa, 'views')
+        update_daily_analytics(self.villa, 'views')
+        today = timezone.now().date()
+        # counted in the buffer until the next flush
+        self.assertFalse(DailyAnalytics.objects.filter(property=self.villa).exists())
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(DailyAnalytics.objects.get(property=self.villa, date=today).views, 2)
+
+    def test_backfill_matches_incremental_rollups(self):
+        start = date(2024, 11, 20)
+        for offset in range(120):
+            day = start + timedelta(days=offset)
+            DailyAnalytics.objects.create(property=self.villa, date=day, views=offset % 7, bookings=offset % 2)
+            DailyAnalytics.objects.create(property=self.other, date=day, views=1, downloads=offset % 3)
+
+        backfill_rollups()
+
+        end = start + timedelta(days=119)
+        expected = {
+            'views': sum(d.views for d in DailyAnalytics.objects.all()),
+            'downloads': sum(d.downloads for d in DailyAnalytics.objects.all()),
+            'bookings': sum(d.bookings for d in DailyAnalytics.objects.all()),
+        }
+        self.assertEqual(range_totals(start, end), expected)
+
+        inner_start, inner_end = date(2024, 12, 10), date(2025, 2, 20)
+        inner = DailyAnalytics.objects.filter(date__gte=inner_start, date__lte=inner_end)
+        self.assertEqual(range_totals(inner_start, inner_end)['views'], sum(d.views for d in inner))
+
+    def test_summary_view_reads_rollups_for_long_ranges(self):
+        today = timezone.now().date()
+        for offset in range(200):
+            DailyAnalytics.objects.create(property=self.villa, date=today - timedelta(days=offset), views=2, downloads=1)
+        backfill_rollups()
+
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_superuser(email='admin@test.com', name='Admin', password='adminpass'))
+        resp = client.get('/api/villas/analytics/', {'range': '1y'})
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['totals']['views'], 400)
+        self.assertEqual(resp.data['totals']['downloads'], 200)
+        self.assertEqual(sum(p['views'] for p in resp.data['performance']), 400)
+
+
+class AgentAnalyticsTests(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.agents = []
+        for i in range(3):
+            agent = User.objects.create_user(email=f'agent{i}@test.com', name=f'Agent {i}', password='x', role='agent')
+            self.agents.append(agent)
+            for j in range(4 + i):
+                villa = Property.objects.create(title=f'Villa {i}-{j}', assigned_agent=agent)
+                DailyAnalytics.objects.bulk_create([
+                    DailyAnalytics(property=villa, date=self.today - timedelta(days=d), views=3, downloads=1, bookings=d % 2)
+                    for d in range(30)
+                ])
+        # an agent without properties still shows up with zeros
+        User.objects.create_user(email='idle@test.com', name='Idle', password='x', role='agent')
+
+    def test_totals_are_not_multiplied_and_respect_the_range(self):
+        start = self.today - timedelta(days=9)
+        with self.assertNumQueries(1):
+            rows = {row['id']: row for row in get_agent_analytics(start, self.today)}
+
+        self.assertEqual(len(rows), 4)
+        for i, agent in enumerate(self.agents):
+            properties = 4 + i
+            row = rows[agent.pk]
+            self.assertEqual(row['total_properties'], properties)
+            self.assertEqual(row['total_views'], properties * 10 * 3)
+            self.assertEqual(row['total_downloads'], properties * 10)
+            self.assertEqual(row['total_bookings'], properties * 5)
+
+        idle = [row for row in rows.values() if row['name'] == 'Idle'][0]
+        self.assertEqual((idle['total_properties'], idle['total_views']), (0, 0))
+
+
+@override_settings(ANALYTICS_CACHE=True)
+class AnalyticsSummaryCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.villa = Property.objects.create(title='Sea Breeze', city='Bridgetown')
+        self.client = APIClient()
+        self.today = timezone.now().date()
+
+    def test_repeat_requests_are_served_from_cache(self):
+        update_daily_analytics(self.villa, 'views')
+        buffer.flush()
+        first = self.client.get('/api/villas/analytics/', {'range': '7d'})
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/villas/analytics/', {'range': '7d'})
+        self.assertEqual(first.data, second.data)
+
+    def test_flush_invalidates_closed_ranges_covering_the_day(self):
+        closed = {'start': '2024-01-01', 'end': '2024-01-31'}
+        self.client.get('/api/villas/analytics/', closed)
+        self.assertEqual(self.client.get('/api/villas/analytics/', {'range': '7d'}).data['totals']['views'], 0)
+
+        update_daily_analytics(self.villa, 'views')
+        with self.captureOnCommitCallbacks(execute=True):
+            buffer.flush()
+
+        # ranges that include today are left to expire after ANALYTICS_CACHE_TTL
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/villas/analytics/', {'range': '7d'}).data['totals']['views'], 0)
+        # the closed January range did not cover today and stays cached
+        with self.assertNumQueries(0):
+            self.client.get('/api/villas/analytics/', closed)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            flush_analytics({(self.villa.pk, date(2024, 1, 10)): {'views': 5}})
+        self.assertEqual(self.client.get('/api/villas/analytics/', closed).data['totals']['views'], 5)
+
+        cache.clear()  # as if ANALYTICS_CACHE_TTL had passed
+        self.assertEqual(self.client.get('/api/villas/analytics/', {'range': '7d'}).data['totals']['views'], 1)
+
+    @override_settings(ANALYTICS_CACHE=False)
+    def test_summaries_are_not_cached_without_a_shared_cache(self):
+        closed = {'start': '2024-01-01', 'end': '2024-01-31'}
+        self.client.get('/api/villas/analytics/', closed)
+        flush_analytics({(self.villa.pk, date(2024, 1, 5)): {'views': 3}})  # on_commit hooks not run
+        self.assertEqual(self.client.get('/api/villas/analytics/', closed).data['totals']['views'], 3)
+
+    @override_settings(CACHE_IS_SHARED=False)
+    def test_summary_cache_requires_a_shared_cache(self):
+        self.assertEqual([e.id for e in check_shared_cache(None)], ['villas.E001'])
+
+    def test_invalidating_everything_drops_closed_ranges(self):
+        closed = {'start': '2024-01-01', 'end': '2024-01-31'}
+        self.client.get('/api/villas/analytics/', closed)
+        flush_analytics({(self.villa.pk, date(2024, 1, 5)): {'views': 3}})  # on_commit hooks not run
+        self.assertEqual(self.client.get('/api/villas/analytics/', closed).data['totals']['views'], 0)
+        analytics_cache.invalidate()
+        self.assertEqual(self.client.get('/api/villas/analytics/', closed).data['totals']['views'], 3)
+
+
+class PropertyAnalyticsSeriesTests(TestCase):
+    def setUp(self):
+        self.agent = User.objects.create_user(email='agent@test.com', name='Agent', password='x', role='agent')
+        self.villas = [Property.objects.create(title=f'Villa {i}', assigned_agent=self.agent) for i in range(3)]
+        self.unassigned = Property.objects.create(title='Elsewhere')
+        # Mon 2025-03-03 .. Sun 2025-03-16, with a gap on the 5th
+        for villa in self.villas + [self.unassigned]:
+            DailyAnalytics.objects.bulk_create([
+                DailyAnalytics(property=villa, date=date(2025, 3, day), views=day, downloads=1)
+                for day in range(3, 17) if day != 5
+            ])
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.agent)
+
+    def test_daily_series_is_zero_filled_in_one_grouped_query(self):
+        params = {'start': '2025-03-03', 'end': '2025-03-09'}
+        with self.assertNumQueries(2):
+            resp = self.client.get('/api/villas/analytics/properties/', params)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([p['id'] for p in resp.data['properties']], [v.pk for v in self.villas])
+        series = resp.data['properties'][0]['series']
+        self.assertEqual(len(series), 7)
+        self.assertEqual(series[2], {'date': date(2025, 3, 5), 'views': 0, 'bookings': 0, 'downloads': 0})
+        self.assertEqual(resp.data['properties'][0]['totals']['views'], 3 + 4 + 6 + 7 + 8 + 9)
+
+    def test_weekly_buckets_only_count_days_in_range(self):
+        resp = self.client.get('/api/villas/analytics/properties/', {
+            'start': '2025-03-06', 'end': '2025-03-16', 'interval': 'week', 'properties': str(self.villas[1].pk),
+        })
+        series = resp.data['properties'][0]['series']
+        self.assertEqual([p['date'] for p in series], [date(2025, 3, 3), date(2025, 3, 10)])
+        self.assertEqual(series[0]['downloads'], 4)
+        self.assertEqual(series[1]['downloads'], 7)
+
+    def test_customers_are_forbidden(self):
+        customer = User.objects.create_user(email='c@test.com', name='Customer', password='x')
+        self.client.force_authenticate(user=customer)
+        self.assertEqual(self.client.get('/api/villas/analytics/properties/').status_code, 403)
+
+    def test_bad_ranges_are_rejected(self):
+        for params in [
+            {'start': '2025-03-09', 'end': '2025-03-03'},
+            {'start': '2020-01-01', 'end': '2025-03-03'},
+            {'range': '9' * 30},
+        ]:
+            resp = self.client.get('/api/villas/analytics/properties/', params)
+            self.assertEqual(resp.status_code, 400, params)
+        self.assertEqual(self.client.get('/api/villas/analytics/', {'range': '9' * 30}).status_code, 400)
+        resp = self.client.get('/api/villas/analytics/properties/', {'start': '2024-03-03', 'end': '2025-03-03', 'interval': 'week'})
+        self.assertEqual(resp.status_code, 200)
+
+
+class DashboardSnapshotTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(email='admin@test.com', name='Admin', password='adminpass')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def test_snapshot_tracks_changes_and_matches_a_rebuild(self):
+        self.client.get('/api/villas/dashboard/')  # builds the snapshot
+
+        agent = User.objects.create_user(email='agent@test.com', name='Agent', password='x', role='agent')
+        villa = Property.objects.create(title='Sea Breeze', assigned_agent=agent)
+        Property.objects.create(title='Palm Court', listing_type=Property.ListingType.FOR_SALE)
+        villa.status = Property.StatusType.PUBLISHED
+        villa.save()
+        booking = Booking.objects.create(property=villa, full_name='Guest', email='g@test.com', check_in=date(2025, 1, 1), check_out=date(2025, 1, 3))
+        Review.objects.create(property=villa, rating=5)
+        booking.status = Booking.STATUS.Approved
+        booking.save()
+        Booking.objects.create(property=villa, full_name='Guest', email='g@test.com', check_in=date(2025, 2, 1), check_out=date(2025, 2, 3))
+
+        # the counters and the recent audit log entries
+        with self.assertNumQueries(2):
+            resp = self.client.get('/api/villas/dashboard/')
+
+        data = resp.data
+        self.assertEqual(data['properties'], 2)
+        self.assertEqual(data['properties_active'], 1)
+        self.assertEqual(data['properties_by_status']['draft'], 1)
+        self.assertEqual(data['properties_by_listing_type'], {'rent': 1, 'sale': 1})
+        self.assertEqual((data['users'], data['reviews'], data['pending_bookings']), (1, 1, 1))
+        self.assertTrue(data['recent_activity'])
+
+        stored = dict(DashboardCounter.objects.values_list('name', 'value'))
+        self.assertEqual(build_snapshot(), stored)
+
+
+class AnalyticsEventLogTests(TestCase):
+    def setUp(self):
+        eventlog.close()
+        self.directory = tempfile.TemporaryDirectory()
+        # room for 40 records per segment, so the log rotates
+        self.settings_override = override_settings(
+            ANALYTICS_EVENTLOG_ENABLED=True,
+            ANALYTICS_EVENTLOG_DIR=self.directory.name,
+            ANALYTICS_EVENTLOG_SEGMENT_SIZE=eventlog.HEADER_SIZE + 40 * eventlog.RECORD.size,
+        )
+        self.settings_override.enable()
+        self.villa = Property.objects.create(title='Sea Breeze')
+
+    def tearDown(self):
+        eventlog.close()
+        self.settings_override.disable()
+        self.directory.cleanup()
+
+    def _us(self, day, hour=12):
+        return int(datetime(day.year, day.month, day.day, hour, tzinfo=dt_timezone.utc).timestamp() * 1_000_000)
+
+    def test_segments_rotate_and_read_back_in_time_order(self):
+        for i in range(100):
+            eventlog.append_event('views', self.villa.pk, visitor=i, timestamp=self._us(date(2025, 5, 1)) + i)
+        eventlog.close()
+
+        segments = eventlog.list_segments()
+        self.assertEqual(len(segments), 3)
+        records = [r for path in segments for r in eventlog.read_segment(path)]
+        self.assertEqual([r[2] for r in records], list(range(100)))
+        later = [r for path in segments for r in eventlog.read_segment(path, start_us=self._us(date(2025, 5, 1)) + 90)]
+        self.assertEqual(len(later), 10)
+
+    def test_segments_past_retention_are_pruned(self):
+        eventlog.append_event('views', self.villa.pk, timestamp=self._us(date(2025, 5, 1)))
+        eventlog.close()
+        eventlog.append_event('views', self.villa.pk)
+        eventlog.close()
+        old, recent = eventlog.list_segments()
+        self.assertEqual(eventlog.covered_from(), date(2025, 5, 1))
+
+        call_command('prune_analytics_events', '--days', '30', stdout=StringIO())
+        self.assertEqual(eventlog.list_segments(), [recent])
+        self.assertFalse(os.path.exists(old[:-4] + '.idx'))
+        self.assertEqual(eventlog.covered_from(), date(2025, 5, 2))
+
+    def test_replay_skips_days_lost_to_pruning(self):
+        for day in (date(2025, 5, 1), date(2025, 5, 2)):
+            eventlog.append_event('views', self.villa.pk, timestamp=self._us(day, 8))
+            eventlog.close()
+        # the 1 May segment of one process is pruned; another process still has late 1 May events
+        eventlog.append_event('views', self.villa.pk, timestamp=self._us(date(2025, 5, 1), 20))
+        eventlog.append_event('views', self.villa.pk, timestamp=self._us(date(2025, 5, 2), 20))
+        eventlog.close()
+        eventlog.prune(self.directory.name, self._us(date(2025, 5, 1), 9))
+        DailyAnalytics.objects.create(property=self.villa, date=date(2025, 4, 30), views=7)
+        DailyAnalytics.objects.create(property=self.villa, date=date(2025, 5, 1), views=9)
+
+        out = StringIO()
+        call_command('replay_analytics_events', '--start', '2025-04-30', '--workers', '1', stdout=out)
+        self.assertIn('Skipping 2025-04-30 to 2025-05-01', out.getvalue())
+        rows = dict(DailyAnalytics.objects.filter(property=self.villa).values_list('date', 'views'))
+        self.assertEqual(rows, {date(2025, 4, 30): 7, date(2025, 5, 1): 9, date(2025, 5, 2): 2})
+
+        with self.assertRaises(CommandError):
+            call_command('replay_analytics_events', '--end', '2025-05-01', '--workers', '1', stdout=StringIO())
+
+    def test_replay_rebuilds_daily_rows_and_rollups(self):
+        for day, views, downloads in ((date(2025, 5, 1), 30, 2), (date(2025, 5, 2), 25, 0)):
+            for i in range(views):
+                eventlog.append_event('views', self.villa.pk, timestamp=self._us(day) + i)
+            for i in range(downloads):
+                eventlog.append_event('downloads', self.villa.pk, timestamp=self._us(day, 18) + i)
+        eventlog.close()
+        # a miscounted row the replay should correct
+        DailyAnalytics.objects.create(property=self.villa, date=date(2025, 5, 1), views=999)
+
+        call_command('replay_analytics_events', '--workers', '2', stdout=StringIO())
+
+        rows = {row.date: row for row in DailyAnalytics.objects.filter(property=self.villa)}
+        self.assertEqual((rows[date(2025, 5, 1)].views, rows[date(2025, 5, 1)].downloads), (30, 2))
+        self.assertEqual(rows[date(2025, 5, 2)].views, 25)
+        monthly = AnalyticsRollup.objects.get(property=self.villa, period='month', period_start=date(2025, 5, 1))
+        self.assertEqual(monthly.views, 55)
+
+
+class UniqueVisitorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.villa = Property.objects.create(title='Sea Breeze', status=Property.StatusType.PUBLISHED)
+
+    def test_sketch_estimate_is_close_and_fixed_size(self):
+        registers = hll.empty()
+        for i in range(20000):
+            hll.add(registers, hll.hash_visitor(f'user:{i}'))
+        self.assertEqual(len(registers), 4096)
+        self.assertAlmostEqual(hll.estimate(registers), 20000, delta=20000 * 0.05)
+
+    def test_sketches_merge_across_days(self):
+        day = date(2025, 6, 2)
+        # 300 visitors on day one, 300 on day two of whom 100 came back
+        flush_analytics({}, {(self.villa.pk, day): [hll.hash_visitor(f'v{i}') for i in range(300)]})
+        flush_analytics({}, {(self.villa.pk, day + timedelta(days=1)): [hll.hash_visitor(f'v{i}') for i in range(200, 500)]})
+
+        self.assertAlmostEqual(unique_visitors(day, day), 300, delta=15)
+        self.assertAlmostEqual(unique_visitors(day, day + timedelta(days=1), self.villa.pk), 500, delta=25)
+        self.assertAlmostEqual(unique_visitors(day, day + timedelta(days=1)), 500, delta=25)
+
+    def test_repeat_views_count_once(self):
+        client = APIClient()
+        viewer = User.objects.create_user(email='viewer@test.com', name='Viewer', password='x')
+        client.force_authenticate(user=viewer)
+        for _ in range(3):
+            client.get(f'/api/villas/properties/{self.villa.pk}/')
+        APIClient().get(f'/api/villas/properties/{self.villa.pk}/', HTTP_USER_AGENT='Googlebot/2.1')
+        # sketches are merged once per flush, not once per view
+        self.assertFalse(VisitorSketch.objects.exists())
+        buffer.flush()
+
+        today = timezone.now().date()
+        self.assertEqual(DailyAnalytics.objects.get(property=self.villa, date=today).views, 4)
+        self.assertEqual(unique_visitors(today, today, self.villa.pk), 1)
+        resp = client.get('/api/villas/analytics/', {'range': '7d'})
+        self.assertEqual(resp.data['totals']['unique_visitors'], 1)
+
+
+class PopularityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.villas = [Property.objects.create(title=f'Villa {i}', status=Property.StatusType.PUBLISHED) for i in range(3)]
+        self.client = APIClient()
+
+    def test_recent_events_outweigh_older_ones(self):
+        now = timezone.now()
+        popularity.bump({self.villas[0].pk: {'views': 10}}, at=now - timedelta(days=14))
+        popularity.bump({self.villas[1].pk: {'views': 4}}, at=now)
+        first, second = (Property.objects.get(pk=v.pk).popularity for v in self.villas[:2])
+        # two half-lives later, 10 old views are worth 2.5 fresh ones
+        self.assertAlmostEqual(popularity.current_score(first, now), 2.5, places=3)
+        self.assertGreater(second, first)
+
+    def test_trending_endpoint_and_ordering(self):
+        viewer = User.objects.create_user(email='viewer@test.com', name='Viewer', password='x')
+        update_daily_analytics(self.villas[2], 'views')
+        buffer.flush()
+        Favorite.objects.create(user=viewer, property=self.villas[1])
+        Property.objects.create(title='Hidden draft', popularity=1e9)
+
+        resp = self.client.get('/api/villas/trending/', {'limit': 5})
+        self.assertEqual([p['id'] for p in resp.data], [self.villas[1].pk, self.villas[2].pk])
+        # limits are clamped to 1..TRENDING_SIZE
+        resp = self.client.get('/api/villas/trending/', {'limit': -5})
+        self.assertEqual([p['id'] for p in resp.data], [self.villas[1].pk])
+
+        resp = self.client.get('/api/villas/properties/', {'ordering': 'popularity'})
+        self.assertEqual([p['id'] for p in resp.data['results']][:2], [self.villas[1].pk, self.villas[2].pk])
+        resp = self.client.get('/api/villas/properties/', {'ordering': '-popularity'})
+        self.assertEqual([p['id'] for p in resp.data['results']][-2:], [self.villas[2].pk, self.villas[1].pk])
+
+    def test_old_epochs_are_renormalized(self):
+        now = timezone.now()
+        PopularityScale.objects.create(pk=popularity.SCALE_ID, epoch=now - timedelta(days=7 * 40), half_life_days=7)
+        Property.objects.filter(pk=self.villas[0].pk).update(popularity=3 * 2 ** 40)
+
+        popularity.bump({self.villas[1].pk: {'views': 1}})
+
+        scale = PopularityScale.objects.get()
+        self.assertGreater(scale.epoch, now)
+        stored = Property.objects.get(pk=self.villas[0].pk).popularity
+        self.assertAlmostEqual(stored, 3, places=3)
+        self.assertAlmostEqual(popularity.current_score(stored), 3, places=3)
+        # far past the renormalization point a stale scale still gives a finite score
+        self.assertLess(popularity.current_score(1.0, now + timedelta(days=7 * 2000)), 1e-300)
+
+    def test_changing_the_half_life_keeps_current_scores(self):
+        popularity.bump({self.villas[0].pk: {'views': 8}})
+        with override_settings(POPULARITY_HALF_LIFE_DAYS=1):
+            popularity.bump({self.villas[1].pk: {'views': 8}})
+            self.assertEqual(PopularityScale.objects.get().half_life_days, 1)
+            first, second = (Property.objects.get(pk=v.pk).popularity for v in self.villas[:2])
+            self.assertAlmostEqual(popularity.current_score(first), 8, places=3)
+            self.assertAlmostEqual(popularity.current_score(second), 8, places=3)
+            # decay uses the new half-life from now on
+            self.assertAlmostEqual(popularity.current_score(first, timezone.now() + timedelta(days=1)), 4, places=3)
+
+    def test_saving_a_property_keeps_concurrent_bumps(self):
+        villa = Property.objects.get(pk=self.villas[0].pk)
+        popularity.bump({villa.pk: {'bookings': 1}})
+        villa.title = 'Renamed'
+        villa.save()
+        villa.refresh_from_db()
+        self.assertEqual(villa.title, 'Renamed')
+        self.assertAlmostEqual(popularity.current_score(villa.popularity), 10, places=3)
+
+
+@override_settings(ANALYTICS_CACHE=True)
+class FunnelReportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.agent = User.objects.create_user(email='agent@test.com', name='Agent', password='x', role='agent')
+        self.admin = User.objects.create_user(email='admin@test.com', name='Admin', password='x', role='admin')
+        self.mine = Property.objects.create(title='Mine', assigned_agent=self.agent)
+        self.other = Property.objects.create(title='Other')
+        # April 2025 is the requested range, March 2-31 the comparison period
+        DailyAnalytics.objects.bulk_create([
+            DailyAnalytics(property=self.mine, date=date(2025, 4, 10), views=200, downloads=20, bookings=4),
+            DailyAnalytics(property=self.mine, date=date(2025, 3, 10), views=100, downloads=10, bookings=4),
+            DailyAnalytics(property=self.other, date=date(2025, 4, 11), views=50, downloads=5, bookings=1),
+        ])
+        backfill_rollups()
+        self.params = {'start': '2025-04-01', 'end': '2025-04-30'}
+        self.client = APIClient()
+
+    def test_ratios_and_previous_period_deltas(self):
+        self.client.force_authenticate(user=self.admin)
+        resp = self.client.get('/api/villas/analytics/funnel/', self.params)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['previous_start_date'], date(2025, 3, 2))
+        portfolio = resp.data['portfolio']
+        self.assertEqual((portfolio['views'], portfolio['bookings']), (250, 5))
+        self.assertEqual(portfolio['view_to_booking'], 0.02)
+        self.assertEqual(portfolio['deltas']['views'], {'previous': 100, 'change': 150, 'change_pct': 150.0})
+
+        mine = resp.data['properties'][0]
+        self.assertEqual(mine['view_to_download'], 0.1)
+        self.assertEqual(mine['previous_view_to_booking'], 0.04)
+        self.assertEqual([a['id'] for a in resp.data['agents']], [self.agent.pk])
+        self.assertEqual(resp.data['agents'][0]['views'], 200)
+
+    def test_agents_only_see_their_properties_and_reports_are_cached(self):
+        self.client.force_authenticate(user=self.agent)
+        first = self.client.get('/api/villas/analytics/funnel/', {**self.params, 'agent': self.admin.pk})
+        self.assertEqual([p['id'] for p in first.data['properties']], [self.mine.pk])
+        self.assertNotIn('inquiries', first.data['portfolio'])
+
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/villas/analytics/funnel/', self.params)
+        self.assertEqual(first.data, second.data)
+
+    def test_customers_are_forbidden(self):
+        customer = User.objects.create_user(email='c@test.com', name='Customer', password='x')
+        self.client.force_authenticate(user=customer)
+        self.assertEqual(self.client.get('/api/villas/analytics/funnel/').status_code, 403)
+
+
+@override_settings(DASHBOARD_PUSH_INTERVAL=60)
+class LiveDashboardTests(TestCase):
+    def setUp(self):
+        # the in-memory channel layer is shared by the whole run
+        async_to_sync(get_channel_layer().flush)()
+        self.admin = User.objects.create_user(email='admin@test.com', name='Admin', password='x', role='admin')
+        self.customer = User.objects.create_user(email='c@test.com', name='Customer', password='x')
+
+    def _connect(self, user):
+        return WebsocketCommunicator(application, f'/ws/dashboard/?token={AccessToken.for_user(user)}')
+
+    def test_deltas_are_coalesced_into_one_push(self):
+        layer = get_channel_layer()
+        async_to_sync(layer.group_add)(live.GROUP, 'test.dashboard!1')
+        for _ in range(3):
+            live.record({'views': 1})
+        live.record({'inquiries': 1, 'downloads': 0})
+        live.flush()
+
+        message = async_to_sync(layer.receive)('test.dashboard!1')
+        self.assertEqual(message['counts'], {'views': 3, 'inquiries': 1})
+        live.flush()  # nothing pending: no push
+        live.record({'new_bookings': 1})
+        live.flush()
+        self.assertEqual(async_to_sync(layer.receive)('test.dashboard!1')['counts'], {'new_bookings': 1})
+
+    def test_push_slot_is_shared_between_processes(self):
+        layer = get_channel_layer()
+        async_to_sync(layer.group_add)(live.GROUP, 'test.dashboard!2')
+        cache.clear()
+        cache.add(live.SLOT_KEY, True, 60)  # another process pushed this interval
+        with mock.patch.object(live, '_schedule') as schedule:
+            live.record({'views': 2})
+            schedule.reset_mock()
+            live._tick()
+        schedule.assert_called_once_with(60)
+        self.assertEqual(live._pending, {'views': 2})
+
+        cache.delete(live.SLOT_KEY)
+        live._tick()
+        self.assertEqual(async_to_sync(layer.receive)('test.dashboard!2')['counts'], {'views': 2})
+        self.assertTrue(cache.get(live.SLOT_KEY))
+
+    async def test_staff_sockets_receive_pushed_deltas(self):
+        communicator = self._connect(self.admin)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await get_channel_layer().group_send(live.GROUP, {'type': 'dashboard.delta', 'counts': {'views': 3}})
+        self.assertEqual(await communicator.receive_json_from(), {'type': 'dashboard_delta', 'views': 3})
+        await communicator.disconnect()
+
+    async def test_customers_are_rejected(self):
+        connected, _ = await self._connect(self.customer).connect()
+        self.assertFalse(connected)
+
+
+@override_settings(ANALYTICS_BUFFER_INTERVAL=60, ANALYTICS_EVENTLOG_ENABLED=False)
+class AnalyticsBeaconTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        buffer._take()
+        self.villas = [Property.objects.create(title=f'Villa {i}') for i in range(2)]
+        self.client = APIClient()
+
+    def tearDown(self):
+        buffer._take()
+
+    def test_batches_are_validated_together_and_flushed_in_bulk(self):
+        events = [{'property': self.villas[i % 2].pk, 'event': 'impression'} for i in range(400)]
+        events += [
+            {'property': str(self.villas[0].pk), 'event': 'gallery_open'},
+            {'property': self.villas[1].pk, 'event': 'brochure_click'},
+            {'property': 999999, 'event': 'impression'},
+            {'property': self.villas[0].pk, 'event': 'purchase'},
+            'junk',
+        ]
+        with self.assertNumQueries(1):
+            resp = self.client.post('/api/villas/analytics/beacon/', {'events': events}, format='json')
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(resp.data, {'accepted': 402, 'rejected': 3})
+        self.assertFalse(DailyAnalytics.objects.exists())
+
+        self.assertEqual(buffer.flush(), 402)
+        today = timezone.now().date()
+        first = DailyAnalytics.objects.get(property=self.villas[0], date=today)
+        self.assertEqual((first.impressions, first.gallery_opens, first.views), (200, 1, 0))
+        self.assertEqual(DailyAnalytics.objects.get(property=self.villas[1], date=today).brochure_clicks, 1)
+        self.assertEqual(range_totals(today, today)['views'], 0)
+        self.assertEqual(AnalyticsRollup.objects.get(property=None, period='month').impressions, 400)
+
+    @override_settings(ANALYTICS_BUFFER_MAX_EVENTS=3)
+    def test_full_buffer_flushes_inline(self):
+        buffer.add([(self.villas[0].pk, 'impressions')] * 2)
+        self.assertFalse(DailyAnalytics.objects.exists())
+        buffer.add([(self.villas[0].pk, 'impressions')])
+        self.assertEqual(DailyAnalytics.objects.get().impressions, 3)
+
+    def test_rejects_oversized_batches_and_caps_each_client(self):
+        with override_settings(ANALYTICS_BEACON_MAX_EVENTS=2):
+            resp = self.client.post('/api/villas/analytics/beacon/', {'events': [{}] * 3}, format='json')
+        self.assertEqual(resp.status_code, 400)
+
+        cache.clear()  # forget the request above
+        with mock.patch.object(BeaconRateThrottle, 'rate', '2/min', create=True):
+            codes = [self.client.post('/api/villas/analytics/beacon/', {'events': []}, format='json').status_code for _ in range(3)]
+        self.assertEqual(codes, [202, 202, 429])
@@ -0,0 +1,13 @@
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class BeaconRateThrottle(SimpleRateThrottle):
+    """Per-client cap on analytics beacon posts: by user when logged in, else by IP."""
+    scope = "beacon"
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = f"user:{request.user.pk}"
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {"scope": self.scope, "ident": ident}
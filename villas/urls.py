@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import PropertyViewSet, BookingViewSet, get_property_availability, FavoriteViewSet, ReviewViewSet, property_downloaded, DeshboardViewApi, AnalyticsSummaryView
+from .views import PropertyViewSet, BookingViewSet, get_property_availability, FavoriteViewSet, ReviewViewSet, property_downloaded, DeshboardViewApi, AnalyticsSummaryView, PropertyAnalyticsSeriesView, TrendingPropertiesView, AnalyticsFunnelView, AnalyticsBeaconView
 
 
 router = DefaultRouter()
@@ -14,7 +14,11 @@ router.register(r'reviews', ReviewViewSet, basename='review')
 urlpatterns = [
     path('', include(router.urls)),
     path('dashboard/', DeshboardViewApi.as_view(), name='dashboard'),
+    path('trending/', TrendingPropertiesView.as_view(), name='trending-properties'),
     path('properties/<int:property_pk>/availability/', get_property_availability, name='property-availability'),
     path('properties/<int:pk>/downloaded/', property_downloaded, name='property-downloaded'),
     path("analytics/", AnalyticsSummaryView.as_view()),
+    path("analytics/properties/", PropertyAnalyticsSeriesView.as_view(), name='property-analytics-series'),
+    path("analytics/funnel/", AnalyticsFunnelView.as_view(), name='analytics-funnel'),
+    path("analytics/beacon/", AnalyticsBeaconView.as_view(), name='analytics-beacon'),
 ]
\ No newline at end of file
@@ -1,25 +1,118 @@
+import hashlib
+import hmac
+import re
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from django.conf import settings
 from django.utils import timezone
-from .models import DailyAnalytics
+from django.db import transaction
+from django.contrib.auth import get_user_model
+from .models import DailyAnalytics, Property
 from django.db import models
+from django.db.models.functions import Coalesce, TruncWeek
+from .rollups import ANALYTICS_FIELDS, apply_rollup_deltas, increment_counters, week_start
+from . import analytics_cache, buffer, hll, live, popularity
+from .visitors import apply_visitor_deltas
 
-def update_daily_analytics(property, field):
+
+def flush_analytics(deltas, visitors=None):
+    """
+    Write accumulated counters to DailyAnalytics and the rollups.
+    `deltas` maps (property_id, date) to {field: n}; `visitors` optionally maps
+    (property_id, date) to the visitor hashes seen, for the unique-visitor sketches.
+    """
+    visitors = visitors or {}
+    with transaction.atomic():
+        for (property_id, day), counts in deltas.items():
+            increment_counters(DailyAnalytics, {"property_id": property_id, "date": day}, counts)
+        apply_rollup_deltas(deltas)
+        apply_visitor_deltas(visitors)
+
+        events = defaultdict(Counter)
+        for (property_id, _), counts in deltas.items():
+            events[property_id].update(counts)
+        popularity.bump(events)
+
+        days = {day for _, day in deltas} | {day for _, day in visitors}
+        transaction.on_commit(lambda: analytics_cache.invalidate(days))
+
+        totals = sum(events.values(), Counter())
+        transaction.on_commit(lambda: live.record(totals))
+
+
+BOT_USER_AGENT = re.compile(r"bot|crawl|spider|slurp|preview|monitor", re.IGNORECASE)
+
+
+def visitor_hash(request):
+    """
+    64-bit visitor hash for unique-visitor counting: the user id when logged in,
+    otherwise a salted fingerprint of IP and user agent (raw values are never
+    stored). None for obvious bots.
+    """
+    agent = request.META.get("HTTP_USER_AGENT", "")
+    if BOT_USER_AGENT.search(agent):
+        return None
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return hll.hash_visitor(f"user:{user.pk}")
+
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "")
+    ip = forwarded.split(",")[0].strip() or request.META.get("REMOTE_ADDR", "")
+    fingerprint = hmac.new(settings.SECRET_KEY.encode(), f"{ip}|{agent}".encode(), hashlib.sha256).hexdigest()
+    return hll.hash_visitor(f"client:{fingerprint}")
+
+
+def update_daily_analytics(property, field, visitor=None):
+    """
+    Count one `field` event for `property`. The counter goes through the
+    in-process buffer and reaches DailyAnalytics, the rollups and (with
+    `visitor`) the unique-visitor sketches on the next flush; see villas.buffer.
+    """
+    if field not in ANALYTICS_FIELDS:
+        return
+
+    buffer.add([(property.pk, field)], visitor=visitor)
+
+
+def resolve_date_range(params):
+    """
+    Turn ?range=7d|30d|90d|month|6m|1y|year|<days> or ?start=&end= (YYYY-MM-DD)
+    into (range_type, start_date, end_date). Raises ValueError for bad dates,
+    for start after end and for day counts reaching before year 1.
+    """
     today = timezone.now().date()
 
-    analytics, created = DailyAnalytics.objects.get_or_create(
-        property=property,
-        date=today
-    )
+    start_param = params.get("start")
+    end_param = params.get("end")
+    range_type = params.get("range", "7d")
+
+    if start_param and end_param:
+        start_date, end_date = date.fromisoformat(start_param), date.fromisoformat(end_param)
+        if start_date > end_date:
+            raise ValueError("start must not be after end")
+        return range_type, start_date, end_date
 
-    # increment field
-    if field == "views":
-        analytics.views += 1
-    elif field == "bookings":
-        analytics.bookings += 1
-    elif field == "downloads":
-        analytics.downloads += 1
+    if range_type == "7d":
+        start_date = today - timedelta(days=7)
+    elif range_type == "30d":
+        start_date = today - timedelta(days=30)
+    elif range_type == "90d":
+        start_date = today - timedelta(days=90)
+    elif range_type == "month":
+        start_date = today.replace(day=1)
+    elif range_type == "6m":
+        start_date = today - timedelta(days=180)
+    elif range_type in ["1y", "year"]:
+        start_date = today - timedelta(days=365)
+    elif range_type.isdigit():
+        try:
+            start_date = today - timedelta(days=int(range_type))
+        except OverflowError:
+            raise ValueError(f"range of {range_type} days is out of bounds")
+    else:
+        start_date = today - timedelta(days=7)
 
-    analytics.save()
-    return analytics
+    return range_type, start_date, today
 
 
 def get_analytics_for_property(property, start_date, end_date):
@@ -34,15 +127,116 @@ def get_total_analytics_for_property(property, start_date, end_date):
         date__range=(start_date, end_date)
     )
 
-    total_views = analytics.aggregate(total_views=models.Sum('views'))['total_views'] or 0
-    total_bookings = analytics.aggregate(total_bookings=models.Sum('bookings'))['total_bookings'] or 0
-    total_downloads = analytics.aggregate(total_downloads=models.Sum('downloads'))['total_downloads'] or 0
+    totals = analytics.aggregate(
+        total_views=models.Sum('views'),
+        total_bookings=models.Sum('bookings'),
+        total_downloads=models.Sum('downloads'),
+    )
+
+    return {key: value or 0 for key, value in totals.items()}
+
+
+# longest span, in days, a series may cover per interval
+SERIES_MAX_DAYS = {"day": 366, "week": 3 * 366}
+
+
+def get_analytics_series(property_ids, start_date, end_date, interval="day"):
+    """
+    Zero-filled daily or weekly series plus totals for many properties, from a
+    single grouped query. Weekly buckets are labelled with their Monday and
+    only count days inside the range.
+
+    Returns {property_id: {"totals": {...}, "series": [{"date": ..., ...}]}}.
+    Raises ValueError when the range is longer than SERIES_MAX_DAYS[interval].
+    """
+    if (end_date - start_date).days + 1 > SERIES_MAX_DAYS[interval]:
+        raise ValueError(f"{interval} series cover at most {SERIES_MAX_DAYS[interval]} days")
+
+    if interval == "week":
+        bucket = TruncWeek("date")
+        first, step = week_start(start_date), timedelta(days=7)
+    else:
+        bucket = models.F("date")
+        first, step = start_date, timedelta(days=1)
+
+    buckets = []
+    while first <= end_date:
+        buckets.append(first)
+        first += step
+
+    rows = (
+        DailyAnalytics.objects.filter(
+            property_id__in=property_ids,
+            date__gte=start_date,
+            date__lte=end_date,
+        )
+        .annotate(bucket=bucket)
+        .values("property_id", "bucket")
+        .annotate(**{field: models.Sum(field) for field in ANALYTICS_FIELDS})
+    )
+    counts = {(row["property_id"], row["bucket"]): row for row in rows}
+
+    result = {}
+    for property_id in property_ids:
+        series = []
+        totals = dict.fromkeys(ANALYTICS_FIELDS, 0)
+        for day in buckets:
+            row = counts.get((property_id, day))
+            point = {"date": day}
+            for field in ANALYTICS_FIELDS:
+                point[field] = row[field] if row else 0
+                totals[field] += point[field]
+            series.append(point)
+        result[property_id] = {"totals": totals, "series": series}
+    return result
+
+def get_agent_analytics(start_date, end_date):
+    """
+    Per-agent property count and view/download/booking totals for the range.
+
+    Every figure is its own correlated subquery: joining properties and their
+    daily rows in one GROUP BY would multiply the property count by the number
+    of analytics rows.
+    """
+    User = get_user_model()
+
+    properties = (
+        Property.objects.filter(assigned_agent=models.OuterRef("pk"))
+        .order_by()
+        .values("assigned_agent")
+        .annotate(total=models.Count("id"))
+        .values("total")
+    )
+    analytics = (
+        DailyAnalytics.objects.filter(
+            property__assigned_agent=models.OuterRef("pk"),
+            date__gte=start_date,
+            date__lte=end_date,
+        )
+        .order_by()
+        .values("property__assigned_agent")
+    )
+
+    def total(subquery):
+        return Coalesce(
+            models.Subquery(subquery, output_field=models.IntegerField()),
+            models.Value(0),
+        )
 
-    return {
-        'total_views': total_views,
-        'total_bookings': total_bookings,
-        'total_downloads': total_downloads,
-    }
+    return (
+        User.objects.filter(role="agent")
+        .annotate(
+            total_properties=total(properties),
+            **{
+                f"total_{field}": total(analytics.annotate(total=models.Sum(field)).values("total"))
+                for field in ANALYTICS_FIELDS
+            },
+        )
+        .values(
+            "id", "name", "total_properties",
+            "total_views", "total_downloads", "total_bookings"
+        )
+    )
 
 from .models import Booking
 
@@ -73,4 +267,19 @@ def is_valid_date(date):
         datetime.strptime(str(date), "%Y-%m-%d")
         return True
     except ValueError:
-        return False
\ No newline at end of file
+        return False
+
+
+def queue_booking_confirmation(booking):
+    """Queue the guest's confirmation email; it is sent by the mailer outbox after commit."""
+    from mailer.outbox import queue_email
+
+    queue_email(
+        booking.email,
+        f"Your booking at {booking.property.title} is confirmed",
+        f"Hi {booking.full_name},\n\n"
+        f"Your stay at {booking.property.title} from {booking.check_in:%d %B %Y} "
+        f"to {booking.check_out:%d %B %Y} is confirmed.\n\n"
+        f"Booking reference: {booking.id}\n",
+        kind="booking_confirmation",
+    )
@@ -9,15 +9,19 @@ from datetime import datetime, timedelta, date
 from calendar import monthrange
 from django.db.models import Exists, OuterRef, F, Count, Avg, Sum, Q
 
-from .utils import update_daily_analytics, validate_date_range
+from .utils import queue_booking_confirmation, update_daily_analytics, validate_date_range, get_agent_analytics, get_analytics_series, resolve_date_range, visitor_hash
+from .visitors import unique_visitors
+from . import analytics_cache, buffer, dashboard, funnel, popularity
+from .throttles import BeaconRateThrottle
 
+from django.conf import settings
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from auditlog.registry import auditlog
 
 from .models import Property, Media, Booking, PropertyImage, BedroomImage, Review, ReviewImage, Favorite
-from .serializers import PropertySerializer , BookingSerializer, MediaSerializer, PropertyImageSerializer, BedroomImageSerializer, ReviewSerializer, ReviewImageSerializer, FavoriteSerializer
+from .serializers import PropertySerializer , TrendingPropertySerializer, BookingSerializer, MediaSerializer, PropertyImageSerializer, BedroomImageSerializer, ReviewSerializer, ReviewImageSerializer, FavoriteSerializer
 
 
 from accounts.permissions import IsAdminOrManager, IsAgentWithFullAccess, IsAssignedAgentReadOnly, IsOwnerOrAdminOrManager
@@ -32,7 +36,7 @@ class StandardResultsSetPagination(PageNumberPagination):
     max_page_size = 100
 
 
-from .filters import PropertyFilter
+from .filters import PropertyFilter, PropertyOrderingFilter
 from datetime import datetime
 
 from rest_framework.views import APIView
@@ -55,10 +59,10 @@ class PropertyViewSet(viewsets.ModelViewSet):
     serializer_class = PropertySerializer
     parser_classes = [MultiPartParser, FormParser]
     pagination_class = StandardResultsSetPagination
-    filter_backends = [SearchFilter, OrderingFilter]
+    filter_backends = [SearchFilter, PropertyOrderingFilter]
     filterset_class = PropertyFilter
     search_fields = ['^title', '^city', '^description', '^interior_amenities', '^outdoor_amenities']
-    ordering_fields = ['price', 'created_at', 'bedrooms', 'bathrooms']
+    ordering_fields = ['price', 'created_at', 'bedrooms', 'bathrooms', 'popularity']
     
 
     def get_queryset(self):
@@ -87,7 +91,7 @@ class PropertyViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(instance)
 
         # Update daily analytics for views
-        update_daily_analytics(instance, "views")
+        update_daily_analytics(instance, "views", visitor=visitor_hash(request))
 
         return Response(serializer.data)
 
@@ -259,6 +263,8 @@ class BookingViewSet(viewsets.ModelViewSet):
             else:
                 return Response({"error": "Invalid status"}, status=400)
             booking.save()
+            if booking.status == Booking.STATUS.Approved:
+                queue_booking_confirmation(booking)
 
         # return updated instance ONLY
         serializer = self.get_serializer(booking)
@@ -395,17 +401,9 @@ class FavoriteViewSet(viewsets.ModelViewSet):
 class DeshboardViewApi(APIView):
     permission_classes = [IsAdminUser]
     def get(self, request):
-        properties = Property.objects.all().count()
-        properties_active = Property.objects.filter(status='active').count()
-        reviews = Review.objects.all().count()
-        users = User.objects.filter(role='agent').count()
-
-        return Response({
-            "properties": properties,
-            "properties_active": properties_active,
-            "reviews": reviews,
-            "users": users
-        },status=status.HTTP_200_OK)
+        # the counters are kept current by villas.signals
+        counts, updated_at = dashboard.get_snapshot()
+        return Response(dashboard.as_response(counts, updated_at), status=status.HTTP_200_OK)
         
 
 from django.db.models import Sum, Count, Q
@@ -556,6 +554,7 @@ from django.db.models.functions import TruncMonth
 from django.db.models import Sum, Count
 from django.db.models.functions import TruncDay, TruncMonth
 from datetime import date, timedelta
+from .rollups import monthly_series, range_totals
 from django.utils.timezone import now
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -565,35 +564,15 @@ class AnalyticsSummaryView(APIView):
 
     def get(self, request):
 
-        today = now().date()
-
         # --- RANGE OR CUSTOM DATE ---
-        start_param = request.GET.get("start")
-        end_param = request.GET.get("end")
-        range_type = request.GET.get("range", "7d")
-
-        if start_param and end_param:
-            start_date = date.fromisoformat(start_param)
-            end_date = date.fromisoformat(end_param)
-        else:
-            if range_type == "7d":
-                start_date = today - timedelta(days=7)
-            elif range_type == "30d":
-                start_date = today - timedelta(days=30)
-            elif range_type == "90d":
-                start_date = today - timedelta(days=90)
-            elif range_type == "month":
-                start_date = today.replace(day=1)
-            elif range_type == "6m":
-                start_date = today - timedelta(days=180)
-            elif range_type in ["1y", "year"]:
-                start_date = today - timedelta(days=365)
-            elif range_type.isdigit():
-                start_date = today - timedelta(days=int(range_type))
-            else:
-                start_date = today - timedelta(days=7)
+        try:
+            range_type, start_date, end_date = resolve_date_range(request.GET)
+        except ValueError:
+            return Response({"error": "Use YYYY-MM-DD for start & end, with start on or before end"}, status=400)
 
-            end_date = today
+        cached = analytics_cache.get_summary("summary", range_type, start_date, end_date)
+        if cached is not None:
+            return Response(cached)
 
         range_days = (end_date - start_date).days
 
@@ -605,12 +584,8 @@ class AnalyticsSummaryView(APIView):
             date__gte=start_date, date__lte=end_date
         )
 
-        # --- TOTALS ---
-        totals = analytics_qs.aggregate(
-            total_views=Sum("views"),
-            total_downloads=Sum("downloads"),
-            total_bookings=Sum("bookings"),
-        )
+        # --- TOTALS (whole months/weeks come from the rollups) ---
+        totals = range_totals(start_date, end_date)
 
         total_inquiries = ContectUs.objects.filter(
             created_at__date__gte=start_date,
@@ -657,18 +632,8 @@ class AnalyticsSummaryView(APIView):
                 })
 
         else:
-            # MONTH-WISE
-            performance = (
-                analytics_qs
-                .annotate(month=TruncMonth("date"))
-                .values("month")
-                .annotate(
-                    total_views=Sum("views"),
-                    total_downloads=Sum("downloads"),
-                    total_bookings=Sum("bookings")
-                )
-                .order_by("month")
-            )
+            # MONTH-WISE (whole months from the monthly rollup)
+            performance = monthly_series(start_date, end_date)
 
             # inquiries month-wise
             inquiry_qs = (
@@ -683,49 +648,191 @@ class AnalyticsSummaryView(APIView):
 
             inquiry_map = {i["month"]: i["inquiries"] for i in inquiry_qs}
 
+            inquiry_map = {month.date(): count for month, count in inquiry_map.items()}
+
             performance_list = []
-            for p in performance:
-                label = p["month"].strftime("%b")  # Jan, Feb, Mar
+            for month, p in performance:
+                label = month.strftime("%b")  # Jan, Feb, Mar
                 performance_list.append({
                     "name": label,
-                    "views": p["total_views"] or 0,
-                    "downloads": p["total_downloads"] or 0,
-                    "bookings": p["total_bookings"] or 0,
-                    "inquiries": inquiry_map.get(p["month"], 0),
+                    "views": p["views"],
+                    "downloads": p["downloads"],
+                    "bookings": p["bookings"],
+                    "inquiries": inquiry_map.get(month, 0),
                 })
 
         # --- AGENT ANALYTICS ---
-        agents = (
-            User.objects.filter(role="agent")
-            .annotate(
-                total_properties=Count("assigned_villas"),
-                total_views=Sum("assigned_villas__daily_analytics__views"),
-                total_downloads=Sum("assigned_villas__daily_analytics__downloads"),
-                total_bookings=Sum("assigned_villas__daily_analytics__bookings"),
-            )
-            .values(
-                "id", "name", "total_properties",
-                "total_views", "total_downloads", "total_bookings"
-            )
-        )
+        agents = get_agent_analytics(start_date, end_date)
 
-        return Response({
+        summary = {
             "range": range_type,
             "start_date": start_date,
             "end_date": end_date,
 
             "totals": {
-                "views": totals["total_views"] or 0,
-                "downloads": totals["total_downloads"] or 0,
-                "bookings": totals["total_bookings"] or 0,
+                "views": totals["views"],
+                "downloads": totals["downloads"],
+                "bookings": totals["bookings"],
                 "inquiries": total_inquiries,
+                "unique_visitors": unique_visitors(start_date, end_date),
             },
 
             "performance": performance_list,
             "agents": list(agents),
+        }
+        analytics_cache.set_summary("summary", range_type, start_date, end_date, summary)
+
+        return Response(summary)
+
+
+
+class PropertyAnalyticsSeriesView(APIView):
+    """
+    Views/downloads/bookings series for many properties at once (sparklines).
+    Supports:
+    - ?properties=1,2,3 and/or ?agent=<id>
+    - ?interval=day | week
+    - ?range=... or ?start=YYYY-MM-DD&end=YYYY-MM-DD (same as AnalyticsSummaryView)
+    Agents only ever see their own assigned properties.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        user = request.user
+        if user.role not in ["admin", "manager", "agent"]:
+            return Response({"error": "You do not have permission to perform this action."}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            range_type, start_date, end_date = resolve_date_range(request.GET)
+        except ValueError:
+            return Response({"error": "Use YYYY-MM-DD for start & end, with start on or before end"}, status=status.HTTP_400_BAD_REQUEST)
+
+        interval = request.GET.get("interval", "day")
+        if interval not in ["day", "week"]:
+            return Response({"error": "interval must be day or week"}, status=status.HTTP_400_BAD_REQUEST)
+
+        properties = Property.objects.order_by("id")
+        if user.role == "agent":
+            properties = properties.filter(assigned_agent=user)
+
+        agent_param = request.GET.get("agent")
+        property_param = request.GET.get("properties")
+        try:
+            if agent_param:
+                properties = properties.filter(assigned_agent_id=int(agent_param))
+            if property_param:
+                properties = properties.filter(pk__in=[int(pk) for pk in property_param.split(",") if pk])
+        except ValueError:
+            return Response({"error": "agent and properties must be numeric ids"}, status=status.HTTP_400_BAD_REQUEST)
+
+        titles = dict(properties.values_list("id", "title"))
+        try:
+            series = get_analytics_series(list(titles), start_date, end_date, interval)
+        except ValueError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "range": range_type,
+            "start_date": start_date,
+            "end_date": end_date,
+            "interval": interval,
+            "properties": [
+                {"id": property_id, "title": title, **series[property_id]}
+                for property_id, title in titles.items()
+            ],
         })
 
 
+
+class AnalyticsFunnelView(APIView):
+    """
+    Impression -> view -> download -> booking funnel over a date range, with
+    conversion ratios and deltas against the previous period of the same length.
+    Supports ?range= / ?start=&end= plus ?agent=<id> and ?property=<id>.
+    Agents only see their own properties.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        user = request.user
+        if user.role not in ["admin", "manager", "agent"]:
+            return Response({"error": "You do not have permission to perform this action."}, status=status.HTTP_403_FORBIDDEN)
+
+        try:
+            range_type, start_date, end_date = resolve_date_range(request.GET)
+            agent_id = user.pk if user.role == "agent" else int(request.GET.get("agent") or 0) or None
+            property_id = int(request.GET.get("property") or 0) or None
+        except ValueError:
+            return Response({"error": "Use YYYY-MM-DD dates (start on or before end) and numeric agent/property ids"}, status=status.HTTP_400_BAD_REQUEST)
+
+        kind = f"funnel:agent={agent_id or 'all'}:property={property_id or 'all'}"
+        cached = analytics_cache.get_summary(kind, range_type, start_date, end_date)
+        if cached is not None:
+            return Response(cached)
+
+        properties = Property.objects.all()
+        if agent_id:
+            properties = properties.filter(assigned_agent_id=agent_id)
+        if property_id:
+            properties = properties.filter(pk=property_id)
+
+        report = funnel.build_report(start_date, end_date, properties, portfolio=not (agent_id or property_id))
+        report["range"] = range_type
+        analytics_cache.set_summary(kind, range_type, start_date, end_date, report, covers=(report["previous_start_date"], end_date))
+        return Response(report)
+
+
+class AnalyticsBeaconView(APIView):
+    """
+    Batched client-side analytics. POST {"events": [{"property": <id>,
+    "event": "impression" | "gallery_open" | "brochure_click"}, ...]}.
+    Events are validated together (one query for all property ids) and
+    counted in memory by villas.buffer, which writes them in batches.
+    Unknown events or properties are dropped and reported as rejected.
+    """
+    permission_classes = [AllowAny]
+    throttle_classes = [BeaconRateThrottle]
+
+    def post(self, request):
+        events = request.data.get("events") if isinstance(request.data, dict) else None
+        if not isinstance(events, list):
+            return Response({"error": "events must be a list"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(events) > settings.ANALYTICS_BEACON_MAX_EVENTS:
+            return Response({"error": f"At most {settings.ANALYTICS_BEACON_MAX_EVENTS} events per request"}, status=status.HTTP_400_BAD_REQUEST)
+
+        parsed = []
+        for event in events:
+            if not isinstance(event, dict):
+                continue
+            field = buffer.BEACON_EVENTS.get(event.get("event"))
+            property_id = event.get("property")
+            if isinstance(property_id, str) and property_id.isdigit():
+                property_id = int(property_id)
+            if field and isinstance(property_id, int) and not isinstance(property_id, bool):
+                parsed.append((property_id, field))
+
+        known = set(Property.objects.filter(pk__in={pk for pk, _ in parsed}).values_list("pk", flat=True)) if parsed else set()
+        accepted = [(pk, field) for pk, field in parsed if pk in known]
+        buffer.add(accepted)
+        return Response({"accepted": len(accepted), "rejected": len(events) - len(accepted)}, status=status.HTTP_202_ACCEPTED)
+
+
+class TrendingPropertiesView(APIView):
+    """Top-N published properties by decayed popularity (?limit=1..TRENDING_SIZE, default 10)."""
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        try:
+            limit = min(max(int(request.GET.get("limit", 10)), 1), popularity.TRENDING_SIZE)
+        except ValueError:
+            return Response({"error": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+
+        ids = popularity.trending_ids(limit)
+        properties = Property.objects.filter(pk__in=ids).prefetch_related("media_images", "bedrooms_images").in_bulk()
+        ranked = [properties[pk] for pk in ids if pk in properties]
+        return Response(TrendingPropertySerializer(ranked, many=True, context={"request": request}).data)
+
+
 auditlog.register(Property)
 auditlog.register(Media)
 auditlog.register(Booking)
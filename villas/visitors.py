@@ -0,0 +1,77 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+
+from . import hll
+from .models import VisitorSketch
+
+
+def _merge_into(lookup, hashes):
+    with transaction.atomic():
+        sketch = VisitorSketch.objects.select_for_update().filter(**lookup).first()
+        if sketch is None:
+            registers = hll.empty()
+            for hashed in hashes:
+                hll.add(registers, hashed)
+            try:
+                with transaction.atomic():
+                    VisitorSketch.objects.create(registers=bytes(registers), **lookup)
+                return
+            except IntegrityError:
+                # another writer created the sketch in the meantime
+                sketch = VisitorSketch.objects.select_for_update().get(**lookup)
+
+        registers = bytearray(sketch.registers)
+        changed = False
+        for hashed in hashes:
+            changed |= hll.add(registers, hashed)
+        # repeat visitors leave the registers untouched: skip the write
+        if changed:
+            sketch.registers = bytes(registers)
+            sketch.save(update_fields=["registers"])
+
+
+def apply_visitor_deltas(visitors):
+    """
+    Merge visitor hashes ({(property_id, date): iterable of 64-bit hashes})
+    into the per-property and portfolio-wide daily sketches.
+    """
+    scopes = defaultdict(set)
+    for (property_id, day), hashes in visitors.items():
+        scopes[(property_id, day)].update(hashes)
+        scopes[(None, day)].update(hashes)
+
+    for (property_id, day), hashes in scopes.items():
+        if hashes:
+            _merge_into({"property_id": property_id, "date": day}, hashes)
+
+
+def unique_visitors(start_date, end_date, property_id=None):
+    """Estimated distinct visitors over [start_date, end_date]."""
+    sketches = VisitorSketch.objects.filter(date__gte=start_date, date__lte=end_date)
+    if property_id is None:
+        sketches = sketches.filter(property__isnull=True)
+    else:
+        sketches = sketches.filter(property_id=property_id)
+
+    registers = list(sketches.values_list("registers", flat=True))
+    if not registers:
+        return 0
+    return hll.estimate(hll.merge(*registers))
+
+
+def build_sketches(sketches):
+    """
+    Unsaved VisitorSketch rows for replays, from per-property registers
+    ({(property_id, date): registers}) plus the merged portfolio-wide ones.
+    """
+    rows = []
+    by_day = defaultdict(list)
+    for (property_id, day), registers in sketches.items():
+        rows.append(VisitorSketch(property_id=property_id, date=day, registers=bytes(registers)))
+        by_day[day].append(registers)
+    rows += [
+        VisitorSketch(property_id=None, date=day, registers=bytes(hll.merge(*registers)))
+        for day, registers in by_day.items()
+    ]
+    return rows